@@ -1,79 +1,55 @@
 import streamlit as st
 import pandas as pd
-import json, base64, os, re, calendar, mimetypes, io
-from datetime import datetime, date
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+import json, base64, os, re, mimetypes, io, threading, hashlib, unicodedata
+from datetime import datetime, date, timedelta
+from PIL import Image
 from streamlit_image_coordinates import streamlit_image_coordinates
+from data_layer import storage, io_calls, SheetsBackend
+import profiler
+from profiler import timed
+from history_index import HistoryIndex
+from attendance_store import AttendanceStore
+from attendance_stats import AttendanceStats, month_label
+from leaderboard import Leaderboard
+import xp_events
+from archive import Archive, rotate as rotate_archive
+from att_calendar import att_calendar
+from thumbs import render_thumb, build_all as build_thumbs
+from render import compose_map, map_asset_paths, asset_mtimes, MAP_W, pixel_overlay_bar_image
+
+pixel_overlay_bar_image = timed("imagen")(pixel_overlay_bar_image)
 
 # ===== Finos (ajusta a gusto) =====
 LABEL_OFFSET_X = 0
 LABEL_OFFSET_Y = 0
 TIGHT_BELOW    = -8
 
-# ===== Paths locales (cuando NO se usa Sheets) =====
+# ===== Paths locales (las tablas se configuran en data_layer.py) =====
 ASSETS_DIR   = "assets"
 MAP_IMG      = os.path.join(ASSETS_DIR, "mi_mapa.png")
 AVATARS_DIR  = os.path.join(ASSETS_DIR, "avatars")
 TRINKETS_DIR = os.path.join(ASSETS_DIR, "trinkets")
 AUDIO_DIR    = os.path.join(ASSETS_DIR, "audio")
 BGM_FILE     = os.path.join(AUDIO_DIR, "DungeonSynth.mp3")  # <— tu pista
-STU_CSV      = "students.csv"
-LOG_CSV      = "logs.csv"
-OBS_CSV      = "observaciones.csv"
-ATT_CSV      = "asistencia.csv"
 MILESTONES_JSON = "milestones.json"
-COLEGIOS_CSV = "colegios.csv"
 
-# ===== Auto-switch a Google Sheets si hay secretos =====
-def _bool_secret(name, default=False):
-    try:
-        return bool(st.secrets.get(name, default))
-    except Exception:
-        return default
-
-USE_SHEETS = _bool_secret("USE_SHEETS", False)
-
-def _gs_client():
-    import gspread
-    from google.oauth2.service_account import Credentials
-    raw = st.secrets.get("GOOGLE_SERVICE_ACCOUNT_JSON", "")
-    if not raw:
-        raise RuntimeError("No hay GOOGLE_SERVICE_ACCOUNT_JSON en secrets.")
-    info = json.loads(raw)
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    creds = Credentials.from_service_account_info(info, scopes=scopes)
-    return gspread.authorize(creds)
-
-def _open_sheet(url):
-    gc = _gs_client()
-    return gc.open_by_url(url).sheet1
-
-def _sheet_to_df(url, expected_cols=None):
-    sh = _open_sheet(url)
-    rows = sh.get_all_records()
-    df = pd.DataFrame(rows)
-    if expected_cols:
-        for c in expected_cols:
-            if c not in df.columns:
-                df[c] = "" if c not in ["xp","colegio_id","xp_delta"] else 0
-        df = df[expected_cols]
-    return df
+def _setting(name, default=""):
+    """Entorno primero, después secrets."""
+    try: return os.getenv(name) or str(st.secrets.get(name, "") or "") or default
+    except Exception: return os.getenv(name, default)
 
-def _df_to_sheet(url, df: pd.DataFrame):
-    sh = _open_sheet(url)
-    sh.clear()
-    # gspread prefiere listas de listas
-    header = list(df.columns)
-    values = [header] + df.astype(str).values.tolist()
-    sh.update(values)
+# XP_SOURCE = "logs": el XP sale del historial (foto + logs posteriores, ver xp_events.py) y students.xp
+# queda como copia; se toma una foto nueva cuando hay más de XP_SNAPSHOT_EVERY logs por reproducir
+XP_SOURCE = _setting("XP_SOURCE")
+XP_FROM_LOGS = XP_SOURCE.strip().lower() == "logs"
+XP_SNAPSHOT_EVERY = 20_000
 
-SHEET_STUDENTS_URL = st.secrets.get("SHEET_STUDENTS_URL", "")
-SHEET_LOGS_URL     = st.secrets.get("SHEET_LOGS_URL", "")
-SHEET_OBS_URL      = st.secrets.get("SHEET_OBS_URL", "")
-SHEET_ATT_URL      = st.secrets.get("SHEET_ATT_URL", "")
+# Archivo del historial (archive.py): con ARCHIVE_HORIZON_DAYS > 0 los logs y observaciones más viejos
+# pasan una vez al día a ARCHIVE_DIR (debe ser un disco que persista entre despliegues)
+ARCHIVE_DIR = _setting("ARCHIVE_DIR", "archive")
+try: ARCHIVE_HORIZON_DAYS = int(_setting("ARCHIVE_HORIZON_DAYS", "0"))
+except ValueError: ARCHIVE_HORIZON_DAYS = 0
 
 # ===== Utils =====
 def do_rerun():
@@ -108,6 +84,11 @@ def get_qp():
     except Exception:
         return st.experimental_get_query_params()
 
+def qp_first(qp, name, default=""):
+    """Primer valor de un parámetro (st.query_params da str; la API experimental, listas)."""
+    v = qp.get(name, default)
+    return (v[0] if v else default) if isinstance(v, list) else v
+
 def set_qp(**kwargs):
     try:
         st.query_params.update(kwargs)
@@ -134,33 +115,48 @@ def discover_trinkets():
 AVATAR_OPTIONS  = discover_avatars()
 TRINKET_OPTIONS = discover_trinkets()
 
-def avatar_path_for(student_row):
+# Miniaturas (assets/.thumbs) a los tamaños de las vistas; se generan en segundo plano al arrancar
+@st.cache_resource
+def _warm_thumbs():
+    t = threading.Thread(target=build_thumbs, daemon=True, name="thumbs")
+    t.start()
+    return t
+
+@timed("imagen")
+def _thumb_or_original(path, size):
+    if not size: return path
+    try: return render_thumb(path, size)
+    except Exception: return path
+
+def avatar_path_for(student_row, size=None):
     fname = (student_row.get("avatar","") if isinstance(student_row, dict) else getattr(student_row, "avatar", ""))
     fname = (fname or "").strip()
     if not fname: return None
     path = os.path.join(AVATARS_DIR, fname)
-    return path if os.path.isfile(path) else None
+    return _thumb_or_original(path, size) if os.path.isfile(path) else None
 
-def trinket_path_for(student_row):
+def trinket_path_for(student_row, size=None):
     fname = (student_row.get("trinket","") if isinstance(student_row, dict) else getattr(student_row, "trinket", ""))
     fname = (fname or "").strip()
     if not fname: return None
     path = os.path.join(TRINKETS_DIR, fname)
-    return path if os.path.isfile(path) else None
+    return _thumb_or_original(path, size) if os.path.isfile(path) else None
 
 def render_trinket_with_tooltip(student_row, width_px=64):
-    tpath = trinket_path_for(student_row)
+    tpath = trinket_path_for(student_row, size=width_px)
     if not tpath: return
     tip = (student_row.get("trinket_desc","") if isinstance(student_row, dict) else getattr(student_row, "trinket_desc", "")) or ""
     mt, _ = mimetypes.guess_type(tpath)
     if not mt: mt="image/png"
     try:
-        with open(tpath, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode("utf-8")
+        src = static_asset_url(tpath)
+        if not src:
+            b64 = base64.b64encode(_file_bytes(tpath, os.stat(tpath).st_mtime_ns)).decode("utf-8")
+            src = f"data:{mt};base64,{b64}"
         st.markdown(
             f"""
             <div class="trinket-wrap" title="{tip.replace('"','&quot;')}">
-              <img class="trinket-img" style="width:{width_px}px;height:auto" src="data:{mt};base64,{b64}" alt="trinket"/>
+              <img class="trinket-img" style="width:{width_px}px;height:auto" src="{src}" alt="trinket"/>
               <div class="trinket-cap">Trinket</div>
             </div>
             """, unsafe_allow_html=True
@@ -168,35 +164,21 @@ def render_trinket_with_tooltip(student_row, width_px=64):
     except:
         st.image(Image.new("RGBA",(width_px,width_px),(80,80,100,255)), width=width_px, caption="Trinket")
 
-# ===== Data IO  (CSV por defecto / Sheets si hay secrets) =====
-@st.cache_data
-def load_students_csv():
-    if not os.path.exists(STU_CSV):
-        pd.DataFrame(columns=[
-            "id","name","grupo","xp","colegio_id","phone","teacher","xp_delta","xp_reason","avatar",
-            "trinket","trinket_desc"
-        ]).to_csv(STU_CSV, index=False)
-    df = pd.read_csv(STU_CSV)
-    for col in ["id","name","grupo","xp","colegio_id","phone","teacher","xp_delta","xp_reason","avatar","trinket","trinket_desc"]:
-        if col not in df.columns:
-            df[col] = "" if col in ["name","grupo","phone","teacher","xp_reason","avatar","trinket","trinket_desc"] else 0
-    df["xp"] = pd.to_numeric(df["xp"], errors="coerce").fillna(0).astype(int)
-    df["colegio_id"] = pd.to_numeric(df["colegio_id"], errors="coerce").fillna(1).astype(int)
-    df["xp_delta"]   = pd.to_numeric(df["xp_delta"], errors="coerce").fillna(0).astype(int)
-    for c in ["name","grupo","phone","teacher","xp_reason","avatar","trinket","trinket_desc"]:
-        df[c] = df[c].fillna("").astype(str)
+# ===== Data IO (data_layer.storage(): CSV, SQLite o Sheets, con caché por tabla) =====
+@timed("datos")
+def load_students():
+    df = storage().read("students")
+    if XP_FROM_LOGS:
+        df["xp"] = df["id"].map(derived_xp()).fillna(0).astype(int)
     return df
 
-def save_students_csv(df):
-    for col in ["phone","teacher","xp_reason","name","grupo","avatar","trinket","trinket_desc"]:
-        if col in df.columns:
-            df[col] = df[col].fillna("").astype(str)
-    for col in ["xp","colegio_id","xp_delta"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
-    df.to_csv(STU_CSV, index=False)
-    load_students_csv.clear()
+@timed("datos")
+def save_students(df):
+    ver = storage().version("students")
+    storage().save("students", df)
+    _board_after_write("students", ver, lambda b: b.update_students(df))
 
+@timed("datos")
 @st.cache_data
 def load_milestones():
     if not os.path.exists(MILESTONES_JSON):
@@ -214,157 +196,389 @@ def load_milestones():
     data["milestones"]=sorted(data["milestones"],key=lambda m:m["threshold"])
     return data
 
-@st.cache_data
+@timed("datos")
 def load_colegios():
-    if not os.path.exists(COLEGIOS_CSV):
-        pd.DataFrame([{"id":1,"nombre":"COLEGIO","x":100,"y":100,"icono":"assets/castle1.png"}]).to_csv(COLEGIOS_CSV,index=False)
-    return pd.read_csv(COLEGIOS_CSV)
+    return storage().read("colegios")
 
+@timed("datos")
 def save_colegios(df):
-    df.to_csv(COLEGIOS_CSV, index=False); load_colegios.clear()
-
-# Logs
+    storage().save("colegios", df); _map_cache().clear()
+
+# Mapa compuesto por proceso: clave = hash del contenido de colegios + mtimes de los assets
+@st.cache_resource
+def _map_cache():
+    return {}
+
+@timed("imagen")
+def composed_map(colegios_df):
+    key = (hashlib.sha1(pd.util.hash_pandas_object(colegios_df, index=False).values.tobytes()).hexdigest(),
+           asset_mtimes(map_asset_paths(MAP_IMG, colegios_df)))
+    cache = _map_cache()
+    hit = cache.get(key)
+    profiler.cache("mapa", hit is not None)
+    if hit is None:
+        hit = compose_map(MAP_IMG, colegios_df)
+        cache.clear(); cache[key] = hit
+    return hit
+
+# Índice por colegio para la lista paginada: ids ordenados por XP + clave de búsqueda + grupos.
+# Clave = hash de las columnas que lo definen; se reconstruye sólo cuando cambian.
+ROSTER_COLS = ["id","name","grupo","xp","colegio_id"]
+PAGE_SIZES  = [12, 24, 48]
+
+@st.cache_resource
+def _roster_cache():
+    return {}
+
+def _fold(s: str) -> str:
+    """minúsculas y sin tildes, para buscar 'Jose' y encontrar 'José'"""
+    return unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii").lower()
+
+@timed("cálculo")
+def colegio_index(students_df):
+    cols = [c for c in ROSTER_COLS if c in students_df.columns]
+    key = hashlib.sha1(pd.util.hash_pandas_object(students_df[cols], index=False).values.tobytes()).hexdigest()
+    cache = _roster_cache()
+    hit = cache.get(key)
+    profiler.cache("índice colegio", hit is not None)
+    if hit is None:
+        df = students_df[cols].sort_values("xp", ascending=False, kind="stable")
+        df = df.assign(q=df["name"].map(_fold), grupo=df["grupo"].astype(str))
+        hit = {int(cid): {"rows": g[["id","grupo","q"]].reset_index(drop=True),
+                          "grupos": sorted(x for x in g["grupo"].unique() if x)}
+               for cid, g in df.groupby("colegio_id", sort=False)}
+        cache.clear(); cache[key] = hit
+    return hit
+
+@timed("cálculo")
+def colegio_page(index, cid, grupo=None, query="", page=0, per_page=PAGE_SIZES[0]):
+    """Ids de la página pedida (orden XP desc) y total filtrado; sólo se tocan los arrays del índice."""
+    ent = index.get(int(cid))
+    if ent is None: return [], 0
+    rows = ent["rows"]
+    mask = pd.Series(True, index=rows.index)
+    if grupo: mask &= rows["grupo"] == grupo
+    q = _fold(query).strip()
+    if q: mask &= rows["q"].str.contains(q, regex=False)
+    ids = rows["id"][mask].to_numpy()
+    start = page * per_page
+    return [int(i) for i in ids[start:start + per_page]], len(ids)
+
+# Índice id -> filas por tabla de historial; se reconstruye sólo si cambia la versión de los datos
+@st.cache_resource
+def _hist_store():
+    return {"lock": threading.Lock()}
+
+def _hist_source(kind):
+    if kind == "logs": return "logs", load_logs_df
+    return "observaciones", load_obs_df
+
+def _hist_index(kind):
+    table, loader = _hist_source(kind)
+    store = _hist_store()
+    ver = storage().version(table)
+    with store["lock"]:
+        ix = store.get(kind)
+        stale = ix is None or ver is None or ix.version != ver
+        profiler.cache(f"historial {kind}", not stale)
+        if stale:
+            ix = HistoryIndex(loader(), ver)
+            store[kind] = ix
+        return ix
+
+def _hist_after_write(kind, ver_before, apply):
+    """Actualiza el índice en memoria tras una escritura propia; si alguien más escribió, se descarta."""
+    table, _ = _hist_source(kind)
+    store = _hist_store()
+    with store["lock"]:
+        ix = store.get(kind)
+        if ix is None: return
+        if ver_before is None or ix.version != ver_before:
+            store.pop(kind, None); return
+        apply(ix)
+        ix.version = storage().version(table)
+
+@timed("datos")
 def load_logs_df():
-    if USE_SHEETS and SHEET_LOGS_URL:
-        return _sheet_to_df(SHEET_LOGS_URL, expected_cols=["timestamp","id","name","delta_xp","reason"])
-    if not os.path.exists(LOG_CSV):
-        return pd.DataFrame(columns=["timestamp","id","name","delta_xp","reason"])
-    df = pd.read_csv(LOG_CSV)
-    for c in ["reason","name"]:
-        if c in df.columns: df[c]=df[c].fillna("").astype(str)
-    return df
+    return storage().read("logs")
 
+@timed("datos")
 def save_logs_df(df):
-    if USE_SHEETS and SHEET_LOGS_URL:
-        _df_to_sheet(SHEET_LOGS_URL, df)
-    else:
-        df.to_csv(LOG_CSV, index=False)
+    storage().save("logs", df)
+
+@timed("datos")
+def append_logs(rows):
+    # Solo agrega: el costo no depende del tamaño del historial
+    ver = storage().version("logs")
+    storage().append("logs", rows)
+    _hist_after_write("logs", ver, lambda ix: ix.append(rows))
+    _board_after_write("logs", ver, lambda b: b.add_logs(rows))
+    if XP_FROM_LOGS: _xp_after_write(ver, rows)
 
 def append_log(row_id,name,delta,reason):
-    df = load_logs_df()
     new_row = {"timestamp":now_iso(),"id":int(row_id),"name":name,"delta_xp":int(delta),"reason":(reason or "")}
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    save_logs_df(df)
+    append_logs([new_row])
+
+# ===== Lote de XP: un guardado de estudiantes + un append de logs =====
+def build_xp_batch(base, edit):
+    """Aplica el grid editado sobre `base`. Devuelve (estudiantes_nuevos, filas_de_log)."""
+    base = base.copy()
+    edit = edit.copy()
+    edit["id"] = pd.to_numeric(edit["id"], errors="coerce")
+    edit = edit[edit["id"].notna()]
+    edit["id"] = edit["id"].astype(int)
+    edit = edit[edit["id"].isin(base["id"])].drop_duplicates("id", keep="last")
+    edit["xp_delta"] = pd.to_numeric(edit["xp_delta"], errors="coerce").fillna(0).astype(int)
+    edit["xp_reason"] = edit["xp_reason"].fillna("").astype(str).str.strip()
+    upd = edit.set_index("id")
+    hit = base["id"].isin(upd.index)
+    for c in ["name","grupo","colegio_id","phone","teacher","avatar","trinket","trinket_desc"]:
+        if c in upd.columns:
+            base.loc[hit, c] = base.loc[hit, "id"].map(upd[c]).values
+    deltas = base["id"].map(upd["xp_delta"]).fillna(0).astype(int)
+    base["xp"] = pd.to_numeric(base["xp"], errors="coerce").fillna(0).astype(int) + deltas
+    base["xp_delta"] = 0
+    base["xp_reason"] = base["xp_reason"].fillna("").astype(str)
+    names = base.drop_duplicates("id").set_index("id")["name"]
+    ts = now_iso()
+    log_rows = [{"timestamp":ts,"id":int(i),"name":names.get(i,""),"delta_xp":int(r["xp_delta"]),"reason":r["xp_reason"]}
+                for i, r in upd[upd["xp_delta"]!=0].iterrows()]
+    return base, log_rows
+
+@timed("datos")
+def commit_xp_batch(new_students, log_rows, prev_students):
+    """Todo o nada: si el append de logs falla se restauran los estudiantes. Devuelve nº de llamadas al backend."""
+    before = io_calls()
+    save_students(new_students)
+    try:
+        append_logs(log_rows)
+    except Exception:
+        save_students(prev_students)
+        raise
+    return io_calls() - before
 
+@timed("consulta")
 def recent_logs_for(student_id, limit=12):
-    df = load_logs_df()
-    df = df[df["id"]==student_id].sort_values("timestamp", ascending=False).head(limit).copy()
+    df = _hist_index("logs").rows_for(student_id, limit)
     try: df["timestamp"]=pd.to_datetime(df["timestamp"]).dt.strftime("%Y-%m-%d %H:%M")
     except: pass
     df.rename(columns={"timestamp":"Fecha/Hora","delta_xp":"Δ XP","reason":"Motivo"}, inplace=True)
     df["Motivo"]=df["Motivo"].fillna("").astype(str)
     return df
 
+@timed("consulta")
 def all_logs_for(student_id):
-    df=load_logs_df()
-    df=df[df["id"]==student_id].sort_values("timestamp", ascending=False).copy()
+    df=_hist_index("logs").rows_for(student_id)
     df["reason"]=df["reason"].fillna("").astype(str)
     return df
 
+def _delete_hist_rows(kind, saver, student_id, timestamps):
+    ix=_hist_index(kind)
+    ver=ix.version
+    mine=ix.rows_for(student_id)
+    drop=mine.index[mine["timestamp"].astype(str).isin({str(t) for t in timestamps})]
+    if len(drop)==0: return 0
+    table=_hist_source(kind)[0]
+    if storage().row_level(table):
+        # borrado por fila en el backend, sin reescribir la tabla
+        storage().delete(table, {"id": int(student_id), "timestamp": [str(t) for t in timestamps]})
+    else:
+        saver(ix.frame().drop(index=drop))
+    _hist_after_write(kind, ver, lambda i: i.delete(student_id, timestamps))
+    if kind == "logs":
+        removed = mine.loc[drop].to_dict("records")
+        _board_after_write("logs", ver, lambda b: b.add_logs(removed, sign=-1))
+        if XP_FROM_LOGS: _xp_after_write(ver, removed, sign=-1)
+    return len(drop)
+
 def delete_logs_for(student_id, timestamps):
-    df=load_logs_df()
-    before=len(df)
-    keep_mask = ~((df["id"]==student_id) & (df["timestamp"].isin(list(timestamps))))
-    df=df[keep_mask]
-    save_logs_df(df)
-    return before - len(df)
+    return _delete_hist_rows("logs", save_logs_df, student_id, timestamps)
+
+# XP derivado del historial (XP_SOURCE = "logs"): id -> XP, por versión de logs y de la foto
+@st.cache_resource
+def _xp_holder():
+    return {"lock": threading.Lock(), "xp": None, "versions": None}
+
+@timed("cálculo")
+def derived_xp() -> dict:
+    h = _xp_holder()
+    vers = (storage().version("logs"), storage().version("xp_snapshots"))
+    with h["lock"]:
+        stale = h["xp"] is None or None in vers or h["versions"] != vers
+        profiler.cache("xp derivado", not stale)
+        if stale:
+            ix = _hist_index("logs")
+            logs = ix.frame()
+            xp, replayed = xp_events.replay(logs, storage().read("xp_snapshots"), ordered=ix.ordered)
+            if replayed > XP_SNAPSHOT_EVERY:
+                storage().save("xp_snapshots", xp_events.take_snapshot(logs, base=storage().read("xp_snapshots")))
+                vers = (vers[0], storage().version("xp_snapshots"))
+            h["xp"], h["versions"] = xp.to_dict(), vers
+        return h["xp"]
+
+def _xp_after_write(ver_before, rows, sign=1):
+    """Logs propios agregados (o borrados, sign=-1): suma al XP derivado y corrige la foto si el borrado la toca."""
+    snap_ver = storage().version("xp_snapshots")
+    if sign < 0:
+        fixed = xp_events.unsnap(storage().read("xp_snapshots"), rows)
+        if fixed is not None: storage().save("xp_snapshots", fixed)
+    h = _xp_holder()
+    with h["lock"]:
+        if h["xp"] is None: return
+        if ver_before is None or h["versions"] != (ver_before, snap_ver):
+            h["xp"] = None; return
+        for r in rows:
+            try: sid = int(r["id"]); delta = int(r.get("delta_xp", 0) or 0)
+            except (KeyError, TypeError, ValueError): continue
+            h["xp"][sid] = h["xp"].get(sid, 0) + sign * delta
+        h["versions"] = (storage().version("logs"), storage().version("xp_snapshots"))
 
 # Observaciones
+@timed("datos")
 def load_obs_df():
-    if USE_SHEETS and SHEET_OBS_URL:
-        return _sheet_to_df(SHEET_OBS_URL, expected_cols=["timestamp","id","name","observacion"])
-    if not os.path.exists(OBS_CSV):
-        return pd.DataFrame(columns=["timestamp","id","name","observacion"])
-    df = pd.read_csv(OBS_CSV)
-    df["observacion"]=df["observacion"].fillna("").astype(str)
-    return df
+    return storage().read("observaciones")
 
+@timed("datos")
 def save_obs_df(df):
-    if USE_SHEETS and SHEET_OBS_URL:
-        _df_to_sheet(SHEET_OBS_URL, df)
-    else:
-        df.to_csv(OBS_CSV, index=False)
+    storage().save("observaciones", df)
 
+@timed("datos")
 def append_observation(student_id, name, text):
-    df=load_obs_df()
     new_row={"timestamp":now_iso(),"id":int(student_id),"name":name,"observacion":(text or "")}
-    df=pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    save_obs_df(df)
+    ver = storage().version("observaciones")
+    storage().append("observaciones", [new_row])
+    _hist_after_write("obs", ver, lambda ix: ix.append([new_row]))
 
+@timed("consulta")
 def observations_for(student_id, limit=20):
-    df=load_obs_df()
-    df=(df[df["id"]==student_id].sort_values("timestamp", ascending=False)
-        .loc[:,["timestamp","observacion"]].head(limit).copy())
+    df=_hist_index("obs").rows_for(student_id, limit).loc[:,["timestamp","observacion"]]
     try: df["timestamp"]=pd.to_datetime(df["timestamp"]).dt.strftime("%Y-%m-%d %H:%M")
     except: pass
     df.rename(columns={"timestamp":"Fecha/Hora","observacion":"Observación"}, inplace=True)
     df["Observación"]=df["Observación"].fillna("").astype(str)
     return df
 
+@timed("consulta")
 def all_observations_for(student_id):
-    df=load_obs_df()
-    df=df[df["id"]==student_id].sort_values("timestamp", ascending=False).copy()
+    df=_hist_index("obs").rows_for(student_id)
     df["observacion"]=df["observacion"].fillna("").astype(str)
     return df
 
 def delete_observations_for(student_id, timestamps):
-    df=load_obs_df()
-    before=len(df)
-    keep_mask = ~((df["id"]==student_id) & (df["timestamp"].isin(list(timestamps))))
-    df=df[keep_mask]
-    save_obs_df(df)
-    return before-len(df)
+    return _delete_hist_rows("obs", save_obs_df, student_id, timestamps)
+
+# Historial archivado: sólo se abre cuando se piden periodos viejos
+@st.cache_resource
+def archive_store():
+    return Archive(ARCHIVE_DIR)
+
+@st.cache_resource
+def _rotation_holder():
+    return {"lock": threading.Lock(), "day": None, "moved": {}, "error": ""}
+
+def rotate_if_due():
+    """Una vez al día por proceso; si otra sesión ya está rotando, no se espera."""
+    h = _rotation_holder()
+    today = date.today().isoformat()
+    if ARCHIVE_HORIZON_DAYS <= 0 or h["day"] == today or not h["lock"].acquire(blocking=False): return
+    try:
+        if h["day"] == today: return
+        for table in ("logs", "observaciones"):
+            n = rotate_archive(storage(), archive_store(), table, ARCHIVE_HORIZON_DAYS)
+            h["moved"][table] = h["moved"].get(table, 0) + n
+        h["day"], h["error"] = today, ""
+    except Exception as e:
+        h["day"], h["error"] = today, f"{type(e).__name__}: {e}"
+    finally:
+        h["lock"].release()
+
+def archive_terms(kind, student_id):
+    return archive_store().terms(_hist_source(kind)[0], student_id)
+
+@timed("consulta")
+def archived_for(kind, student_id, terms):
+    return archive_store().read_student(_hist_source(kind)[0], student_id, terms)
 
 # Asistencia
+@timed("datos")
 def load_att_df():
-    if USE_SHEETS and SHEET_ATT_URL:
-        return _sheet_to_df(SHEET_ATT_URL, expected_cols=["id","date","status"])
-    if not os.path.exists(ATT_CSV):
-        pd.DataFrame(columns=["id","date","status"]).to_csv(ATT_CSV, index=False)
-    return pd.read_csv(ATT_CSV)
+    return storage().read("attendance")
 
+@timed("datos")
 def save_att_df(df):
-    if USE_SHEETS and SHEET_ATT_URL:
-        _df_to_sheet(SHEET_ATT_URL, df)
-    else:
-        df.to_csv(ATT_CSV, index=False)
+    storage().save("attendance", df)
 
 ATT_STATES = {None:"◻️","P":"✅","T":"🟧","A":"❌"}
 MONTHS_ES  = ["Enero","Febrero","Marzo","Abril","Mayo","Junio","Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"]
 
-def set_attendance(student_id:int, y:int, m:int, d:int, status:str|None):
-    df = load_att_df()
-    day = date(y,m,d).isoformat()
-    mask = (df.get("id",0).astype(int)==int(student_id)) & (df.get("date","")==day)
-    if status in (None,""):
-        df = df[~mask]
-    else:
-        if mask.any():
-            df.loc[mask,"status"]=status
+# Asistencia en memoria empaquetada (2 bits/día); se reconstruye sólo si cambia la versión de la tabla
+@st.cache_resource
+def _att_holder():
+    return {"lock": threading.Lock(), "store": None, "version": None}
+
+def _att_store():
+    h = _att_holder()
+    ver = storage().version("attendance")
+    with h["lock"]:
+        stale = h["store"] is None or ver is None or h["version"] != ver
+        profiler.cache("asistencia", not stale)
+        if stale:
+            h["store"] = AttendanceStore.from_frame(load_att_df())
+            h["version"] = ver
+        return h["store"]
+
+@timed("datos")
+def set_attendance_batch(student_id:int, changes:dict)->int:
+    """Aplica {date: estado} de un estudiante con una sola escritura. Devuelve cuántos días cambiaron."""
+    store = _att_store()
+    h = _att_holder(); ver = h["version"]
+    undo, rows, cleared, rewrite = [], [], [], False
+    done = []                                   # (día, antes, después) para los agregados
+    for day, status in sorted(changes.items()):
+        status = status if status in ("P","T","A") else None
+        had_raw = store.has_raw_row(student_id, day)
+        prev = store.set(student_id, day, status)
+        if prev == status and not had_raw: continue
+        undo.append((day, prev)); done.append((day, prev, status))
+        if status is None: cleared.append(day)
+        else: rows.append({"id":int(student_id),"date":day.isoformat(),"status":status})
+        rewrite = rewrite or prev is not None or had_raw
+    if not undo: return 0
+    try:
+        if storage().row_level("attendance"):
+            # UPSERT + DELETE de las filas tocadas, en una transacción
+            storage().save_rows("attendance", rows, delete_keys=[(int(student_id), d.isoformat()) for d in cleared])
+        elif not rewrite:
+            # sólo marcas nuevas: basta con agregar filas
+            storage().append("attendance", rows)
         else:
-            df = pd.concat([df, pd.DataFrame([{"id":student_id,"date":day,"status":status}])], ignore_index=True)
-    save_att_df(df)
+            save_att_df(store.to_frame())
+    except Exception:
+        for day, prev in reversed(undo): store.set(student_id, day, prev)
+        raise
+    with h["lock"]:
+        if ver is not None and h["version"] == ver:
+            h["version"] = storage().version("attendance")
+        else:
+            h["store"] = None
+    _att_stats_after_write(ver, student_id, done)
+    return len(undo)
+
+def set_attendance(student_id:int, y:int, m:int, d:int, status:str|None):
+    set_attendance_batch(student_id, {date(y,m,d): status})
 
+@timed("consulta")
 def att_map_for_month(student_id:int, y:int, m:int)->dict:
-    df=load_att_df()
-    df["id"]=pd.to_numeric(df.get("id",0), errors="coerce").fillna(0).astype(int)
-    pref=f"{y:04d}-{m:02d}-"
-    sub=df[(df["id"]==student_id) & (df["date"].astype(str).str.startswith(pref))]
-    mapp={}
-    for _,r in sub.iterrows():
-        try:
-            d=int(str(r["date"]).split("-")[-1])
-            stt=r.get("status",None)
-            mapp[d] = (stt if stt in ("P","T","A") else None)
-        except: pass
-    return mapp
+    return _att_store().month_map(student_id, y, m)
 
 def cycle_state(cur: str|None)->str|None:
     order=[None,"P","T","A"]
     i=order.index(cur) if cur in order else 0
     return order[(i+1)%len(order)]
 
+@timed("componente")
 def render_mini_calendar(student_id:int, holder, disabled=False):
+    """Un solo componente por mes: los clics se acumulan en el navegador y llegan como un diff."""
     with holder:
         key_y=f"cal_y_{student_id}"
         key_m=f"cal_m_{student_id}"
@@ -374,63 +588,105 @@ def render_mini_calendar(student_id:int, holder, disabled=False):
             st.session_state[key_m]=today.month
         y=st.session_state[key_y]; m=st.session_state[key_m]
 
-        cprev, ctitle, cnext = st.columns([0.5,3.2,0.5])
-        with cprev:
-            if st.button("◀", key=f"prev_{student_id}_{y}_{m}", disabled=disabled):
-                nm=m-1; ny=y
+        order=[None]
+        while cycle_state(order[-1]) is not None: order.append(cycle_state(order[-1]))
+        ev = att_calendar(y, m, att_map_for_month(student_id, y, m), order, [ATT_STATES[s] for s in order],
+                          f"{MONTHS_ES[m-1]} {y}", disabled=disabled, key=f"attcal_{student_id}")
+
+        nkey=f"attcal_nonce_{student_id}"
+        if ev and ev.get("nonce") != st.session_state.get(nkey):
+            st.session_state[nkey] = ev["nonce"]
+            if not disabled and (ev.get("y"), ev.get("m")) == (y, m) and ev.get("changes"):
+                set_attendance_batch(student_id, {date(y,m,int(d)): s for d, s in ev["changes"].items()})
+            if ev.get("nav") in (-1, 1):
+                nm = m + ev["nav"]; ny = y
                 if nm==0: nm=12; ny=y-1
-                st.session_state[key_y], st.session_state[key_m]=ny,nm; do_rerun()
-        with ctitle:
-            st.markdown(
-                f"<div style='text-align:center; font-weight:700; color:#eaf2ff; margin-top:2px'>{MONTHS_ES[m-1]} {y}</div>",
-                unsafe_allow_html=True
-            )
-        with cnext:
-            if st.button("▶", key=f"next_{student_id}_{y}_{m}", disabled=disabled):
-                nm=m+1; ny=y
                 if nm==13: nm=1; ny=y+1
-                st.session_state[key_y], st.session_state[key_m]=ny,nm; do_rerun()
-
-        st.markdown(
-            "<div style='display:flex; gap:6px; justify-content:space-between; font-size:0.72rem; color:#a4c0ff; margin:4px 2px 4px 2px'>"
-            "<span>L</span><span>M</span><span>X</span><span>J</span><span>V</span><span>S</span><span>D</span>"
-            "</div>", unsafe_allow_html=True)
-
-        first_wd, days_in_m = calendar.monthrange(y, m)
-        pads = first_wd
-        att_map = att_map_for_month(student_id, y, m)
-
-        day=1
-        total_cells = pads + days_in_m
-        rows = (total_cells + 6)//7
-        for r in range(rows):
-            cols=st.columns(7, gap="small")
-            for c in range(7):
-                cell_idx=r*7+c
-                with cols[c]:
-                    if cell_idx < pads or day > days_in_m:
-                        st.markdown("<div style='height:26px'></div>", unsafe_allow_html=True)
-                    else:
-                        cur_state=att_map.get(day, None)
-                        emoji=ATT_STATES[cur_state]
-                        lbl=f"{emoji} {day:02d}"
-                        if st.button(lbl, key=f"att_{student_id}_{y}_{m}_{day}", help="Click para alternar", use_container_width=True, disabled=disabled):
-                            new_state = cycle_state(cur_state)
-                            set_attendance(student_id, y, m, day, new_state)
-                            do_rerun()
-                        day+=1
-
-        counts={"P":0,"T":0,"A":0}
-        for d in range(1, days_in_m+1):
-            s=att_map.get(d, None)
-            if s in counts: counts[s]+=1
-        st.markdown(
-            f"<div style='margin-top:6px; font-size:0.78rem; color:#cfd6ff'>"
-            f"<b>Resumen del mes:</b> ✅ {counts['P']} &nbsp; 🟧 {counts['T']} &nbsp; ❌ {counts['A']}"
-            f"</div>", unsafe_allow_html=True
-        )
+                st.session_state[key_y], st.session_state[key_m]=ny,nm
+            do_rerun()
+
+# Agregados de asistencia (vista Asistencia): por estudiante y por colegio + grupo, mes a mes
+@st.cache_resource
+def _att_stats_holder():
+    return {"lock": threading.Lock(), "stats": None}
+
+def _att_stats():
+    """Agregados al día; llamar con el lock del holder tomado. Si sólo cambió students, se reagrupa."""
+    h = _att_stats_holder()
+    vers = {"attendance": storage().version("attendance"), "students": storage().version("students")}
+    s = h["stats"]
+    stale = s is None or vers["attendance"] is None or s.versions.get("attendance") != vers["attendance"]
+    profiler.cache("asistencia agregada", not stale)
+    if stale:
+        s = AttendanceStats(_att_store(), load_students())
+        s.versions = vers
+        h["stats"] = s
+    elif vers["students"] is None or s.versions.get("students") != vers["students"]:
+        s.regroup(load_students())
+        s.versions["students"] = vers["students"]
+    return s
+
+@timed("consulta")
+def attendance_query(fn):
+    """fn(stats) bajo el lock, como leaderboard_query."""
+    h = _att_stats_holder()
+    with h["lock"]:
+        return fn(_att_stats())
+
+def _att_stats_after_write(ver_before, student_id, changes):
+    h = _att_stats_holder()
+    with h["lock"]:
+        s = h["stats"]
+        if s is None: return
+        if ver_before is None or s.versions.get("attendance") != ver_before:
+            h["stats"] = None; return
+        s.apply(student_id, changes)
+        s.versions["attendance"] = storage().version("attendance")
+
+# ===== Ranking (global, por colegio y por grupo; XP total y de la semana) =====
+# Se arma una vez por versión de students/logs y semana; las escrituras propias lo actualizan en su lugar.
+@st.cache_resource
+def _board_holder():
+    return {"lock": threading.Lock(), "board": None}
+
+def week_start(today=None):
+    today = today or date.today()
+    return (today - timedelta(days=today.weekday())).isoformat()
+
+def _board():
+    """Ranking al día; llamar con el lock del holder tomado."""
+    h = _board_holder()
+    vers = {"students": storage().version("students"), "logs": storage().version("logs")}
+    week = week_start()
+    b = h["board"]
+    stale = b is None or None in vers.values() or b.versions != vers or b.week_start != week
+    profiler.cache("ranking", not stale)
+    if stale:
+        b = Leaderboard(load_students(), load_logs_df(), week)
+        b.versions = vers
+        h["board"] = b
+    return b
+
+@timed("consulta")
+def leaderboard_query(fn):
+    """fn(board) bajo el lock: las consultas no ven un ranking a medio actualizar."""
+    h = _board_holder()
+    with h["lock"]:
+        return fn(_board())
+
+def _board_after_write(table, ver_before, apply):
+    """Como _hist_after_write: aplica la escritura propia al ranking o lo descarta si alguien más escribió."""
+    h = _board_holder()
+    with h["lock"]:
+        b = h["board"]
+        if b is None: return
+        if ver_before is None or b.versions.get(table) != ver_before:
+            h["board"] = None; return
+        apply(b)
+        b.versions[table] = storage().version(table)
 
 # ===== RPG helpers =====
+@timed("cálculo")
 def compute_level(xp,milestones):
     current=milestones[0]; next_m=None
     for m in milestones:
@@ -443,32 +699,129 @@ def compute_level(xp,milestones):
     remaining=max(0,next_m["threshold"]-xp)
     return current["label"], current.get("icon",""), current.get("color","#46A0FF"), pct, remaining, next_m["label"], next_m["threshold"]
 
-def hex_to_rgba(h,a=255):
-    try: h=h.lstrip('#'); return (int(h[0:2],16),int(h[2:4],16),int(h[4:6],16),a)
-    except: return (70,160,255,a)
-
-def pixel_overlay_bar_image(pct,width=560,height=22,color_hex="#46A0FF"):
-    pct=max(0.0,min(1.0,float(pct))); W,H=width,height
-    img=Image.new("RGBA",(W,H),(0,0,0,0)); d=ImageDraw.Draw(img)
-    d.rectangle([0,0,W-1,H-1], outline=(190,210,255,220), width=2)
-    d.rectangle([2,2,W-3,H-3], outline=(10,18,36,255), width=1)
-    d.rectangle([3,3,W-4,H-4], fill=(25,36,64,230))
-    r,g,b,_=hex_to_rgba(color_hex); fill_w=max(0,int((W-6)*pct))
-    for x in range(3,3+fill_w):
-        for y in range(3,H-3):
-            if ((x+y)&1)==0: rx=min(255,r+18); gx=min(255,g+18); bx=min(255,b+18)
-            else: rx=max(0,r-12); gx=max(0,g-12); bx=max(0,b-12)
-            img.putpixel((x,y),(rx,gx,bx,235))
-    d.line([3,4,3+fill_w,4], fill=(255,255,255,90), width=1)
-    d.line([3,H-5,3+fill_w,H-5], fill=(0,0,0,110), width=1)
-    return img
+def compute_levels(xp, milestones) -> pd.DataFrame:
+    """compute_level para muchos XP de una vez (searchsorted sobre los umbrales ordenados; mismas reglas,
+    incluido XP bajo el primer umbral). Columnas: level, label, icon, color, pct, remaining, next_label, next_thr."""
+    xp = np.asarray(xp)
+    th = np.array([m["threshold"] for m in milestones])
+    labels = np.array([m["label"] for m in milestones], dtype=object)
+    icons = np.array([m.get("icon","") for m in milestones], dtype=object)
+    colors = np.array([m.get("color","#46A0FF") for m in milestones], dtype=object)
+    idx = np.searchsorted(th, xp, side="right") - 1
+    cur = np.maximum(idx, 0)
+    nxt = np.where(idx < 0, 0, np.minimum(idx + 1, len(th) - 1))
+    is_max = idx == len(th) - 1
+    pct = np.where(is_max, 1.0, (xp - th[cur]) / np.maximum(1, th[nxt] - th[cur]))
+    return pd.DataFrame({"level": cur + 1, "label": labels[cur], "icon": icons[cur], "color": colors[cur], "pct": pct,
+                         "remaining": np.where(is_max, 0, np.maximum(0, th[nxt] - xp)),
+                         "next_label": np.where(is_max, "MAX", labels[nxt]),
+                         "next_thr": np.where(is_max, th[cur], th[nxt])})
+
+# Niveles de todos los estudiantes, por id; clave = (versión de students, hitos). Lo reusan ranking y ficha.
+@st.cache_resource
+def _levels_cache():
+    return {}
+
+@timed("cálculo")
+def student_levels(students_df, milestones) -> pd.DataFrame:
+    ver = storage().version("students")
+    if XP_FROM_LOGS and ver is not None: ver = (ver, storage().version("logs"))
+    if ver is None or None in ver:   # backend sin versión: el contenido hace de versión
+        ver = hashlib.sha1(pd.util.hash_pandas_object(students_df[["id","xp"]], index=False).values.tobytes()).hexdigest()
+    key = (ver, len(students_df), tuple((m["label"], m["threshold"], m.get("icon",""), m.get("color","")) for m in milestones))
+    cache = _levels_cache()
+    hit = cache.get(key)
+    profiler.cache("niveles", hit is not None)
+    if hit is None:
+        hit = compute_levels(pd.to_numeric(students_df["xp"], errors="coerce").fillna(0).astype(int), milestones)
+        hit.index = students_df["id"].astype(int).to_numpy()
+        hit = hit[~hit.index.duplicated()]
+        cache.clear(); cache[key] = hit
+    return hit
+
+# ===== Assets por URL (carpeta static/ de Streamlit, nombre con hash de contenido) =====
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+@st.cache_resource
+def _static_asset_url(path, mtime_ns):
+    try:
+        if not st.get_option("server.enableStaticServing"): return None
+        with open(path,"rb") as f: data=f.read()
+        digest=hashlib.sha1(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(os.path.basename(path))
+        name=f"{stem}.{digest}{ext}"
+        dst=os.path.join(STATIC_DIR, name)
+        if not os.path.exists(dst):
+            os.makedirs(STATIC_DIR, exist_ok=True)
+            with open(dst+".tmp","wb") as f: f.write(data)
+            os.replace(dst+".tmp", dst)
+        # ?v=... hace que el servidor mande Cache-Control de larga duración
+        return f"app/static/{name}?v={digest}"
+    except Exception:
+        return None
+
+def static_asset_url(path):
+    """URL estable del asset servido por Streamlit; None si static serving no está activo."""
+    try: return _static_asset_url(path, os.stat(path).st_mtime_ns)
+    except OSError: return None
+
+@st.cache_resource
+def _file_bytes(path, mtime_ns):
+    with open(path,"rb") as f: return f.read()
+
+# ===== Perfil por ejecución (?profile=1) =====
+try: PROFILE_TRACE = os.getenv("PROFILE_TRACE") or str(st.secrets.get("PROFILE_TRACE", "") or "")
+except Exception: PROFILE_TRACE = os.getenv("PROFILE_TRACE", "")
+
+def storage_snapshot():
+    """Contadores de la capa de datos para restar al final de la ejecución."""
+    stg = storage()
+    ops = {(m["backend"], m["tabla"], m["op"]): (m["llamadas"], m["prom_ms"] * m["llamadas"], m["filas"]) for m in stg.metrics()}
+    caches = {c["tabla"]: (c["aciertos"], c["fallos"]) for c in stg.cache_stats()}
+    return io_calls(), ops, caches
+
+def storage_delta(base):
+    io0, ops0, caches0 = base
+    io1, ops1, caches1 = storage_snapshot()
+    ops = []
+    for (b, t, op), (n, ms, rows) in ops1.items():
+        n0, ms0, rows0 = ops0.get((b, t, op), (0, 0.0, 0))
+        if n > n0: ops.append({"backend": b, "tabla": t, "op": op, "llamadas": n - n0, "ms": round(ms - ms0, 1), "filas": rows - rows0})
+    caches = {f"tabla {t}": {"hits": h - caches0.get(t, (0, 0))[0], "misses": m - caches0.get(t, (0, 0))[1]}
+              for t, (h, m) in caches1.items() if (h, m) != caches0.get(t, (0, 0))}
+    return io1 - io0, ops, caches
+
+def render_profile(data):
+    """Panel lateral con el perfil de la ejecución que acaba de terminar."""
+    with st.sidebar.expander(f"⏱️ Perfil: {data['total_ms']:.0f} ms", expanded=True):
+        st.caption(f"Vista {data.get('view','')} · {data['io_calls']} llamada(s) al backend en esta sesión · "
+                   "las métricas del backend son del proceso (incluyen otras sesiones)")
+        st.dataframe(pd.DataFrame(data["phases"]), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame([{"categoría": k, "ms": v} for k, v in data["by_cat"].items()]),
+                     hide_index=True, use_container_width=True)
+        if data["funcs"]:
+            f = pd.DataFrame(data["funcs"])
+            f["KB"] = (f.pop("bytes") / 1024).round(1)
+            st.dataframe(f[["cat","name","calls","ms","self_ms","max_ms","rows","KB"]], hide_index=True, use_container_width=True)
+        if data["backend_ops"]:
+            st.dataframe(pd.DataFrame(data["backend_ops"]), hide_index=True, use_container_width=True)
+        if data["caches"]:
+            st.dataframe(pd.DataFrame([{"caché": k, "aciertos": v["hits"], "fallos": v["misses"],
+                                        "tasa": f"{v['hits'] / max(1, v['hits'] + v['misses']):.0%}"}
+                                       for k, v in data["caches"].items()]), hide_index=True, use_container_width=True)
+        if PROFILE_TRACE: st.caption(f"Traza: {PROFILE_TRACE}")
 
 # ===== Theme / CSS =====
 def inject_css():
-    try:
-        with open(os.path.join(ASSETS_DIR,"hand.png"),"rb") as f: hand_b64=base64.b64encode(f.read()).decode("utf-8")
-        cursor_css=f"cursor:url('data:image/png;base64,{hand_b64}') 8 0, pointer !important;"
-    except: cursor_css="cursor:pointer !important;"
+    hand = os.path.join(ASSETS_DIR,"hand.png")
+    hand_url = static_asset_url(hand)
+    if hand_url:
+        cursor_css=f"cursor:url('{hand_url}') 8 0, pointer !important;"
+    else:
+        try:
+            hand_b64=base64.b64encode(_file_bytes(hand, os.stat(hand).st_mtime_ns)).decode("utf-8")
+            cursor_css=f"cursor:url('data:image/png;base64,{hand_b64}') 8 0, pointer !important;"
+        except: cursor_css="cursor:pointer !important;"
     st.markdown(f"""
     <style>
       @import url('https://fonts.googleapis.com/css2?family=Press+Start+2P&display=swap');
@@ -493,6 +846,9 @@ def inject_css():
       .trinket-img:hover{{filter:brightness(1.18); transform:translateY(-1px)}}
       .trinket-cap{{font-size:.72rem;color:#bcd0ff;text-align:center;margin-top:2px}}
 
+      /* BGM: reproductor oculto */
+      div[data-testid="stAudio"]{{display:none}}
+
       /* Marca pequeñita fija abajo-izquierda */
       .mhv-mark {{
         position: fixed; left: 8px; bottom: 6px; font-size: 10px; color:#8fa9ff; opacity:.7; z-index: 9999;
@@ -502,26 +858,10 @@ def inject_css():
     """, unsafe_allow_html=True)
 
 def inject_bgm_and_mark():
-    # BGM en loop con volumen bajito (0.08). Autoplay puede requerir interacción.
-    audio_b64 = ""
+    # BGM en loop. Se sirve por el endpoint de media de Streamlit (URL con hash del contenido,
+    # streaming con Range y audio/mpeg); en cada rerun sólo viaja la URL. Autoplay puede requerir interacción.
     if os.path.isfile(BGM_FILE):
-        with open(BGM_FILE, "rb") as f:
-            audio_b64 = base64.b64encode(f.read()).decode("utf-8")
-
-    if audio_b64:
-        st.markdown(f"""
-        <audio id="bgm" src="data:audio/mp3;base64,{audio_b64}" autoplay loop></audio>
-        <script>
-        (function(){{
-          try{{ const a = document.getElementById('bgm'); a.volume = 0.08; }}catch(e){{}}
-          // En Safari/Chrome móvil: arrancar tras primer toque/click
-          window.addEventListener('pointerdown', function once(){{ 
-            try{{ document.getElementById('bgm').play(); }}catch(e){{}} 
-            this.removeEventListener('pointerdown', once); 
-          }}, {{passive:true}});
-        }})();
-        </script>
-        """, unsafe_allow_html=True)
+        st.audio(_file_bytes(BGM_FILE, os.stat(BGM_FILE).st_mtime_ns), format="audio/mpeg", loop=True, autoplay=True)
 
     # Marca pequeñita fija
     st.markdown(
@@ -532,8 +872,15 @@ def inject_bgm_and_mark():
 
 # ===== App state =====
 st.set_page_config(page_title="Maestros & Dragones — RPG XP", layout="wide")
+
+# ?profile=1: tiempos, llamadas al backend, cachés y tamaños de esta ejecución (panel al final del script)
+PROFILE = qp_first(get_qp(), "profile").lower() in ("1","true","si","sí")
+if profiler.start(PROFILE):
+    _prof_base = storage_snapshot()
+    profiler.phase("inicio")
 inject_css()
 inject_bgm_and_mark()
+_warm_thumbs()
 
 # ===== Viewer mode por querystring =====
 _qp = get_qp()
@@ -558,37 +905,20 @@ if "sid" in _qp:
     except:
         pass
 
-VIEWS=["Mapa","Colegio","Ficha","Control","Config"]
+VIEWS=["Mapa","Colegio","Ranking","Asistencia","Ficha","Control","Config"]
 show_sidebar_nav = not VIEWER_MODE
 if show_sidebar_nav:
     nav_choice=st.sidebar.radio("Vista",VIEWS,index=VIEWS.index(st.session_state.view))
     if nav_choice!=st.session_state.view:
         st.session_state.view=nav_choice; do_rerun()
 
-# ===== Cargar datos (CSV o Sheets) =====
-if USE_SHEETS and SHEET_STUDENTS_URL:
-    @st.cache_data
-    def load_students():
-        df = _sheet_to_df(SHEET_STUDENTS_URL, expected_cols=[
-            "id","name","grupo","xp","colegio_id","phone","teacher","xp_delta","xp_reason","avatar",
-            "trinket","trinket_desc"
-        ])
-        # normaliza tipos
-        for c in ["xp","colegio_id","xp_delta","id"]:
-            if c in df.columns: df[c]=pd.to_numeric(df[c], errors="coerce").fillna(0).astype(int)
-        for c in ["name","grupo","phone","teacher","xp_reason","avatar","trinket","trinket_desc"]:
-            if c in df.columns: df[c]=df[c].fillna("").astype(str)
-        return df
-    def save_students(df): _df_to_sheet(SHEET_STUDENTS_URL, df)
-else:
-    load_students = load_students_csv
-    save_students = save_students_csv
-
+# ===== Cargar datos (CSV, SQLite o Sheets) =====
+profiler.phase("datos")
+rotate_if_due()
 students = load_students()
 config   = load_milestones()
 ms       = config["milestones"]
 colegios = load_colegios()
-rank_labels=[m["label"] for m in ms]
 
 # ===== Barra + Rango =====
 def bar_with_rank(pct,xp_cur,xp_next,color_hex,icon,label,remain_text,
@@ -651,6 +981,17 @@ def make_student_view_link(student_id:int):
     # Streamlit generalmente maneja rutas como / o /?...
     return f"{base}/?view=Ficha&sid={int(student_id)}&mode=viewer"
 
+# ===== Utilidad: historial archivado (sólo los periodos que se eligen) =====
+def archived_history(kind, student_id, cols, rename):
+    terms = archive_terms(kind, student_id)
+    if not terms: return
+    sel = st.multiselect("Historial archivado (solo lectura)", terms, key=f"arch_{kind}_{int(student_id)}")
+    if sel:
+        df = archived_for(kind, student_id, sel)
+        st.dataframe(df.reindex(columns=cols).rename(columns=rename), use_container_width=True, hide_index=True)
+
+profiler.phase(f"vista: {st.session_state.view}")
+
 # ===== MAPA =====
 if st.session_state.view=="Mapa":
     if VIEWER_MODE:
@@ -658,48 +999,8 @@ if st.session_state.view=="Mapa":
     st.title("🗺️ Reinos de Práctica Pedagógica")
     st.caption("Haz clic en un castillo para entrar")
 
-    W, H = 900, 550; CASTLE = 64
-    try:
-        base = Image.open(MAP_IMG).convert("RGBA").resize((W, H), Image.LANCZOS)
-    except Exception:
-        base = Image.new("RGBA", (W, H), (30, 60, 90, 255))
-
-    img = base.copy(); d = ImageDraw.Draw(img)
-    GRID_STEP = 50; GRID_COLOR = (255, 255, 255, 40)
-    for x in range(0, W, GRID_STEP): d.line([x, 0, x, H], fill=GRID_COLOR)
-    for y in range(0, H, GRID_STEP): d.line([0, y, W, y], fill=GRID_COLOR)
-
-    def measure_text(draw, text, font):
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font); return bbox[2] - bbox[0], bbox[3] - bbox[1]
-        except Exception:
-            try: return font.getsize(text)
-            except Exception: return (len(text)*8, 16)
-
-    boxes=[]
-    for _, row in colegios.iterrows():
-        icon_path = str(row.get("icono", "assets/castle1.png"))
-        try: castle = Image.open(icon_path).resize((CASTLE, CASTLE), Image.NEAREST)
-        except Exception: castle = Image.new("RGBA", (CASTLE, CASTLE), (120,120,120,255))
-        x, y = int(row["x"]), int(row["y"])
-        img.paste(castle, (x, y), castle)
-
-        try:
-            fnt = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 16)
-        except Exception:
-            fnt = ImageFont.load_default()
-
-        name = str(row["nombre"])
-        text_w, text_h = measure_text(d, name, fnt)
-        pad_x, pad_y = 8, 4
-        left = max(4, min(x, W - (text_w + pad_x*2) - 4))
-        top = y + CASTLE + 3
-        right, bottom = left + text_w + pad_x*2, top + text_h + pad_y*2
-        d.rectangle([left, top, right, bottom], fill=(20, 30, 40, 200))
-        d.text((left + pad_x, top + pad_y), name, font=fnt, fill=(255,255,255,255))
-        boxes.append((x, y, x + CASTLE, y + CASTLE, int(row["id"]), name))
-
-    coords = streamlit_image_coordinates(img, key="mapa_colegios", width=W)
+    img, boxes = composed_map(colegios)
+    coords = streamlit_image_coordinates(img, key="mapa_colegios", width=MAP_W)
     if coords and "x" in coords and "y" in coords and not VIEWER_MODE:
         cx, cy = int(coords["x"]), int(coords["y"])
         for (x1, y1, x2, y2, cid, _name) in boxes:
@@ -718,20 +1019,55 @@ elif st.session_state.view=="Colegio":
         cname = colegios[colegios["id"] == cid]["nombre"].iloc[0]
         st.markdown(f"<h2 class='ff-title'>{cname}</h2>", unsafe_allow_html=True)
 
-        subset = students[students["colegio_id"] == cid].copy().sort_values("xp", ascending=False)
+        index = colegio_index(students)
+        ent = index.get(int(cid), {"grupos": []})
+        f1, f2, f3 = st.columns([2.2, 1.4, 0.9], gap="small")
+        with f1: query = st.text_input("Buscar", key=f"col_q_{cid}", placeholder="Nombre del estudiante")
+        with f2: grupo = st.selectbox("Grupo", ["Todos"] + ent["grupos"], key=f"col_g_{cid}")
+        with f3: per_page = st.selectbox("Por página", PAGE_SIZES, key=f"col_pp_{cid}")
+        grupo = None if grupo == "Todos" else grupo
+
+        # la página vuelve a 1 si cambian los filtros
+        pkey, fkey = f"col_page_{cid}", f"col_filt_{cid}"
+        if st.session_state.get(fkey) != (query, grupo, per_page):
+            st.session_state[fkey] = (query, grupo, per_page); st.session_state[pkey] = 0
+        page = st.session_state.get(pkey, 0)
+        page_ids, total = colegio_page(index, cid, grupo, query, page, per_page)
+        n_pages = max(1, -(-total // per_page))
+        if page >= n_pages:
+            page = st.session_state[pkey] = n_pages - 1
+            page_ids, total = colegio_page(index, cid, grupo, query, page, per_page)
+
+        def pager(where):
+            p1, p2, p3 = st.columns([1, 3, 1], gap="small")
+            with p1:
+                if st.button("◀ Anterior", key=f"{pkey}_prev_{where}", disabled=page == 0):
+                    st.session_state[pkey] = page - 1; do_rerun()
+            with p2:
+                st.caption(f"Página {page + 1} de {n_pages} · {total} estudiante(s)")
+            with p3:
+                if st.button("Siguiente ▶", key=f"{pkey}_next_{where}", disabled=page >= n_pages - 1):
+                    st.session_state[pkey] = page + 1; do_rerun()
+
+        if total == 0:
+            st.info("No hay estudiantes con esos filtros.")
+        else:
+            pager("top")
+        subset = students.set_index("id", drop=False).loc[page_ids] if page_ids else students.iloc[0:0]
 
+        levels = student_levels(students, ms)
         for _, r in subset.iterrows():
-            label, icon, color_hex, pct, remaining, next_label, next_thr = compute_level(int(r["xp"]), ms)
-            try: lv = 1 + rank_labels.index(label)
-            except: lv = 1
+            L = levels.loc[int(r["id"])]
+            label, icon, color_hex, pct, remaining, next_label, next_thr, lv = (
+                L["label"], L["icon"], L["color"], L["pct"], int(L["remaining"]), L["next_label"], int(L["next_thr"]), int(L["level"]))
 
             st.markdown("<div class='ff-panel ff-card ff-compact'>", unsafe_allow_html=True)
             cardL, cardC, cardR = st.columns([0.9, 5.9, 1.2], gap="small")
 
             with cardL:
-                apath = avatar_path_for(r)
+                apath = avatar_path_for(r, size=110)
                 if apath:
-                    try: st.image(Image.open(apath), width=110)
+                    try: st.image(apath, width=110)
                     except: st.image(Image.new("RGBA",(220,220),(90,90,100,255)), width=110)
                 else:
                     st.image(Image.new("RGBA",(220,220),(90,90,100,255)), width=110)
@@ -765,6 +1101,98 @@ elif st.session_state.view=="Colegio":
 
             st.markdown("</div>", unsafe_allow_html=True)
 
+        if n_pages > 1: pager("bottom")
+
+# ===== RANKING =====
+elif st.session_state.view=="Ranking":
+    st.title("🏆 Ranking")
+    cnames = dict(zip(pd.to_numeric(colegios["id"], errors="coerce").fillna(0).astype(int), colegios["nombre"]))
+    f1, f2, f3, f4 = st.columns([2.2, 1.6, 1.6, 0.8], gap="small")
+    with f1:
+        rk_cid = st.selectbox("Colegio", [None]+list(cnames), format_func=lambda c: "Todos" if c is None else cnames[c], key="rk_colegio")
+    with f2:
+        rk_grupos = leaderboard_query(lambda b: b.grupos(rk_cid))
+        rk_grupo = st.selectbox("Grupo", [""]+rk_grupos, format_func=lambda g: g or "Todos", key="rk_grupo")
+    with f3:
+        rk_by = st.selectbox("Ordenar por", ["xp","week"], format_func=lambda b: "XP total" if b=="xp" else "XP de la semana", key="rk_by")
+    with f4:
+        rk_k = st.selectbox("Top", [10, 25, 50, 100], key="rk_k")
+    top, total, week = leaderboard_query(lambda b: (b.top(rk_k, rk_by, rk_cid, rk_grupo), b.size(rk_cid, rk_grupo), b.week_start))
+    st.caption(f"{total} estudiante(s) · XP de la semana desde el lunes {week}")
+    if top.empty:
+        st.info("No hay estudiantes en este ranking.")
+    else:
+        levels = student_levels(students, ms)
+        st.dataframe(pd.DataFrame({
+            "#": top["rank"], "Estudiante": top["name"], "Colegio": top["colegio_id"].map(cnames).fillna("—"),
+            "Grupo": top["grupo"], "Rango": top["id"].map(levels["label"]).fillna(""),
+            "XP": top["xp"], "XP semana": top["week_xp"],
+        }), hide_index=True, use_container_width=True)
+
+# ===== ASISTENCIA =====
+elif st.session_state.view=="Asistencia":
+    st.title("📅 Asistencia")
+    cnames = dict(zip(pd.to_numeric(colegios["id"], errors="coerce").fillna(0).astype(int), colegios["nombre"]))
+    months = attendance_query(lambda s: s.months())
+    if not months:
+        st.info("Todavía no hay marcas de asistencia.")
+    else:
+        f1, f2, f3 = st.columns([2.2, 1.6, 2.6], gap="small")
+        with f1:
+            at_cid = st.selectbox("Colegio", [None]+list(cnames), format_func=lambda c: "Todos" if c is None else cnames[c], key="at_colegio")
+        with f2:
+            at_grupos = attendance_query(lambda s: s.grupos(at_cid))
+            at_grupo = st.selectbox("Grupo", [""]+at_grupos, format_func=lambda g: g or "Todos", key="at_grupo")
+        with f3:
+            at_from, at_to = st.select_slider("Meses", months, value=(months[max(0, len(months)-12)], months[-1]),
+                                              format_func=month_label, key="at_meses")
+        f4, f5 = st.columns(2, gap="small")
+        with f4: at_thr = st.slider("Ausentismo crónico: faltas sobre días marcados", 5, 30, 10, step=1, format="%d%%", key="at_umbral")
+        with f5: at_min = st.number_input("Mínimo de días marcados", 1, 200, 10, key="at_min")
+
+        trend, table, grid, chronic = attendance_query(lambda s: (
+            s.monthly(at_cid, at_grupo, at_from, at_to),
+            s.summary("colegio" if at_cid is None else "grupo", at_cid, at_from, at_to),
+            s.pivot(at_cid, at_from, at_to),
+            s.chronic(at_cid, at_grupo, at_from, at_to, at_thr / 100, at_min)))
+        if trend.empty:
+            st.info("No hay marcas en este periodo.")
+        else:
+            tot = trend[["P","T","A"]].sum()
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Asistencia", f"{(tot['P']+tot['T']) / max(1, tot.sum()):.1%}")
+            m2.metric("Atrasos (de los presentes)", f"{tot['T'] / max(1, tot['P']+tot['T']):.1%}")
+            m3.metric("Días marcados", f"{int(tot.sum()):,}")
+            m4.metric("Ausentismo crónico", f"{len(chronic)}")
+
+            st.subheader("Tendencia mensual")
+            st.line_chart((trend.set_index("mes")[["asistencia","atraso"]] * 100).rename(columns={"asistencia":"Asistencia %","atraso":"Atraso %"}))
+
+            st.subheader("Por colegio" if at_cid is None else "Por grupo")
+            if at_grupo: table = table[table["grupo"] == at_grupo]
+            view = pd.DataFrame({"Colegio": table["colegio_id"].map(cnames).fillna("—")})
+            if at_cid is not None: view["Grupo"] = table["grupo"]
+            view = view.assign(**{"Asistencia %": (table["asistencia"]*100).round(1), "Atraso %": (table["atraso"]*100).round(1),
+                                  "Presentes": table["P"], "Atrasos": table["T"], "Faltas": table["A"]})
+            st.dataframe(view.sort_values("Asistencia %"), hide_index=True, use_container_width=True)
+
+            with st.expander("Asistencia % por " + ("grupo" if at_cid is not None else "colegio · grupo") + " y mes"):
+                if at_cid is None:
+                    grid.index = [f"{cnames.get(int(i.split(' · ')[0]), i.split(' · ')[0])} · {i.split(' · ', 1)[1]}" for i in grid.index]
+                elif at_grupo:
+                    grid = grid[grid.index == at_grupo]
+                st.dataframe((grid*100).round(1), use_container_width=True)
+
+            st.subheader("Ausentismo crónico")
+            if chronic.empty:
+                st.caption(f"Nadie con {at_thr}% de faltas o más en el periodo.")
+            else:
+                st.dataframe(pd.DataFrame({
+                    "Estudiante": chronic["name"], "Colegio": chronic["colegio_id"].map(cnames).fillna("—"), "Grupo": chronic["grupo"],
+                    "Faltas": chronic["A"], "Días": chronic["dias"], "Ausencia %": (chronic["ausencia"]*100).round(1),
+                    "Atraso %": (chronic["atraso"]*100).round(1),
+                }), hide_index=True, use_container_width=True)
+
 # ===== FICHA =====
 elif st.session_state.view=="Ficha":
     sid = st.session_state.selected_student
@@ -772,7 +1200,9 @@ elif st.session_state.view=="Ficha":
         st.info("Elige un estudiante desde la lista del colegio.")
     else:
         row = students[students["id"]==sid].iloc[0]
-        label,icon,color_hex,pct,remaining,next_label,next_thr = compute_level(int(row["xp"]),ms)
+        L = student_levels(students, ms).loc[int(row["id"])]
+        label,icon,color_hex,pct,remaining,next_label,next_thr = (
+            L["label"], L["icon"], L["color"], L["pct"], int(L["remaining"]), L["next_label"], int(L["next_thr"]))
         try:
             cname = load_colegios()[load_colegios()["id"]==int(row["colegio_id"])]["nombre"].iloc[0]
         except:
@@ -782,9 +1212,9 @@ elif st.session_state.view=="Ficha":
         topL, topR = st.columns([0.8, 5.4], gap="small")
 
         with topL:
-            apath = avatar_path_for(row.to_dict())
+            apath = avatar_path_for(row.to_dict(), size=120)
             if apath:
-                try: st.image(Image.open(apath), width=120)
+                try: st.image(apath, width=120)
                 except: st.image(Image.new("RGBA",(320,320),(90,90,100,255)), width=120)
             else:
                 st.image(Image.new("RGBA",(320,320),(90,90,100,255)), width=120)
@@ -799,7 +1229,7 @@ elif st.session_state.view=="Ficha":
             with subMain:
                 st.markdown(
                     f"<div class='ff-title' style='font-size:1.05rem'>{row['name']} — {row['grupo']}"
-                    f"<span class='ff-badge'>LV {1+rank_labels.index(label) if label in rank_labels else 1}</span>"
+                    f"<span class='ff-badge'>LV {int(L['level'])}</span>"
                     f"</div>", unsafe_allow_html=True
                 )
                 st.markdown("""
@@ -856,9 +1286,10 @@ elif st.session_state.view=="Ficha":
                     with colA:
                         st.markdown("&nbsp;", unsafe_allow_html=True)
                         if st.button("Aplicar cambio de XP", key=f"btn_apply_xp_{sid}", disabled=VIEWER_MODE):
+                            prev=students.copy()
                             students.loc[students["id"]==row["id"],"xp"]=int(row["xp"])+int(delta)
-                            save_students(students)
-                            append_log(row["id"], row["name"], delta, (reason or ""))
+                            commit_xp_batch(students, [{"timestamp":now_iso(),"id":int(row["id"]),"name":row["name"],
+                                                        "delta_xp":int(delta),"reason":(reason or "")}], prev)
                             if delta>0: play_positive_sound()
                             st.success("XP actualizado y hito registrado."); do_rerun()
                     st.markdown("</div>", unsafe_allow_html=True)
@@ -878,9 +1309,10 @@ elif st.session_state.view=="Control":
     delta=st.number_input("Δ XP (positivo o negativo)", min_value=-1000, max_value=1000, value=10, step=1, key="ctl_delta")
     reason=st.text_input("Motivo (se registrará)", placeholder="Entregó plan de clase, etc.", key="ctl_reason")
     if st.button("Aplicar", key="ctl_apply", disabled=VIEWER_MODE):
+        prev=students.copy()
         students.loc[students["id"]==sid,"xp"]=int(row["xp"])+int(delta)
-        save_students(students)
-        append_log(sid, row["name"], delta, (reason or ""))
+        commit_xp_batch(students, [{"timestamp":now_iso(),"id":sid,"name":row["name"],
+                                    "delta_xp":int(delta),"reason":(reason or "")}], prev)
         if delta>0: play_positive_sound()
         st.success("XP actualizado y hito registrado."); do_rerun()
 
@@ -907,7 +1339,8 @@ elif st.session_state.view=="Control":
                     removed = delete_logs_for(sid, timestamps_to_delete)
                     if removed > 0:
                         current_xp = int(students.loc[students["id"]==sid, "xp"].iloc[0])
-                        new_xp = current_xp - sum_selected_delta
+                        # con XP_SOURCE=logs el historial ya es la verdad: no se parcha a mano
+                        new_xp = int(derived_xp().get(sid, 0)) if XP_FROM_LOGS else current_xp - sum_selected_delta
                         students.loc[students["id"]==sid, "xp"] = new_xp
                         save_students(students)
                         st.success(f"Eliminados {removed} hito(s). XP ajustado: {current_xp} → {new_xp}.")
@@ -915,6 +1348,8 @@ elif st.session_state.view=="Control":
                     else:
                         st.info("No se eliminaron hitos (verifica la selección).")
 
+    archived_history("logs", sid, ["timestamp","delta_xp","reason"], {"timestamp":"Fecha/Hora (ISO)","delta_xp":"Δ XP","reason":"Motivo"})
+
     st.markdown("### Observaciones del estudiante")
     raw_obs = all_observations_for(sid)
     if raw_obs.empty:
@@ -940,6 +1375,7 @@ elif st.session_state.view=="Control":
                         do_rerun()
                     else:
                         st.info("No se eliminaron observaciones (verifica la selección).")
+    archived_history("obs", sid, ["timestamp","observacion"], {"timestamp":"Fecha/Hora (ISO)","observacion":"Observación"})
 
 # ===== CONFIG =====
 elif st.session_state.view=="Config":
@@ -974,7 +1410,9 @@ elif st.session_state.view=="Config":
         }
     except Exception:
         avatar_col_config = {}
-    stu_edit = st.data_editor(students[st_cols], num_rows="dynamic", use_container_width=True, key="stu_editor", column_config=avatar_col_config, disabled=VIEWER_MODE)
+    if XP_FROM_LOGS: st.caption("El XP se calcula desde el historial (XP_SOURCE = logs): para cambiarlo usa Δ XP y «Aplicar XP».")
+    stu_edit = st.data_editor(students[st_cols], num_rows="dynamic", use_container_width=True, key="stu_editor", column_config=avatar_col_config,
+                              disabled=VIEWER_MODE or (["xp"] if XP_FROM_LOGS else False))
 
     c1, c2 = st.columns(2)
     with c1:
@@ -988,31 +1426,45 @@ elif st.session_state.view=="Config":
 
     with c2:
         if st.button("Aplicar XP y registrar hitos", disabled=VIEWER_MODE):
-            base = students.copy()
-            edit = stu_edit.copy()
-            edit["xp_delta"]=pd.to_numeric(edit["xp_delta"], errors="coerce").fillna(0).astype(int)
-            for col in ["xp_reason","phone","teacher","name","grupo","avatar","trinket","trinket_desc"]:
-                edit[col]=edit[col].fillna("").astype(str)
-            applied_count=0
-            for _, rr in edit.iterrows():
-                sid = rr.get("id")
-                if pd.isna(sid): continue
-                for c in ["name","grupo","colegio_id","phone","teacher","avatar","trinket","trinket_desc"]:
-                    base.loc[base["id"]==sid, c] = rr.get(c, base.loc[base["id"]==sid, c])
-                delta=int(rr.get("xp_delta",0) or 0)
-                reason=str(rr.get("xp_reason","") or "").strip()
-                if delta!=0:
-                    cur_xp = int(base.loc[base["id"]==sid,"xp"].iloc[0])
-                    base.loc[base["id"]==sid,"xp"]=cur_xp+delta
-                    name = base.loc[base["id"]==sid,"name"].iloc[0]
-                    append_log(sid, name, delta, reason)
-                    applied_count+=1
-            base["xp_delta"]=0
-            base["xp_reason"]=base["xp_reason"].fillna("").astype(str)
-            save_students(base)
+            new_students, log_rows = build_xp_batch(students, stu_edit)
+            calls = commit_xp_batch(new_students, log_rows, students.copy())
+            applied_count = len(log_rows)
             if applied_count>0: play_positive_sound()
-            st.success(f"Aplicados {applied_count} ajuste(s) de XP y registrados sus hitos."); do_rerun()
+            st.success(f"Aplicados {applied_count} ajuste(s) de XP y registrados sus hitos ({calls} llamada(s) al backend)."); do_rerun()
+    # Almacenamiento: backend, política de caché por tabla y métricas de cada operación
+    stg=storage()
+    if isinstance(stg.primary, SheetsBackend):
+        gs=stg.primary.stats()
+        st.caption(f"Google Sheets: {gs['handshakes']} autenticación(es) y {gs['refreshes']} refresco(s) de token en este proceso, {gs['sheets']} hoja(s) abiertas, {gs['synced_cells']} celda(s) enviadas por diferencias, "
+                   f"{gs['rev_checks']} consulta(s) de revisión (cada {gs['revision_ttl']:g} s como máximo).")
+        wq=gs.get("queue")
+        if wq:
+            st.caption(f"Escritura diferida: {wq['depth']} operación(es) en cola ({wq['pending_rows']} filas, la más vieja hace {wq['oldest_age_s']} s), "
+                       f"{wq['flushes']} envío(s) · {wq['avg_flush_ms']:.0f} ms prom. / {wq['max_flush_ms']:.0f} ms máx, "
+                       f"{wq['coalesced']} agrupada(s), {wq['flush_errors']} error(es), {wq['recovered']} recuperada(s) del diario.")
+            if wq["last_error"]: st.caption(f"Último error de envío: {wq['last_error']}")
+        api=getattr(stg.primary,"api",None)   # fake_sheets: registro de llamadas a la API simulada
+        if api is not None:
+            kinds=api.ledger.counts("kind"); codes=api.ledger.counts("code")
+            st.caption(f"API simulada: {len(api.ledger)} llamada(s) — {kinds.get('read',0)} lectura(s), {kinds.get('write',0)} escritura(s), "
+                       f"{kinds.get('drive',0)} a Drive; {codes.get(429,0)} rechazada(s) por cuota (429).")
+    arch=archive_store(); rot=_rotation_holder()
+    arch_info=", ".join(f"{t}: {a['rows']:,} fila(s) en {a['terms']} periodo(s)" for t, a in ((t, arch.stats(t)) for t in ("logs","observaciones")))
+    st.caption(f"Historial archivado en {ARCHIVE_DIR}/ — {arch_info}. "
+               + (f"Rotación diaria de lo anterior a {ARCHIVE_HORIZON_DAYS} días" + (f" (última: {rot['day']})" if rot["day"] else "") + "."
+                  if ARCHIVE_HORIZON_DAYS > 0 else "Rotación automática desactivada (ARCHIVE_HORIZON_DAYS)."))
+    if rot["error"]: st.caption(f"Último error de rotación: {rot['error']}")
+    with st.expander(f"Almacenamiento: {stg.primary.name} — caché y métricas"):
+        st.dataframe(pd.DataFrame(stg.cache_stats()), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame(stg.metrics()), hide_index=True, use_container_width=True)
     st.divider()
     side=st.selectbox("Posición del escudo junto a la barra",["Izquierda","Derecha"], index=0 if st.session_state.rank_side=="Izquierda" else 1, disabled=VIEWER_MODE)
     if st.button("Aplicar posición del escudo", disabled=VIEWER_MODE):
         st.session_state.rank_side=side; st.success(f"Posición aplicada: {side}"); do_rerun()
+
+# ===== Perfil: cierre y panel =====
+if PROFILE:
+    _io, _ops, _caches = storage_delta(_prof_base)
+    for _k, _v in _caches.items():
+        profiler.cache(_k, True, _v["hits"]); profiler.cache(_k, False, _v["misses"])
+    render_profile(profiler.finish(PROFILE_TRACE or None, view=st.session_state.view, io_calls=_io, backend_ops=_ops))
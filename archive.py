@@ -0,0 +1,235 @@
+# archive.py
+"""Archivo del historial por periodo: las filas viejas de logs y observaciones salen de la tabla
+"caliente" (CSV, Sheets o SQLite) a un archivo Feather por semestre, que se lee con memory map.
+
+    archive/<tabla>/<periodo>.feather   Arrow IPC sin comprimir, filas ordenadas por (id, timestamp)
+    archive/<tabla>/_manifest.json      por periodo: filas, rango de fechas e ids presentes
+
+Leer el historial viejo de un estudiante abre sólo los periodos donde aparece (según el manifiesto) y
+toma su tramo con una búsqueda binaria sobre la columna id, sin copiar el resto del archivo.
+La rotación es en dos pasos con un diario (_pending.json): primero los periodos nuevos quedan en .tmp,
+después se guarda la tabla caliente sin esas filas y al final se publican; si algo se corta en medio,
+`recover` termina o descarta según lo que haya quedado en la tabla caliente.
+
+    python archive.py rotate --days 365 [--table logs]
+    python archive.py info
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather   # pyarrow viene con streamlit
+
+TABLES = ("logs", "observaciones")
+INT_COLS = ("id", "delta_xp")
+MAX_OPEN = 32                        # periodos abiertos (memory map) a la vez
+
+
+def term_of(ts):
+    """Semestre 'AAAA-1' (enero-junio) o 'AAAA-2' de timestamps ISO (Serie de texto)."""
+    ts = pd.Series(ts, dtype=object).astype(str)
+    return ts.str[:4] + np.where(ts.str[5:7] <= "06", "-1", "-2")
+
+
+def _typed(df):
+    """id/delta_xp enteros, el resto texto: el esquema de un periodo no cambia entre rotaciones."""
+    out = df.copy()
+    for c in out.columns:
+        if c in INT_COLS: out[c] = pd.to_numeric(out[c], errors="coerce").fillna(0).astype("int64")
+        else: out[c] = out[c].fillna("").astype(str)
+    return out.reset_index(drop=True)
+
+
+class Archive:
+    def __init__(self, base_dir="archive"):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self._open = {}                  # ruta -> (mtime_ns, tabla Arrow mapeada)
+        self._manifests = {}             # tabla -> (mtime_ns, manifiesto, {periodo: set(ids)})
+
+    # ---- rutas ----
+    def _dir(self, table):
+        return os.path.join(self.base_dir, table)
+
+    def _path(self, table, term, tmp=False):
+        return os.path.join(self._dir(table), f"{term}.feather" + (".tmp" if tmp else ""))
+
+    def _file(self, table, name):
+        return os.path.join(self._dir(table), name)
+
+    # ---- manifiesto ----
+    def manifest(self, table) -> dict:
+        path = self._file(table, "_manifest.json")
+        try: mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError: return {}
+        with self._lock:
+            hit = self._manifests.get(table)
+            if hit and hit[0] == mtime: return hit[1]
+        with open(path, encoding="utf-8") as f: man = json.load(f)
+        with self._lock:
+            self._manifests[table] = (mtime, man, {t: set(m["ids"]) for t, m in man.items()})
+        return man
+
+    def terms(self, table, student_id=None) -> list:
+        """Periodos archivados (del más nuevo al más viejo); con `student_id`, sólo donde aparece."""
+        man = self.manifest(table)
+        if student_id is None: return sorted(man, reverse=True)
+        with self._lock:
+            ids = self._manifests.get(table, (None, None, {}))[2]
+        return sorted((t for t in man if int(student_id) in ids.get(t, ())), reverse=True)
+
+    def stats(self, table) -> dict:
+        man = self.manifest(table)
+        return {"terms": len(man), "rows": sum(m["rows"] for m in man.values()),
+                "bytes": sum(os.path.getsize(self._path(table, t)) for t in man if os.path.exists(self._path(table, t)))}
+
+    # ---- lectura ----
+    def _table(self, table, term) -> pa.Table:
+        path = self._path(table, term)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            hit = self._open.get(path)
+            if hit and hit[0] == mtime: return hit[1]
+        t = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()   # sin copia: las páginas se leen al usarlas
+        with self._lock:
+            if len(self._open) >= MAX_OPEN: self._open.pop(next(iter(self._open)))
+            self._open[path] = (mtime, t)
+        return t
+
+    def read_term(self, table, term) -> pd.DataFrame:
+        return self._table(table, term).to_pandas()
+
+    def read_student(self, table, student_id, terms=None) -> pd.DataFrame:
+        """Filas archivadas del estudiante (más recientes primero), leyendo sólo los periodos pedidos donde está."""
+        sid = int(student_id)
+        parts = []
+        for term in self.terms(table, sid):
+            if terms is not None and term not in terms: continue
+            t = self._table(table, term)
+            ids = t.column("id").to_numpy()
+            lo, hi = np.searchsorted(ids, sid, "left"), np.searchsorted(ids, sid, "right")
+            if hi > lo: parts.append(t.slice(lo, hi - lo).to_pandas())
+        if not parts: return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True).sort_values("timestamp", ascending=False, kind="stable")
+
+    # ---- escritura ----
+    def _pending(self, table):
+        return self._file(table, "_pending.json")
+
+    def stage(self, table, rows: pd.DataFrame, cutoff: str) -> list:
+        """Paso 1: funde `rows` con los periodos existentes en archivos .tmp y anota el diario. Devuelve periodos."""
+        os.makedirs(self._dir(table), exist_ok=True)
+        rows = _typed(rows)
+        terms = term_of(rows["timestamp"])
+        staged = []
+        for term, g in rows.groupby(terms.to_numpy(), sort=True):
+            path = self._path(table, term)
+            if os.path.exists(path):
+                g = pd.concat([self.read_term(table, term), g], ignore_index=True)
+            g = _typed(g).sort_values(["id", "timestamp"], kind="stable").reset_index(drop=True)
+            feather.write_feather(g, self._path(table, term, tmp=True), compression="uncompressed",
+                                  chunksize=max(1, len(g)))   # un solo bloque: la columna id queda contigua
+            staged.append(term)
+        with open(self._pending(table), "w", encoding="utf-8") as f:
+            json.dump({"cutoff": cutoff, "terms": staged}, f)
+        return staged
+
+    def publish(self, table):
+        """Paso 3: los .tmp pasan a ser los periodos y se actualiza el manifiesto."""
+        with open(self._pending(table), encoding="utf-8") as f: pend = json.load(f)
+        man = dict(self.manifest(table))
+        for term in pend["terms"]:
+            tmp, path = self._path(table, term, tmp=True), self._path(table, term)
+            if os.path.exists(tmp):
+                with self._lock: self._open.pop(path, None)
+                os.replace(tmp, path)
+            t = self._table(table, term)
+            ts = t.column("timestamp")
+            man[term] = {"rows": t.num_rows, "min_ts": pc.min(ts).as_py(), "max_ts": pc.max(ts).as_py(),
+                         "ids": np.unique(t.column("id").to_numpy()).tolist()}
+        path = self._file(table, "_manifest.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f: json.dump(man, f)
+        os.replace(path + ".tmp", path)
+        os.remove(self._pending(table))
+
+    def discard(self, table):
+        with open(self._pending(table), encoding="utf-8") as f: pend = json.load(f)
+        for term in pend["terms"]:
+            try: os.remove(self._path(table, term, tmp=True))
+            except FileNotFoundError: pass
+        os.remove(self._pending(table))
+
+    def recover(self, table, hot_df) -> str | None:
+        """Rotación cortada a medias: si la tabla caliente ya no tiene filas anteriores al corte se publica,
+        si no, se descarta (las filas siguen en la tabla caliente). Devuelve lo que hizo."""
+        if not os.path.exists(self._pending(table)): return None
+        with open(self._pending(table), encoding="utf-8") as f: cutoff = json.load(f)["cutoff"]
+        ts = hot_df["timestamp"].astype(str) if len(hot_df) else pd.Series(dtype=str)
+        if ((ts != "") & (ts < cutoff)).any():
+            self.discard(table); return "descartada"
+        self.publish(table); return "publicada"
+
+
+def rotate(stg, archive, table, days, now=None) -> int:
+    """Mueve al archivo las filas de `table` con más de `days` días. Devuelve cuántas filas movió
+    (0 también si otra escritura llegó en medio: se reintenta la próxima vez)."""
+    ver = stg.version(table)
+    hot = stg.read(table)
+    archive.recover(table, hot)
+    cutoff = ((now or datetime.now()) - timedelta(days=days)).isoformat(timespec="seconds")
+    ts = hot["timestamp"].fillna("").astype(str) if len(hot) else pd.Series(dtype=str)
+    old = ((ts != "") & (ts < cutoff) & pd.to_numeric(hot.get("id"), errors="coerce").notna()).to_numpy() \
+        if len(hot) else np.zeros(0, dtype=bool)
+    if not old.any(): return 0
+    if table == "logs":
+        # la foto de XP tiene que cubrir lo que sale de la tabla caliente (ver xp_events.py)
+        import xp_events
+        snaps = stg.read("xp_snapshots")
+        if xp_events.needs_advance(snaps, cutoff, hot[old]["id"]):
+            stg.save("xp_snapshots", xp_events.take_snapshot(hot, cutoff, base=snaps))
+    archive.stage(table, hot[old], cutoff)
+    if ver is None or stg.version(table) != ver:
+        archive.discard(table); return 0
+    try:
+        stg.save(table, hot[~old].reset_index(drop=True))
+    except Exception:
+        archive.discard(table)
+        raise
+    archive.publish(table)
+    return int(old.sum())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Archivo por periodo del historial (logs, observaciones)")
+    ap.add_argument("--dir", default=os.getenv("ARCHIVE_DIR", "archive"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("rotate", help="mueve al archivo las filas más viejas que --days")
+    rp.add_argument("--days", type=int, required=True)
+    rp.add_argument("--table", choices=TABLES, action="append")
+    sub.add_parser("info", help="periodos, filas y tamaño por tabla")
+    a = ap.parse_args(argv)
+    arch = Archive(a.dir)
+    if a.cmd == "info":
+        for t in TABLES:
+            s = arch.stats(t)
+            print(f"{t}: {s['terms']} periodo(s), {s['rows']:,} fila(s), {s['bytes'] / 1e6:.1f} MB — {', '.join(arch.terms(t)) or '—'}")
+        return 0
+    logging.disable(logging.WARNING)   # streamlit fuera de `streamlit run` avisa en cada acceso a secrets/caché
+    from data_layer import storage
+    stg = storage()
+    for t in a.table or TABLES:
+        n = rotate(stg, arch, t, a.days)
+        print(f"[OK] {t}: {n:,} fila(s) archivadas; quedan {len(stg.read(t)):,} en la tabla caliente")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+# att_calendar.py
+"""Calendario de asistencia como un único componente.
+
+Los clics alternan el estado de cada día en el navegador; al guardar (o al cambiar de mes) se envía
+un solo evento con el diff del mes, que la app escribe de una vez.
+"""
+import calendar
+import hashlib
+import json
+import os
+
+import streamlit.components.v1 as components
+
+_FRONTEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "att_calendar_frontend")
+_component = components.declare_component("att_calendar", path=_FRONTEND)
+
+
+def att_calendar(y: int, m: int, states: dict, order, icons, title: str, disabled=False, key=None):
+    """Dibuja el mes y devuelve el último evento o None.
+
+    states: {día: estado} con los valores guardados; order/icons: ciclo de estados y su ícono.
+    Evento: {"nonce", "y", "m", "changes": {"día": estado|None}, "nav": -1|0|1}
+    """
+    states = {str(int(d)): s for d, s in states.items()}
+    pad, days = calendar.monthrange(y, m)
+    rev = hashlib.sha1(json.dumps([y, m, sorted(states.items())]).encode()).hexdigest()[:12]
+    return _component(y=y, m=m, states=states, order=list(order), icons=list(icons), title=title,
+                      pad=pad, days=days, rev=rev, read_only=disabled, key=key, default=None)
@@ -0,0 +1,170 @@
+# attendance_stats.py
+import numpy as np
+import pandas as pd
+
+from attendance_store import CODES
+
+KINDS = ("P", "T", "A")
+
+
+def month_label(ym: int) -> str:
+    return f"{ym // 12}-{ym % 12 + 1:02d}"
+
+
+def _rates(counts: np.ndarray) -> dict:
+    """Columnas de resumen desde conteos (..., 3): asistencia = (P+T)/días marcados, atraso = T/(P+T)."""
+    p, t, a = counts[..., 0], counts[..., 1], counts[..., 2]
+    days, present = p + t + a, p + t
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"P": p, "T": t, "A": a, "dias": days,
+                "asistencia": np.where(days > 0, present / days, np.nan),
+                "atraso": np.where(present > 0, t / present, np.nan)}
+
+
+class AttendanceStats:
+    """Agregados materializados de asistencia: conteos P/T/A por estudiante y mes y por colegio + grupo y mes.
+
+    Se arman una vez desde el AttendanceStore (un reduceat por año, sin recorrer filas); después cada
+    marca cambiada suma y resta en las dos tablas (`apply`) y un cambio de colegio o grupo en la tabla
+    de estudiantes sólo reagrupa (`regroup`), sin volver a leer la asistencia. Los meses son enteros
+    año * 12 + (mes - 1), en años completos.
+    """
+
+    def __init__(self, store, students_df: pd.DataFrame):
+        self.versions = {}                 # tabla -> versión de los datos con que está al día
+        keys, counts = store.month_totals()
+        ids = np.unique(np.concatenate([keys[:, 0], self._normalize(students_df).index.to_numpy()]))
+        self._ids = ids.tolist()
+        self._sidx = {int(i): n for n, i in enumerate(self._ids)}
+        years = keys[:, 1] if len(keys) else np.array([pd.Timestamp.today().year])
+        self._m0 = int(years.min()) * 12
+        n_months = (int(years.max()) + 1) * 12 - self._m0
+        self._S = np.zeros((len(self._ids), n_months, 3), dtype=np.int32)
+        if len(keys):
+            rows = np.searchsorted(ids, keys[:, 0])
+            cols = (keys[:, 1] * 12 - self._m0)[:, None] + np.arange(12)
+            self._S[rows[:, None], cols] = counts
+        self.regroup(students_df)
+
+    @staticmethod
+    def _normalize(df):
+        df = df.copy()
+        df["id"] = pd.to_numeric(df["id"], errors="coerce")
+        df = df[df["id"].notna()].drop_duplicates("id", keep="first")
+        text = lambda c: df[c].fillna("").astype(str).to_numpy() if c in df else ""
+        return pd.DataFrame({"name": text("name"), "grupo": text("grupo"),
+                             "colegio_id": pd.to_numeric(df.get("colegio_id"), errors="coerce").fillna(0).astype(int).to_numpy()},
+                            index=df["id"].astype(int).to_numpy())
+
+    # ---- mutaciones ----
+    def regroup(self, students_df: pd.DataFrame):
+        """Recalcula la tabla por colegio + grupo desde la de estudiantes (p. ej. si alguien cambió de grupo)."""
+        df = self._normalize(students_df)
+        for sid in df.index.difference(pd.Index(self._ids)):
+            self._add_student(int(sid))
+        self._students = df.reindex(self._ids)
+        known = self._students["colegio_id"].notna().to_numpy()
+        groups = self._students[known][["colegio_id", "grupo"]].astype({"colegio_id": int}).drop_duplicates()
+        self._groups = groups.sort_values(["colegio_id", "grupo"]).reset_index(drop=True)
+        gidx = np.full(len(self._ids), -1)
+        gidx[known] = pd.MultiIndex.from_frame(self._groups).get_indexer(
+            pd.MultiIndex.from_frame(self._students[known][["colegio_id", "grupo"]].astype({"colegio_id": int})))
+        self._gidx = gidx
+        self._G = np.zeros((len(self._groups), self._S.shape[1], 3), dtype=np.int64)
+        np.add.at(self._G, gidx[known], self._S[known])
+
+    def _add_student(self, sid):
+        self._sidx[sid] = len(self._ids); self._ids.append(sid)
+        self._S = np.concatenate([self._S, np.zeros((1,) + self._S.shape[1:], dtype=self._S.dtype)])
+        if hasattr(self, "_gidx"):
+            self._gidx = np.append(self._gidx, -1)
+            self._students.loc[sid] = ["", "", np.nan]
+
+    def _month(self, day):
+        ym = day.year * 12 + day.month - 1
+        if ym < self._m0 or ym >= self._m0 + self._S.shape[1]:   # año nuevo: se agregan años enteros
+            lo, hi = min(self._m0, day.year * 12), max(self._m0 + self._S.shape[1], (day.year + 1) * 12)
+            pad = ((0, 0), (self._m0 - lo, hi - self._m0 - self._S.shape[1]), (0, 0))
+            self._S, self._G = np.pad(self._S, pad), np.pad(self._G, pad)
+            self._m0 = lo
+        return ym - self._m0
+
+    def apply(self, student_id, changes):
+        """Aplica [(día, estado anterior, estado nuevo)] de un estudiante, ya escritos en la tabla."""
+        sid = int(student_id)
+        if sid not in self._sidx: self._add_student(sid)
+        i = self._sidx[sid]
+        for day, prev, new in changes:
+            m = self._month(day)
+            for status, sign in ((prev, -1), (new, 1)):
+                k = CODES.get(status, 0) - 1
+                if k < 0: continue
+                self._S[i, m, k] += sign
+                if self._gidx[i] >= 0: self._G[self._gidx[i], m, k] += sign
+
+    # ---- consultas ----
+    def months(self) -> list:
+        """Meses con alguna marca (del más viejo al más nuevo)."""
+        m = np.flatnonzero(self._G.sum(axis=(0, 2)) if len(self._G) else self._S.sum(axis=(0, 2)))
+        return [self._m0 + int(x) for x in m]
+
+    def _window(self, start=None, end=None):
+        lo = 0 if start is None else max(0, start - self._m0)
+        hi = self._S.shape[1] if end is None else max(lo, min(self._S.shape[1], end - self._m0 + 1))
+        return slice(lo, hi)
+
+    def _scope(self, colegio_id=None, grupo=None):
+        g = self._groups
+        mask = np.ones(len(g), dtype=bool)
+        if colegio_id is not None: mask &= (g["colegio_id"] == int(colegio_id)).to_numpy()
+        if grupo: mask &= (g["grupo"] == str(grupo)).to_numpy()
+        return mask
+
+    def summary(self, by="colegio", colegio_id=None, start=None, end=None) -> pd.DataFrame:
+        """Una fila por colegio (by="colegio") o por grupo dentro del alcance, con conteos y tasas."""
+        mask = self._scope(colegio_id)
+        g = self._groups[mask]
+        tot = self._G[mask, self._window(start, end)].sum(axis=1)
+        keys = ["colegio_id"] if by == "colegio" else ["colegio_id", "grupo"]
+        agg = pd.DataFrame(tot, columns=list(KINDS), index=pd.MultiIndex.from_frame(g)).groupby(level=keys).sum()
+        out = pd.DataFrame(_rates(agg.to_numpy()), index=agg.index).reset_index()
+        return out[out["dias"] > 0].reset_index(drop=True)
+
+    def monthly(self, colegio_id=None, grupo=None, start=None, end=None) -> pd.DataFrame:
+        """Tendencia mes a mes del alcance: conteos, asistencia y atraso."""
+        w = self._window(start, end)
+        tot = self._G[self._scope(colegio_id, grupo), w].sum(axis=0)
+        out = pd.DataFrame(_rates(tot))
+        out.insert(0, "mes", [month_label(self._m0 + m) for m in range(w.start, w.stop)])
+        return out[out["dias"] > 0].reset_index(drop=True)
+
+    def pivot(self, colegio_id=None, start=None, end=None) -> pd.DataFrame:
+        """Asistencia por grupo (filas) y mes (columnas) dentro del alcance."""
+        mask = self._scope(colegio_id)
+        w = self._window(start, end)
+        sub = self._G[mask, w]
+        g = self._groups[mask]
+        idx = g["grupo"] if colegio_id is not None else g["colegio_id"].astype(str) + " · " + g["grupo"]
+        rate = _rates(sub)["asistencia"]
+        cols = [month_label(self._m0 + m) for m in range(w.start, w.stop)]
+        out = pd.DataFrame(rate, index=idx.to_numpy(), columns=cols)
+        return out.loc[:, out.notna().any(axis=0)]
+
+    def chronic(self, colegio_id=None, grupo=None, start=None, end=None, threshold=0.10, min_days=10) -> pd.DataFrame:
+        """Estudiantes con ausentismo crónico en la ventana: faltas / días marcados >= threshold."""
+        tot = self._S[:, self._window(start, end)].sum(axis=1)
+        r = _rates(tot)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            absent = np.where(r["dias"] > 0, r["A"] / r["dias"], 0.0)
+        info = self._students
+        mask = (self._gidx >= 0) & (r["dias"] >= min_days) & (absent >= threshold)
+        if colegio_id is not None: mask &= (info["colegio_id"] == int(colegio_id)).to_numpy()
+        if grupo: mask &= (info["grupo"] == str(grupo)).to_numpy()
+        out = pd.DataFrame({"id": np.array(self._ids)[mask], "name": info["name"].to_numpy()[mask],
+                            "colegio_id": info["colegio_id"].to_numpy()[mask].astype(int), "grupo": info["grupo"].to_numpy()[mask],
+                            "A": r["A"][mask], "dias": r["dias"][mask], "ausencia": absent[mask], "atraso": r["atraso"][mask]})
+        return out.sort_values(["ausencia", "A"], ascending=False, kind="stable").reset_index(drop=True)
+
+    def grupos(self, colegio_id=None):
+        g = self._groups[self._scope(colegio_id)]["grupo"]
+        return sorted({x for x in g if x})
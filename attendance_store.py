@@ -0,0 +1,185 @@
+# attendance_store.py
+import calendar
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+STATES = (None, "P", "T", "A")            # código 0..3 (2 bits por día)
+CODES  = {None: 0, "P": 1, "T": 2, "A": 3}
+DAYS   = 368                              # 366 días redondeado a múltiplo de 4
+BYTES  = DAYS // 4                        # 92 bytes por (estudiante, año)
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+def _pack(codes: np.ndarray) -> np.ndarray:
+    """(n, 368) códigos 0..3 -> (n, 92) bytes."""
+    c = codes.reshape(len(codes), BYTES, 4).astype(np.uint8)
+    return (c[:, :, 0] | (c[:, :, 1] << 2) | (c[:, :, 2] << 4) | (c[:, :, 3] << 6)).astype(np.uint8)
+
+
+def _unpack(bits: np.ndarray) -> np.ndarray:
+    """(n, 92) bytes -> (n, 368) códigos 0..3."""
+    return ((bits[:, :, None] >> _SHIFTS) & 3).reshape(len(bits), DAYS)
+
+
+class AttendanceStore:
+    """Asistencia empaquetada: un arreglo de 2 bits por día para cada (estudiante, año).
+
+    Lectura y escritura de una celda son O(1); los resúmenes de mes se calculan vectorizados.
+    `from_frame` / `to_frame` convierten desde y hacia el formato de filas (id, date, status);
+    las filas que no encajan (estado desconocido como "L", fecha vacía) se guardan tal cual aparte
+    para no perderlas en el viaje, y las columnas extra de las filas empaquetadas (p. ej. y, m, d) se
+    guardan por (id, date) y vuelven en `to_frame`; un día marcado después queda con ellas vacías.
+    `to_frame` respeta el orden de filas del frame original; los días marcados después van al final.
+    """
+
+    def __init__(self):
+        self._rows = {}                                  # (id, año) -> fila en _bits
+        self._keys = []                                  # fila -> (id, año)
+        self._bits = np.zeros((0, BYTES), dtype=np.uint8)
+        self._other = []                                 # filas crudas (dict) no representables
+        self._other_pos = []                             # posición de cada fila cruda en el frame original
+        self._extra = None                               # columnas extra por (id, date), o None
+        self._order = None                               # (id, date, _pos): primera posición de cada día marcado
+
+    def __len__(self):
+        return int(np.count_nonzero(_unpack(self._bits[:len(self._keys)]))) if self._keys else 0
+
+    # ---- construcción / exportación ----
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "AttendanceStore":
+        store = cls()
+        if df is None or df.empty or not {"id", "date", "status"} <= set(df.columns):
+            return store
+        ids = pd.to_numeric(df["id"], errors="coerce")
+        days = pd.to_datetime(df["date"].astype(str), format="%Y-%m-%d", errors="coerce")
+        codes = df["status"].map(CODES)
+        ok = ids.notna() & days.notna() & codes.notna() & (codes > 0)
+        empty = df["status"].isna() | (df["status"].astype(str) == "")
+        raw = (~ok & ~(empty & days.notna())).to_numpy()
+        store._other = df[raw].to_dict("records")
+        store._other_pos = np.flatnonzero(raw).tolist()
+        if not ok.any():
+            return store
+        sub = pd.DataFrame({"id": ids[ok].astype(int), "year": days[ok].dt.year,
+                            "doy": days[ok].dt.dayofyear - 1, "code": codes[ok].astype(np.uint8)})
+        keys = sub[["id", "year"]].drop_duplicates().reset_index(drop=True)
+        key_idx = pd.MultiIndex.from_frame(keys).get_indexer(pd.MultiIndex.from_frame(sub[["id", "year"]]))
+        codes_m = np.zeros((len(keys), DAYS), dtype=np.uint8)
+        codes_m[key_idx, sub["doy"].to_numpy()] = sub["code"].to_numpy()   # duplicados: gana la última fila
+        store._order = pd.DataFrame({"id": sub["id"], "date": days[ok].dt.strftime("%Y-%m-%d"), "_pos": np.flatnonzero(ok)}) \
+            .drop_duplicates(["id", "date"], keep="first").reset_index(drop=True)
+        extra = [c for c in df.columns if c not in ("id", "date", "status")]
+        if extra:
+            store._extra = df.loc[ok, extra].assign(id=sub["id"], date=days[ok].dt.strftime("%Y-%m-%d")) \
+                .drop_duplicates(["id", "date"], keep="last")[["id", "date"] + extra].reset_index(drop=True)
+        store._bits = _pack(codes_m)
+        store._keys = [(int(i), int(y)) for i, y in keys.itertuples(index=False)]
+        store._rows = {k: n for n, k in enumerate(store._keys)}
+        return store
+
+    def to_frame(self) -> pd.DataFrame:
+        n = len(self._keys)
+        other = pd.DataFrame(self._other, columns=None if self._other else ["id", "date", "status"])
+        other["_pos"] = pd.Series(self._other_pos, dtype="float64")
+        if n == 0:
+            return self._in_order(other)
+        codes = _unpack(self._bits[:n])
+        r, doy = np.nonzero(codes)
+        keys = np.array(self._keys, dtype=np.int64).reshape(n, 2)
+        base = (keys[r, 1] - 1970).astype("datetime64[Y]").astype("datetime64[D]")
+        out = pd.DataFrame({
+            "id": keys[r, 0],
+            "date": np.datetime_as_string(base + doy.astype("timedelta64[D]"), unit="D"),
+            "status": np.array(STATES, dtype=object)[codes[r, doy]],
+        })
+        if self._extra is not None:
+            out = out.merge(self._extra, on=["id", "date"], how="left")
+        out = out.merge(self._order, on=["id", "date"], how="left") if self._order is not None else out.assign(_pos=np.nan)
+        if len(other):
+            out = pd.concat([out, other], ignore_index=True)
+        return self._in_order(out)
+
+    @staticmethod
+    def _in_order(df):
+        """Orden del frame original (_pos); lo que no estaba, al final por (id, date)."""
+        df = df.sort_values(["id", "date"], kind="stable").sort_values("_pos", kind="stable", na_position="last")
+        return df.drop(columns="_pos").reset_index(drop=True)
+
+    # ---- celdas ----
+    def _row(self, student_id: int, year: int, create=False):
+        key = (int(student_id), int(year))
+        n = self._rows.get(key)
+        if n is None and create:
+            n = len(self._keys)
+            if n == len(self._bits):   # crecer con capacidad doble
+                grown = np.zeros((max(8, 2 * n), BYTES), dtype=np.uint8)
+                grown[:n] = self._bits[:n]
+                self._bits = grown
+            self._keys.append(key); self._rows[key] = n
+        return n
+
+    def get(self, student_id: int, day: date):
+        n = self._row(student_id, day.year)
+        if n is None:
+            return None
+        doy = day.timetuple().tm_yday - 1
+        return STATES[(int(self._bits[n, doy >> 2]) >> ((doy & 3) * 2)) & 3]
+
+    def has_raw_row(self, student_id: int, day: date) -> bool:
+        """¿Hay una fila no representable para ese día? (al marcarlo hay que reescribir, no agregar)"""
+        iso = day.isoformat()
+        return any(str(r.get("date")) == iso and pd.to_numeric(r.get("id"), errors="coerce") == int(student_id)
+                   for r in self._other)
+
+    def set(self, student_id: int, day: date, status):
+        """Marca el día y devuelve el estado anterior."""
+        code = CODES.get(status if status != "" else None, 0)
+        if self._other:   # marcar una celda reemplaza cualquier fila vieja de ese día
+            iso = day.isoformat()
+            kept = [(r, p) for r, p in zip(self._other, self._other_pos)
+                    if not (str(r.get("date")) == iso and pd.to_numeric(r.get("id"), errors="coerce") == int(student_id))]
+            self._other, self._other_pos = [r for r, _ in kept], [p for _, p in kept]
+        n = self._row(student_id, day.year, create=code != 0)
+        if n is None:
+            return None
+        doy = day.timetuple().tm_yday - 1
+        byte, shift = doy >> 2, (doy & 3) * 2
+        cur = int(self._bits[n, byte])
+        self._bits[n, byte] = (cur & ~(3 << shift) & 0xFF) | (code << shift)
+        return STATES[(cur >> shift) & 3]
+
+    # ---- meses ----
+    def month_codes(self, student_id: int, y: int, m: int) -> np.ndarray:
+        """Códigos 0..3 de cada día del mes (índice 0 = día 1)."""
+        days_in_m = calendar.monthrange(y, m)[1]
+        n = self._row(student_id, y)
+        if n is None:
+            return np.zeros(days_in_m, dtype=np.uint8)
+        start = date(y, m, 1).timetuple().tm_yday - 1
+        return _unpack(self._bits[n:n + 1])[0, start:start + days_in_m]
+
+    def month_map(self, student_id: int, y: int, m: int) -> dict:
+        codes = self.month_codes(student_id, y, m)
+        return {int(d) + 1: STATES[codes[d]] for d in np.flatnonzero(codes)}
+
+    def month_counts(self, student_id: int, y: int, m: int) -> dict:
+        cnt = np.bincount(self.month_codes(student_id, y, m), minlength=4)
+        return {"P": int(cnt[1]), "T": int(cnt[2]), "A": int(cnt[3])}
+
+    def month_totals(self):
+        """Conteos P/T/A por mes de todas las filas a la vez: (claves (n, 2) id/año, conteos (n, 12, 3))."""
+        n = len(self._keys)
+        keys = np.array(self._keys, dtype=np.int64).reshape(n, 2)
+        out = np.zeros((n, 12, 3), dtype=np.int32)
+        if n == 0:
+            return keys, out
+        codes = _unpack(self._bits[:n])
+        for leap in (False, True):
+            rows = np.flatnonzero(np.array([calendar.isleap(y) for y in keys[:, 1]]) == leap)
+            if not len(rows): continue
+            starts = np.array([date(2000 if leap else 2001, m, 1).timetuple().tm_yday - 1 for m in range(1, 13)])
+            for k in (1, 2, 3):   # los días sobrantes (después del 31/12) siempre están en 0
+                out[rows, :, k - 1] = np.add.reduceat(codes[rows] == k, starts, axis=1, dtype=np.int32)
+        return keys, out
@@ -0,0 +1,251 @@
+# bench.py
+"""Benchmarks de los caminos calientes de datos y dibujo sobre un conjunto sintético (synth_data.py).
+
+Usa las funciones reales de app.py (todo lo definido antes de "App state", sin levantar la UI) con
+un almacenamiento CSV apuntando a una copia temporal de la carpeta, así que los datos generados no
+se modifican. Cada caso se calienta una vez y se repite; el informe JSON guarda mediana, p95, mínimo
+y máximo en ms más el entorno (versiones, commit, tamaños), para comparar corridas:
+
+    python synth_data.py .bench/grande --preset grande
+    python bench.py .bench/grande --out .bench/base.json
+    python bench.py .bench/grande --out .bench/nuevo.json --compare .bench/base.json   # sale con 1 si empeora
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import PIL
+
+logging.disable(logging.WARNING)   # streamlit fuera de `streamlit run` avisa en cada acceso a secrets/caché
+from data_layer import CsvBackend, Storage, CACHE_POLICY
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_MARK = "# ===== App state ====="
+
+
+def load_app(stg):
+    """Funciones de app.py (hasta APP_MARK) con `storage()` reemplazado por `stg`."""
+    with open(os.path.join(HERE, "app.py"), encoding="utf-8") as f:
+        code = f.read()
+    A = {"__name__": "app_bench", "__file__": os.path.join(HERE, "app.py")}
+    exec(compile(code[:code.index(APP_MARK)], "app.py", "exec"), A)
+    A["storage"] = lambda: stg
+    return A
+
+
+def _timeit(fn, repeat, setup=None):
+    """Una vuelta de calentamiento + `repeat` medidas (ms). `setup` corre antes de cada una, fuera del tiempo."""
+    if setup: setup()
+    fn()
+    out = []
+    for _ in range(repeat):
+        if setup: setup()
+        t = time.perf_counter(); fn(); out.append((time.perf_counter() - t) * 1000)
+    return out
+
+
+def _summary(ms, ops=1):
+    ms_sorted = sorted(ms)
+    return {"n": len(ms), "ops": ops, "median_ms": round(statistics.median(ms), 3),
+            "p95_ms": round(ms_sorted[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))], 3),
+            "min_ms": round(ms_sorted[0], 3), "max_ms": round(ms_sorted[-1], 3),
+            "per_op_us": round(statistics.median(ms) * 1000 / ops, 2)}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def run(data_dir, repeat=20, seed=1, only=None, backend="csv", latency_ms=0.0, log=print):
+    """Corre los casos sobre una copia de `data_dir`. Devuelve el informe (dict).
+
+    backend "fake_sheets": las tablas van a Sheets simulado (fake_sheets.py) con `latency_ms` por llamada,
+    y cada caso informa además cuántas llamadas a la API hace por repetición.
+    """
+    work = tempfile.mkdtemp(prefix="bench-")
+    try:
+        for f in os.listdir(data_dir):
+            if f.endswith(".csv"): shutil.copy2(os.path.join(data_dir, f), work)
+        api = None
+        if backend == "fake_sheets":
+            import fake_sheets
+            api = fake_sheets.FakeSheetsAPI(latency=latency_ms / 1000)
+            stg = Storage(fake_sheets.backend(api, work), CsvBackend(work), CACHE_POLICY)
+        else:
+            stg = Storage(CsvBackend(work), None, CACHE_POLICY)
+        A = load_app(stg)
+        rnd = random.Random(seed)
+        students = stg.read("students")
+        colegios = stg.read("colegios")
+        ms = A["load_milestones"]()["milestones"]
+        ids = students["id"].astype(int).tolist()
+        names = dict(zip(students["id"].astype(int), students["name"]))
+        meta = {}
+        try:
+            with open(os.path.join(data_dir, "synth.json"), encoding="utf-8") as f: meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        last_year = date.today().year
+        years = list(range(last_year - int(meta.get("years", 1)) + 1, last_year + 1))
+        results = {}
+
+        def case(name, fn, ops=1, setup=None, n=repeat):
+            if only and name not in only: return
+            t = time.perf_counter(); start = len(api.ledger) if api else 0
+            results[name] = r = _summary(_timeit(fn, n, setup), ops)
+            if api: r["api_calls"] = round((len(api.ledger) - start) / (n + 1), 2)
+            log(f"  {name:<28} mediana {r['median_ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f} ms"
+                f"{'   api ' + format(r['api_calls'], 'g') if api else ''}   ({time.perf_counter() - t:.1f}s)")
+
+        # ---- datos ----
+        case("load_students_csv", lambda: stg.read("students"), setup=lambda: stg.invalidate("students"),
+             n=max(3, repeat // 4))
+        case("logs_index_build", lambda: A["_hist_index"]("logs"), setup=lambda: A["_hist_store"]().pop("logs", None),
+             n=3)
+        sids = [rnd.choice(ids) for _ in range(50)]
+        case("recent_logs_for", lambda: [A["recent_logs_for"](s) for s in sids], ops=len(sids))
+        def log_one():
+            s = rnd.choice(ids); A["append_log"](s, names[s], 5, "bench")
+        case("append_log", log_one)
+
+        case("attendance_store_build", lambda: A["_att_store"](),
+             setup=lambda: A["_att_holder"]().update(store=None, version=None), n=3)
+        # marca nueva (día sin dato): camino de agregar filas
+        first_free = date(last_year + 1, 1, 1).toordinal()
+        seq = iter(range(10**6))
+        def mark_new():
+            d = date.fromordinal(first_free + next(seq))
+            A["set_attendance"](rnd.choice(ids), d.year, d.month, d.day, "P")
+        case("set_attendance", mark_new)
+        # cambio de una marca existente: con CSV reescribe la tabla
+        def change():
+            s = rnd.choice(ids); d = A["_att_store"]().month_map(s, last_year, 3)
+            day = next(iter(d), 1)
+            A["set_attendance"](s, last_year, 3, day, A["cycle_state"](d.get(day)) or "P")
+        case("set_attendance_change", change, n=3)
+        months = [(rnd.choice(ids), rnd.choice(years), rnd.randint(1, 12)) for _ in range(200)]
+        case("att_map_for_month", lambda: [A["att_map_for_month"](*a) for a in months], ops=len(months))
+        # agregados de la vista Asistencia: armado, consulta del tablero y marca con los agregados al día
+        case("att_stats_build", lambda: A["attendance_query"](lambda s: s),
+             setup=lambda: A["_att_stats_holder"]().update(stats=None), n=3)
+        case("att_stats_dashboard", lambda: A["attendance_query"](lambda s: (s.monthly(), s.summary(), s.pivot(), s.chronic())))
+        case("set_attendance_with_stats", mark_new)
+
+        # ---- ranking ----
+        logs_df = stg.read("logs")
+        week = A["week_start"]()
+        from leaderboard import Leaderboard
+        case("leaderboard_build", lambda: Leaderboard(students, logs_df, week), n=max(3, repeat // 4))
+        board = Leaderboard(students, logs_df, week)
+        moved = students.copy()
+        def bump():
+            moved.loc[rnd.randrange(len(moved)), "xp"] += 5; board.update_students(moved)
+        case("leaderboard_update", bump)
+        case("leaderboard_add_log", lambda: board.add_logs([{"timestamp": A["now_iso"](), "id": rnd.choice(ids), "delta_xp": 5}]))
+        cids = colegios["id"].astype(int).tolist()
+        case("leaderboard_top", lambda: board.top(25, "week", rnd.choice(cids)))
+
+        # ---- XP desde el historial ----
+        import xp_events
+        case("xp_replay_full", lambda: xp_events.replay(logs_df), n=max(3, repeat // 4))
+        snap = xp_events.take_snapshot(logs_df, logs_df["timestamp"].astype(str).quantile(0.9, interpolation="lower")
+                                       if len(logs_df) else None)
+        ordered = logs_df["timestamp"].astype(str).is_monotonic_increasing   # lo que sabe el índice del historial
+        case("xp_replay_snapshot", lambda: xp_events.replay(logs_df, snap, ordered), n=max(3, repeat // 4))
+
+        # ---- cálculo y dibujo ----
+        xps = students["xp"].astype(int).tolist()
+        case("compute_level", lambda: [A["compute_level"](x, ms) for x in xps], ops=len(xps))
+        case("compute_levels", lambda: A["compute_levels"](xps, ms), ops=len(xps))
+        case("student_levels_cached", lambda: A["student_levels"](students, ms))
+        bars = [(rnd.random(), m.get("color", "#46A0FF")) for m in ms for _ in range(8)]
+        from render import _bar_image, pixel_overlay_bar_image
+        bar = lambda: [pixel_overlay_bar_image(p, width=460, height=18, color_hex=c) for p, c in bars]
+        case("pixel_overlay_bar_image", bar, ops=len(bars), setup=_bar_image.cache_clear)
+        case("pixel_overlay_bar_image_warm", bar, ops=len(bars))
+        from render import compose_map
+        case("compose_map", lambda: compose_map(A["MAP_IMG"], colegios), n=max(3, repeat // 4))
+        case("composed_map_cached", lambda: A["composed_map"](colegios))
+
+        # ---- archivo (al final: la rotación deja la tabla caliente chica) ----
+        if not only or only & {"archive_rotate", "archive_read_student", "load_logs_hot"}:
+            from archive import Archive, rotate
+            arch = Archive(os.path.join(work, "archive"))
+            t = time.perf_counter(); moved = rotate(stg, arch, "logs", 365)
+            results["archive_rotate"] = r = {"n": 1, "ops": moved, "median_ms": round((time.perf_counter() - t) * 1000, 3)}
+            log(f"  {'archive_rotate':<28} {moved:,} filas en {r['median_ms'] / 1000:.1f}s")
+            case("archive_read_student", lambda: [arch.read_student("logs", s) for s in sids], ops=len(sids))
+            case("load_logs_hot", lambda: stg.read("logs"), setup=lambda: stg.invalidate("logs"), n=max(3, repeat // 4))
+
+        return {"meta": {"when": pd.Timestamp.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+                         "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+                         "pillow": PIL.__version__, "machine": platform.machine(), "data_dir": os.path.abspath(data_dir),
+                         "sizes": meta.get("sizes", {}), "repeat": repeat, "backend": backend,
+                         "latency_ms": latency_ms if api else None},
+                "results": results}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def compare(report, baseline, threshold=1.25):
+    """Razón de medianas contra `baseline` por caso; `regression` si empeoró más de `threshold` veces."""
+    out = []
+    for name, r in report["results"].items():
+        b = baseline.get("results", {}).get(name)
+        if not b or not b["median_ms"]: continue
+        ratio = r["median_ms"] / b["median_ms"]
+        out.append({"case": name, "base_ms": b["median_ms"], "ms": r["median_ms"], "ratio": round(ratio, 2),
+                    "regression": ratio > threshold})
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks de app.py sobre datos sintéticos")
+    ap.add_argument("data_dir")
+    ap.add_argument("--out", default="bench_report.json")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--only", nargs="*", help="nombres de casos a correr")
+    ap.add_argument("--backend", choices=["csv", "fake_sheets"], default="csv")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latencia por llamada con fake_sheets")
+    ap.add_argument("--compare", help="informe anterior para detectar regresiones")
+    ap.add_argument("--threshold", type=float, default=1.25, help="razón de mediana que cuenta como regresión")
+    a = ap.parse_args(argv)
+    os.chdir(HERE)   # assets/ y milestones.json relativos al repo
+    print(f"Benchmarks sobre {a.data_dir} (x{a.repeat}, {a.backend})")
+    report = run(a.data_dir, a.repeat, only=set(a.only) if a.only else None, backend=a.backend,
+                 latency_ms=a.latency_ms)
+    rc = 0
+    if a.compare:
+        with open(a.compare, encoding="utf-8") as f:
+            cmp = compare(report, json.load(f), a.threshold)
+        report["compare"] = {"baseline": a.compare, "threshold": a.threshold, "cases": cmp}
+        print(f"Comparación con {a.compare}:")
+        for c in cmp:
+            flag = "  <-- REGRESIÓN" if c["regression"] else ""
+            print(f"  {c['case']:<28} {c['base_ms']:>10.3f} -> {c['ms']:>10.3f} ms  x{c['ratio']}{flag}")
+        rc = 1 if any(c["regression"] for c in cmp) else 0
+    os.makedirs(os.path.dirname(os.path.abspath(a.out)), exist_ok=True)
+    with open(a.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[OK] informe -> {a.out}")
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+# bulk.py
+"""Importación y exportación masiva de estudiantes, logs, observaciones y asistencia, por trozos.
+
+    python bulk.py import students nuevos.csv [--chunk 5000] [--dry-run] [--skip-invalid]
+    python bulk.py export logs logs.csv [--with-archive]
+
+Importar pasa dos veces por el archivo, sin cargarlo entero:
+    1. valida cada fila contra el esquema de data_layer (mismas columnas y tipos que normaliza la carga de
+       estudiantes); si hay filas malas no se escribe nada, salvo con --skip-invalid. Las rechazadas quedan
+       en <archivo>.rechazadas.csv con el motivo.
+    2. escribe trozo a trozo: logs y observaciones se agregan; en students y attendance las claves nuevas
+       se agregan y las existentes se actualizan sólo en las columnas del archivo (SQLite: UPSERT por
+       trozo; CSV y Sheets: un solo guardado al final, que en Sheets manda sólo las celdas cambiadas).
+       Una celda vacía no cambia el valor actual; en una fila nueva toma el valor por defecto del esquema.
+Contra Sheets cada llamada lleva a lo más SHEETS_BATCH_CELLS celdas, las llamadas se espacian para no pasar
+la cuota por minuto (--rate) y un 429 se reintenta con espera exponencial. Los logs con fecha anterior a
+la foto de XP (xp_snapshots) se suman a la foto, así el XP derivado del historial sigue cuadrando.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.disable(logging.WARNING)   # streamlit fuera de `streamlit run` avisa en cada acceso a secrets/caché
+from data_layer import TABLES, CLEAN, CsvBackend, SqliteBackend, SheetsBackend, io_calls
+import xp_events
+
+IO_TABLES = ("students", "logs", "observaciones", "attendance")
+REQUIRED = {"students": ["id", "name"], "logs": ["timestamp", "id", "delta_xp"],
+            "observaciones": ["timestamp", "id", "observacion"], "attendance": ["id", "date", "status"]}
+INTS = {"students": ["xp", "colegio_id", "xp_delta"], "logs": ["delta_xp"]}   # además de id
+SHEETS_BATCH_CELLS = 40_000        # celdas por llamada (la API recomienda cuerpos de no más de ~2 MB)
+SHEETS_RATE = 50                   # llamadas por minuto contra Sheets (la cuota es 60 por usuario)
+
+
+# ===== Validación =====
+def check_header(table, cols):
+    """(columnas obligatorias que faltan, columnas que no son del esquema y se ignoran)"""
+    known = TABLES[table]["cols"]
+    return [c for c in REQUIRED[table] if c not in cols], [c for c in cols if c not in known]
+
+
+def validate(table, df):
+    """Trozo leído como texto -> (filas válidas con tipos del esquema, filas rechazadas con columna 'error').
+    Las celdas enteras vacías quedan como <NA> (sin valor), no como 0."""
+    raw, err = df, pd.Series("", index=df.index, dtype=object)
+    def flag(mask, msg):
+        err[mask & (err == "")] = msg
+    ids = pd.to_numeric(df["id"].str.strip(), errors="coerce")
+    flag(ids.isna() | (ids <= 0) | (ids % 1 != 0), "id no es un entero positivo")
+    for c in INTS.get(table, []):
+        if c in df:
+            v = df[c].str.strip()
+            n = pd.to_numeric(v, errors="coerce")
+            flag((v != "") & (n.isna() | (n % 1 != 0)), f"{c} no es entero")
+    if table == "students":
+        flag(df["name"].str.strip() == "", "name vacío")
+    if table in ("logs", "observaciones"):
+        ts = pd.to_datetime(df["timestamp"].str.strip(), format="ISO8601", errors="coerce")
+        flag(ts.isna(), "timestamp no es ISO 8601")
+        df = df.assign(timestamp=ts.dt.strftime("%Y-%m-%dT%H:%M:%S"))   # el formato de now_iso()
+    if table == "observaciones":
+        flag(df["observacion"].str.strip() == "", "observacion vacía")
+    if table == "attendance":
+        day = pd.to_datetime(df["date"].str.strip(), format="%Y-%m-%d", errors="coerce")
+        flag(day.isna(), "date no es AAAA-MM-DD")
+        df = df.assign(date=day.dt.strftime("%Y-%m-%d"), status=df["status"].str.strip())
+        flag(~df["status"].isin(["P", "T", "A"]), "status no es P, T o A")
+    bad = (err != "").to_numpy()
+    good = df[~bad].copy()
+    good["id"] = ids[~bad].astype("int64")
+    for c in INTS.get(table, []):
+        if c in good: good[c] = pd.to_numeric(good[c].str.strip(), errors="coerce").astype("Int64")
+    return good, raw[bad].assign(error=err[bad])
+
+
+def _blank(df):
+    """Celdas sin valor en el archivo: vacías, sólo espacios o enteros <NA>."""
+    return df.isna() | df.astype(str).apply(lambda s: s.str.strip() == "")
+
+
+def _with_defaults(table, df):
+    """Filas nuevas: las celdas vacías toman el valor por defecto (CLEAN; si no, 0 en enteros y "" en texto)."""
+    df = df.mask(_blank(df))
+    if table in CLEAN: df = CLEAN[table](df)
+    for c in INTS.get(table, []):
+        if c in df: df[c] = df[c].fillna(0).astype("int64")
+    return df.fillna({c: "" for c in df.columns if df[c].dtype == object})
+
+
+def _updates(upd):
+    """Filas a actualizar -> [registros sólo con las celdas que traen valor], agrupados por columnas: así un
+    UPSERT no pisa con vacío lo que el archivo no trae."""
+    groups = {}
+    for rec, skip in zip(upd.to_dict("records"), _blank(upd).to_numpy()):
+        rec = {c: v for (c, v), s in zip(rec.items(), skip) if not s}
+        groups.setdefault(tuple(rec), []).append(rec)
+    return list(groups.values())
+
+
+def _codes(table, df):
+    """Clave de fila como un entero: id (students) o id + día (attendance)."""
+    ids = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype("int64").to_numpy()
+    if table == "students": return ids
+    days = (pd.to_datetime(df["date"].astype(str), format="%Y-%m-%d", errors="coerce") - pd.Timestamp("1970-01-01")).dt.days
+    return ids * 1_000_000 + days.fillna(0).astype("int64").to_numpy()
+
+
+def _read_chunks(path, cols, chunk):
+    for df in pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig", chunksize=chunk):
+        yield df[cols]
+
+
+# ===== Estadísticas y llamadas =====
+def _peak_mb():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KB en Linux
+    except ImportError:
+        return None
+
+
+class _Stats:
+    def __init__(self, label, total_bytes=0):
+        self.label, self.total_bytes = label, total_bytes
+        self.rows = self.rejected = self.retries = 0
+        self.t0 = self._shown = time.perf_counter()
+        self.io0 = io_calls()
+
+    def add(self, rows, rejected=0):
+        self.rows += rows; self.rejected += rejected
+        now = time.perf_counter()
+        if now - self._shown >= 2:
+            self._shown = now
+            print(f"  {self.label}: {self.rows + self.rejected:,} filas · {(self.rows + self.rejected) / (now - self.t0):,.0f} filas/s", flush=True)
+
+    def summary(self):
+        dt = max(time.perf_counter() - self.t0, 1e-9)
+        n = self.rows + self.rejected
+        parts = [f"{n:,} filas en {dt:.1f}s", f"{n / dt:,.0f} filas/s"]
+        if self.total_bytes: parts.append(f"{self.total_bytes / 1e6 / dt:.1f} MB/s")
+        parts.append(f"{io_calls() - self.io0} llamada(s) al backend")
+        if self.retries: parts.append(f"{self.retries} reintento(s) por cuota")
+        peak = _peak_mb()
+        if peak: parts.append(f"memoria máx. {peak:,.0f} MB")
+        return f"{self.label}: " + ", ".join(parts)
+
+
+def _status(e):
+    return getattr(getattr(e, "response", None), "status_code", None)
+
+
+class _Throttle:
+    """Espacia las llamadas (`rate` por minuto, 0 = sin límite) y reintenta los 429 con espera exponencial."""
+
+    def __init__(self, stats, rate=0, retries=6, backoff=2.0):
+        self.stats, self.rate, self.retries, self.backoff = stats, rate, retries, backoff
+        self._last = 0.0
+
+    def call(self, fn, *args):
+        for attempt in range(self.retries + 1):
+            if self.rate:
+                wait = self._last + 60 / self.rate - time.monotonic()
+                if wait > 0: time.sleep(wait)
+            self._last = time.monotonic()
+            try:
+                return fn(*args)
+            except Exception as e:
+                if _status(e) != 429 or attempt == self.retries: raise
+                self.stats.retries += 1
+                time.sleep(min(60.0, self.backoff * 2 ** attempt))
+
+
+def _batch_rows(stg, table, n_cols, chunk):
+    return max(1, SHEETS_BATCH_CELLS // max(1, n_cols)) if isinstance(stg.backend_for(table), SheetsBackend) else chunk
+
+
+def _default_rate(stg, table, rate):
+    if rate is not None: return rate
+    return SHEETS_RATE if isinstance(stg.backend_for(table), SheetsBackend) else 0
+
+
+# ===== Importar =====
+def import_file(stg, table, path, chunk=5000, dry_run=False, skip_invalid=False, rejects=None,
+                rate=None, retries=6, backoff=2.0) -> int:
+    header = list(pd.read_csv(path, nrows=0, dtype=str, encoding="utf-8-sig").columns)
+    missing, extra = check_header(table, header)
+    if missing:
+        print(f"[ERROR] {path}: faltan columnas {', '.join(missing)} (esquema de {table}: {', '.join(TABLES[table]['cols'])})")
+        return 2
+    if extra:
+        print(f"[AVISO] columnas fuera del esquema, se ignoran: {', '.join(extra)}")
+    cols = [c for c in header if c not in extra]
+    size = os.path.getsize(path)
+
+    # 1) validación de todo el archivo
+    check = _Stats("validación", size)
+    rejects = rejects or os.path.splitext(path)[0] + ".rechazadas.csv"
+    started = False
+    for df in _read_chunks(path, cols, chunk):
+        good, bad = validate(table, df)
+        if len(bad):
+            bad.to_csv(rejects, mode="a" if started else "w", header=not started, index=False); started = True
+        check.add(len(good), len(bad))
+    print(check.summary())
+    if check.rejected:
+        print(f"[{'AVISO' if skip_invalid else 'ERROR'}] {check.rejected:,} fila(s) inválida(s) -> {rejects}")
+        if not skip_invalid:
+            print("No se escribió nada (con --skip-invalid se importan sólo las válidas)."); return 1
+    if dry_run or not check.rows:
+        print("[OK] validación sin escritura" if dry_run else "[OK] nada que importar"); return 0
+
+    # 2) escritura por trozos
+    stats = _Stats("importación", size)
+    api = _Throttle(stats, _default_rate(stg, table, rate), retries, backoff)
+    batch = _batch_rows(stg, table, len(cols), chunk)
+    key, row_level = TABLES[table]["key"], stg.row_level(table)
+    write_new = stg.save_rows if key and row_level else stg.append
+    known = np.unique(_codes(table, api.call(stg.read, table))) if key else None
+    seen, pending = set(), []      # claves agregadas en este import; actualizaciones para el guardado final
+    snaps = api.call(stg.read, "xp_snapshots") if table == "logs" else None
+    snaps_changed = False
+    added = updated = 0
+    for df in _read_chunks(path, cols, chunk):
+        good, _ = validate(table, df)
+        if key:
+            good = good.drop_duplicates(key, keep="last")
+            codes = _codes(table, good)
+            pos = np.searchsorted(known, codes)
+            old = ((pos < len(known)) & (known[np.minimum(pos, len(known) - 1)] == codes) if len(known) else np.zeros(len(codes), bool)) \
+                | np.fromiter((c in seen for c in codes.tolist()), bool, len(codes))
+            new, upd = good[~old], good[old]
+            seen.update(codes[~old].tolist())
+            new = _with_defaults(table, new)   # celdas y columnas que faltan con su valor por defecto
+            if len(upd) and row_level:
+                for recs in _updates(upd):
+                    for i in range(0, len(recs), batch):
+                        api.call(stg.save_rows, table, recs[i:i + batch])
+            elif len(upd):
+                pending.append(upd)
+            added += len(new); updated += len(upd)
+        else:
+            new = _with_defaults(table, good)
+            if snaps is not None:
+                moved = xp_events.absorb(snaps, new)
+                if moved is not None: snaps, snaps_changed = moved, True
+            added += len(new)
+        for i in range(0, len(new), batch):
+            api.call(write_new, table, new.iloc[i:i + batch].to_dict("records"))
+        stats.add(len(good))
+    if pending:
+        upd = pd.concat(pending).drop_duplicates(key, keep="last")
+        cur = api.call(stg.read, table)
+        where = pd.Series(np.arange(len(cur)), index=_codes(table, cur))
+        where = where[~where.index.duplicated(keep="last")].reindex(_codes(table, upd))
+        found = where.notna().to_numpy()
+        pos = where.fillna(-1).astype("int64").to_numpy()
+        blank = _blank(upd)
+        cur = cur.copy()
+        for c in upd.columns:
+            ok = found & ~blank[c].to_numpy()      # celdas vacías: se deja el valor actual
+            if not ok.any(): continue
+            if c not in cur: cur[c] = ""
+            vals = cur[c].to_numpy(dtype=object, copy=True)
+            vals[pos[ok]] = upd[c].to_numpy(dtype=object)[ok]
+            cur[c] = vals
+        api.call(stg.save, table, cur)
+    if snaps_changed:
+        api.call(stg.save, "xp_snapshots", snaps)
+    print(stats.summary())
+    print(f"[OK] {table}: {added:,} fila(s) nueva(s)" + (f", {updated:,} actualizada(s)" if key else "")
+          + (" · fotos de XP ajustadas por logs con fecha anterior" if snaps_changed else ""))
+    if table == "logs":
+        print("students.xp no cambia con el import: `python xp_events.py check` muestra las diferencias.")
+    return 0
+
+
+# ===== Exportar =====
+def _sheet_chunks(stg, table, batch, api):
+    b = stg.backend_for(table)
+    head = api.call(b.read_range, table, "1:1")
+    if not head or not head[0]: return
+    header = head[0]
+    r = 2
+    while True:
+        values = api.call(b.read_range, table, f"{r}:{r + batch - 1}")
+        if not values: return
+        w = len(header)
+        yield pd.DataFrame([(list(v) + [""] * w)[:w] for v in values], columns=header)
+        if len(values) < batch: return
+        r += batch
+
+
+def export_chunks(stg, table, chunk=50_000, with_archive=False, api=None):
+    """La tabla en trozos, leyendo del backend por partes cuando se puede; primero el archivo si se pide."""
+    if with_archive and table in ("logs", "observaciones"):
+        from archive import Archive
+        arch = Archive(os.getenv("ARCHIVE_DIR", "archive"))
+        for term in sorted(arch.terms(table)):
+            df = arch.read_term(table, term)
+            for i in range(0, len(df), chunk): yield df.iloc[i:i + chunk]
+    b = stg.backend_for(table)
+    if isinstance(b, CsvBackend):
+        path = b.path(table)
+        if os.path.exists(path):
+            yield from pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk)
+    elif isinstance(b, SqliteBackend):
+        yield from b.db.iter_read(table, chunk)
+    elif isinstance(b, SheetsBackend):
+        yield from _sheet_chunks(stg, table, min(chunk, _batch_rows(stg, table, len(TABLES[table]["cols"]), chunk)), api)
+    else:
+        df = api.call(stg.read, table) if api else stg.read(table)
+        for i in range(0, len(df), chunk): yield df.iloc[i:i + chunk]
+
+
+def export_file(stg, table, path, chunk=50_000, with_archive=False, rate=None, retries=6, backoff=2.0) -> int:
+    stats = _Stats("exportación")
+    api = _Throttle(stats, _default_rate(stg, table, rate), retries, backoff)
+    cols = TABLES[table]["cols"]
+    started = False
+    for df in export_chunks(stg, table, chunk, with_archive, api):
+        df.reindex(columns=cols).to_csv(path, mode="a" if started else "w", header=not started, index=False)
+        started = True
+        stats.add(len(df))
+    if not started:
+        pd.DataFrame(columns=cols).to_csv(path, index=False)
+    stats.total_bytes = os.path.getsize(path)
+    print(stats.summary())
+    print(f"[OK] {table} -> {path}")
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Importación y exportación masiva por trozos")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ip = sub.add_parser("import", help="valida y carga un CSV en una tabla")
+    ip.add_argument("table", choices=IO_TABLES)
+    ip.add_argument("file")
+    ip.add_argument("--chunk", type=int, default=5000, help="filas por trozo (memoria acotada)")
+    ip.add_argument("--dry-run", action="store_true", help="sólo validar")
+    ip.add_argument("--skip-invalid", action="store_true", help="importar las filas válidas aunque haya inválidas")
+    ip.add_argument("--rejects", help="CSV de filas rechazadas (por defecto <archivo>.rechazadas.csv)")
+    ep = sub.add_parser("export", help="escribe una tabla a CSV")
+    ep.add_argument("table", choices=IO_TABLES)
+    ep.add_argument("file")
+    ep.add_argument("--chunk", type=int, default=50_000)
+    ep.add_argument("--with-archive", action="store_true", help="incluir los periodos archivados (logs, observaciones)")
+    for p in (ip, ep):
+        p.add_argument("--rate", type=float, help=f"llamadas por minuto (Sheets: {SHEETS_RATE}; 0 = sin límite)")
+        p.add_argument("--retries", type=int, default=6, help="reintentos ante 429")
+        p.add_argument("--backoff", type=float, default=2.0, help="espera inicial (s) del reintento, se duplica")
+    a = ap.parse_args(argv)
+
+    from data_layer import storage
+    stg = storage()
+    if a.cmd == "import":
+        return import_file(stg, a.table, a.file, a.chunk, a.dry_run, a.skip_invalid, a.rejects, a.rate, a.retries, a.backoff)
+    return export_file(stg, a.table, a.file, a.chunk, a.with_archive, a.rate, a.retries, a.backoff)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
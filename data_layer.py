@@ -1,124 +1,632 @@
 # data_layer.py
+"""Capa de almacenamiento única: app.py y las funciones simples del final pasan por aquí.
+
+Tablas: students, logs, observaciones, attendance, colegios, xp_snapshots (fotos de XP, ver xp_events.py). Backends intercambiables (plug-ins):
+    csv     archivos del repo (por defecto; DEV_MODE=1 lo fuerza)
+    sqlite  SQLITE_DB (variable de entorno o secreto), ver sqlite_store.py
+    sheets  USE_SHEETS = true; una hoja por tabla (SHEET_<TABLA>_URL); las tablas sin URL quedan en CSV
+    fake_sheets  Sheets simulado en memoria (latencia, cuota, registro de llamadas), ver fake_sheets.py
+Otro backend se agrega con `register_backend(nombre, clase)` y se elige con STORAGE_BACKEND.
+
+Cada tabla tiene su política de caché (CACHE_POLICY, ajustable con el secreto CACHE_TTL) y cada
+operación queda medida (llamadas, errores, filas, latencia) en `storage().metrics()`.
+"""
+import atexit
+import csv
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import pandas as pd
 import streamlit as st
 
-DEV_MODE = os.getenv("DEV_MODE", "0") == "1"   # En local: set DEV_MODE=1
+DEV_MODE = os.getenv("DEV_MODE", "0") == "1"   # En local: set DEV_MODE=1 (fuerza CSV)
 
-# ---- CONFIG ----
-CSV_STUDENTS = "students.csv"
-CSV_LOGS     = "logs.csv"
-CSV_ATT      = "asistencia.csv"
+# ---- SECRETOS ----
+def _bool_secret(name, default=False):
+    try:
+        return bool(st.secrets.get(name, default))
+    except Exception:
+        return default
 
-# ---- HELPERS ----
-def _ensure_csv(path: str, cols: list[str]) -> None:
-    """Crea CSV vacío con columnas si no existe."""
-    import os
-    if not os.path.exists(path):
-        pd.DataFrame(columns=cols).to_csv(path, index=False, encoding="utf-8")
+def _str_secret(name, default=""):
+    try:
+        return str(st.secrets.get(name, default) or default)
+    except Exception:
+        return default
 
-@st.cache_resource
-def _open_sheet():
-    """Devuelve el spreadsheet (objeto gspread) SOLO en producción (nube)."""
-    if DEV_MODE:
+def _float_secret(name, default):
+    try:
+        return float(st.secrets.get(name, default))
+    except Exception:
+        return float(default)
+
+USE_SHEETS = _bool_secret("USE_SHEETS", False) and not DEV_MODE
+SQLITE_DB  = os.getenv("SQLITE_DB") or _str_secret("SQLITE_DB")
+USE_SQLITE = bool(SQLITE_DB) and not USE_SHEETS and not DEV_MODE
+
+# ---- TABLAS ----
+STUDENT_COLS = ["id","name","grupo","xp","colegio_id","phone","teacher","xp_delta","xp_reason","avatar",
+                "trinket","trinket_desc"]
+LOG_COLS     = ["timestamp","id","name","delta_xp","reason"]
+OBS_COLS     = ["timestamp","id","name","observacion"]
+ATT_COLS     = ["id","date","status"]
+COLEGIO_COLS = ["id","nombre","icono","x","y"]
+SNAPSHOT_COLS = ["id","xp","watermark","rows"]
+
+# csv: archivo; url: secreto con la hoja; key: clave de fila (None = sólo agregar);
+# create: si falta el CSV se crea (con `seed` como contenido inicial)
+TABLES = {
+    "students":      {"csv": "students.csv", "url": "SHEET_STUDENTS_URL", "cols": STUDENT_COLS, "key": ["id"],
+                      "create": True},
+    "logs":          {"csv": "logs.csv", "url": "SHEET_LOGS_URL", "cols": LOG_COLS, "key": None, "create": False},
+    "observaciones": {"csv": "observaciones.csv", "url": "SHEET_OBS_URL", "cols": OBS_COLS, "key": None,
+                      "create": False},
+    "attendance":    {"csv": "asistencia.csv", "url": "SHEET_ATT_URL", "cols": ATT_COLS, "key": ["id","date"],
+                      "create": True},
+    "colegios":      {"csv": "colegios.csv", "url": "SHEET_COLEGIOS_URL", "cols": COLEGIO_COLS, "key": ["id"],
+                      "create": True,
+                      "seed": [{"id":1,"nombre":"COLEGIO","x":100,"y":100,"icono":"assets/castle1.png"}]},
+    "xp_snapshots":  {"csv": "xp_snapshots.csv", "url": "SHEET_XP_SNAPSHOTS_URL", "cols": SNAPSHOT_COLS, "key": ["id"],
+                      "create": False},
+}
+
+# Política de caché por tabla:
+#   ttl None -> se reutiliza mientras no cambie la versión de la tabla
+#   ttl > 0  -> además a lo más ttl segundos (si el backend no da versión, sólo cuenta el plazo)
+#   ttl 0    -> sin caché aquí (la app mantiene su propia estructura: índice de historial, asistencia)
+#   on_write "store" guarda lo escrito como nueva copia; "drop" la descarta
+CACHE_POLICY = {
+    "students":      {"ttl": None, "on_write": "store"},
+    "colegios":      {"ttl": None, "on_write": "store"},
+    "logs":          {"ttl": 0,    "on_write": "drop"},
+    "observaciones": {"ttl": 0,    "on_write": "drop"},
+    "attendance":    {"ttl": 0,    "on_write": "drop"},
+    "xp_snapshots":  {"ttl": None, "on_write": "store"},
+}
+
+def _normalize_students(df):
+    for col in STUDENT_COLS:
+        if col not in df.columns:
+            df[col] = "" if col in ["name","grupo","phone","teacher","xp_reason","avatar","trinket","trinket_desc"] else 0
+    df["id"]         = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype(int)
+    df["xp"]         = pd.to_numeric(df["xp"], errors="coerce").fillna(0).astype(int)
+    df["colegio_id"] = pd.to_numeric(df["colegio_id"], errors="coerce").fillna(1).astype(int)
+    df["xp_delta"]   = pd.to_numeric(df["xp_delta"], errors="coerce").fillna(0).astype(int)
+    for c in ["name","grupo","phone","teacher","xp_reason","avatar","trinket","trinket_desc"]:
+        df[c] = df[c].fillna("").astype(str)
+    return df
+
+def _fill_text(*cols):
+    def clean(df):
+        for c in cols:
+            if c in df.columns: df[c] = df[c].fillna("").astype(str)
+        return df
+    return clean
+
+# limpieza de tipos al leer (cualquier backend) y antes de guardar
+CLEAN = {
+    "students":      _normalize_students,
+    "logs":          _fill_text("reason", "name"),
+    "observaciones": _fill_text("observacion"),
+}
+
+# ---- CONTADOR DE LLAMADAS (por hilo/sesión) ----
+_io_tls = threading.local()
+
+def _count_io(n=1):
+    _io_tls.calls = getattr(_io_tls, "calls", 0) + n
+
+def io_calls():
+    return getattr(_io_tls, "calls", 0)
+
+
+# ===================== BACKENDS =====================
+class Backend:
+    """Interfaz de un backend. `row_level`: puede actualizar/borrar filas sueltas sin reescribir la tabla."""
+    name = "base"
+    row_level = False
+
+    def handles(self, table) -> bool:
+        return True
+
+    def version(self, table):
+        """Firma barata de la versión de la tabla; None = sin señal."""
         return None
-    import gspread
-    from google.oauth2.service_account import Credentials
-    # En la nube (Streamlit Cloud) debes tener en secrets:
-    # SERVICE_ACCOUNT_FILE = ".streamlit/service-account.json" (o la ruta que uses)
-    # SHEET_STUDENTS_URL   = "https://docs.google.com/......"
-    sa_file = st.secrets["SERVICE_ACCOUNT_FILE"]
-    scope = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = Credentials.from_service_account_file(sa_file, scopes=scope)
-    gc = gspread.authorize(creds)
-    return gc.open_by_url(st.secrets["SHEET_STUDENTS_URL"])
-
-# ===================== LECTURAS =====================
-@st.cache_data(ttl=60, show_spinner=False)
+
+    def read(self, table) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def save(self, table, df: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def append(self, table, rows) -> None:
+        self.save(table, pd.concat([self.read(table), pd.DataFrame(rows)], ignore_index=True))
+
+    def save_rows(self, table, rows, delete_keys=()) -> None:
+        raise NotImplementedError(f"{self.name} no escribe filas sueltas")
+
+    def delete(self, table, match: dict) -> int:
+        raise NotImplementedError(f"{self.name} no borra filas sueltas")
+
+    def stats(self) -> dict:
+        return {}
+
+
+class CsvBackend(Backend):
+    name = "csv"
+
+    def __init__(self, base_dir="."):
+        self.base_dir = base_dir
+
+    def path(self, table):
+        return os.path.join(self.base_dir, TABLES[table]["csv"])
+
+    def version(self, table):
+        try:
+            stt = os.stat(self.path(table)); return (stt.st_mtime_ns, stt.st_size)
+        except FileNotFoundError:
+            return (0, 0)
+
+    def read(self, table):
+        spec, path = TABLES[table], self.path(table)
+        if not os.path.exists(path):
+            if not spec["create"]:
+                return pd.DataFrame(columns=spec["cols"])
+            pd.DataFrame(spec.get("seed") or [], columns=None if spec.get("seed") else spec["cols"]).to_csv(path, index=False)
+        _count_io()
+        return pd.read_csv(path)
+
+    def save(self, table, df):
+        df.to_csv(self.path(table), index=False); _count_io()
+
+    def append(self, table, rows):
+        """Agrega filas al CSV en modo 'a'; respeta el orden de columnas del encabezado existente."""
+        if not rows: return
+        path = self.path(table)
+        header = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                header = next(csv.reader([f.readline()]), None)
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) not in (b"\n", b"\r"):
+                    with open(path, "a", encoding="utf-8") as fa: fa.write("\n")
+        df = pd.DataFrame(rows)
+        out_cols = header or list(TABLES[table]["cols"])
+        for c in out_cols:
+            if c not in df.columns: df[c] = ""
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        try:
+            df[out_cols].to_csv(path, mode="a", header=header is None, index=False)
+        except Exception:
+            # no dejar filas a medias: se trunca al tamaño previo
+            with open(path, "a", encoding="utf-8") as f: f.truncate(size)
+            raise
+        _count_io()
+
+
+class SqliteBackend(Backend):
+    name = "sqlite"
+    row_level = True
+
+    def __init__(self, path=None):
+        from sqlite_store import SqliteStore
+        self.path = path or SQLITE_DB
+        fresh = not os.path.exists(self.path)
+        self.db = SqliteStore(self.path)
+        if fresh: self.db.migrate_from_csv()   # migración única desde los CSV existentes
+
+    def version(self, table):
+        return ("db", self.db.table_version(table))
+
+    def read(self, table):
+        _count_io(); return self.db.read(table)
+
+    def save(self, table, df):
+        self.db.save(table, df); _count_io()
+
+    def append(self, table, rows):
+        self.db.append(table, rows); _count_io()
+
+    def save_rows(self, table, rows, delete_keys=()):
+        self.db.save_rows(table, rows, delete_keys=delete_keys); _count_io()
+
+    def delete(self, table, match):
+        where, params = [], []
+        for col, val in match.items():
+            if isinstance(val, (list, tuple, set)):
+                val = list(val)
+                where.append(f'"{col}" IN ({",".join("?" * len(val))})'); params += val
+            else:
+                where.append(f'"{col}" = ?'); params.append(val)
+        n = self.db.delete(table, " AND ".join(where) or "1", params); _count_io()
+        return n
+
+
+class SheetsBackend(Backend):
+    """Una hoja (sheet1) por tabla. Un cliente gspread por proceso; guardado por diferencias (sheet_sync.py);
+    revisión = modifiedTime en Drive; escritura diferida opcional (write_behind.py)."""
+    name = "sheets"
+
+    def __init__(self, client=None, urls=None):
+        """client/urls: para usar otro cliente gspread-compatible (p. ej. fake_sheets) en vez de los secretos."""
+        self.urls = urls if urls is not None else {t: _str_secret(spec["url"]) for t, spec in TABLES.items()}
+        self.revision_ttl = _float_secret("SHEETS_REVISION_TTL", 3)
+        self.write_behind = _bool_secret("SHEETS_WRITE_BEHIND", False)
+        self.pool = {"client": client, "creds": None, "sheets": {}, "headers": {}, "snapshots": {}, "revs": {},
+                     "handshakes": 0, "refreshes": 0, "synced_cells": 0, "rev_checks": 0, "lock": threading.Lock()}
+        self._queue = None
+
+    def handles(self, table):
+        return bool(self.urls.get(table))
+
+    # ---- cliente y hojas ----
+    def _client(self):
+        import gspread
+        from google.oauth2.service_account import Credentials
+        pool = self.pool
+        with pool["lock"]:
+            if pool["client"] is None:
+                scopes = [
+                    "https://www.googleapis.com/auth/spreadsheets",
+                    "https://www.googleapis.com/auth/drive"
+                ]
+                raw = _str_secret("GOOGLE_SERVICE_ACCOUNT_JSON")
+                sa_file = _str_secret("SERVICE_ACCOUNT_FILE")
+                if raw: creds = Credentials.from_service_account_info(json.loads(raw), scopes=scopes)
+                elif sa_file: creds = Credentials.from_service_account_file(sa_file, scopes=scopes)
+                else: raise RuntimeError("No hay GOOGLE_SERVICE_ACCOUNT_JSON en secrets.")
+                pool["client"] = gspread.authorize(creds)
+                pool["creds"] = creds
+                pool["handshakes"] += 1
+            elif pool["creds"] is not None and pool["creds"].expired:
+                # token vencido: se refresca sin volver a autorizar
+                from google.auth.transport.requests import Request
+                pool["creds"].refresh(Request())
+                pool["refreshes"] += 1
+            return pool["client"]
+
+    def _sheet(self, url):
+        gc = self._client()
+        ws = self.pool["sheets"].get(url)
+        if ws is None:
+            ws = gc.open_by_url(url).sheet1
+            with self.pool["lock"]:
+                self.pool["sheets"][url] = ws
+        return ws
+
+    def _remember(self, url, values):
+        """Última foto conocida de la hoja (encabezado + filas como texto), base del guardado por diferencias."""
+        with self.pool["lock"]:
+            self.pool["snapshots"][url] = values
+            if values and values[0]: self.pool["headers"][url] = [h for h in values[0] if h]
+
+    def _forget_revision(self, url):
+        """Tras una escritura propia la próxima versión se vuelve a consultar."""
+        with self.pool["lock"]:
+            self.pool["revs"].pop(url, None)
+
+    # ---- escritura diferida ----
+    def queue(self):
+        if self._queue is None:
+            from write_behind import WriteBehindQueue
+            from gspread.utils import numericise   # mismo parseo que get_all_records
+            q = WriteBehindQueue(_str_secret("WRITE_BEHIND_QUEUE", ".sheets_queue.jsonl"), self._save_now,
+                                 self._append_now, interval=_float_secret("WRITE_BEHIND_INTERVAL", 5),
+                                 parse=numericise)
+            atexit.register(q.stop)
+            self._queue = q.start()
+        return self._queue
+
+    # ---- interfaz ----
+    def revision(self, url):
+        """modifiedTime del archivo en Drive, a lo más una vez cada SHEETS_REVISION_TTL s por hoja."""
+        pool = self.pool; now = time.monotonic()
+        hit = pool["revs"].get(url)
+        if hit and now - hit[1] < self.revision_ttl: return hit[0]
+        try:
+            rev = self._sheet(url).spreadsheet.get_lastUpdateTime(); _count_io()
+        except Exception:
+            return None   # sin señal: quien llama relee
+        with pool["lock"]:
+            pool["revs"][url] = (rev, now); pool["rev_checks"] += 1
+        return rev
+
+    def version(self, table):
+        url = self.urls[table]
+        rev = self.revision(url)
+        if rev is None: return None
+        return ("rev", rev, self.queue().version(url)) if self.write_behind else ("rev", rev)
+
+    def read(self, table):
+        url, cols = self.urls[table], TABLES[table]["cols"]
+        def load():
+            from gspread.utils import numericise_all, to_records
+            values = self._sheet(url).get(pad_values=True); _count_io()   # misma llamada que get_all_records
+            values = [] if values == [[]] else values
+            self._remember(url, values)
+            return to_records(values[0], [numericise_all(r) for r in values[1:]]) if values else []
+        rows = self.queue().read_overlay(url, load) if self.write_behind else load()
+        df = pd.DataFrame(rows)
+        for c in cols:
+            if c not in df.columns:
+                df[c] = "" if c not in ["xp","colegio_id","xp_delta"] else 0
+        return df[cols]
+
+    def read_range(self, table, a1):
+        """Un tramo de la hoja como texto (p. ej. '2:5001'), para leer por partes. No incluye lo que espera
+        en la cola de escritura diferida."""
+        values = self._sheet(self.urls[table]).get(a1); _count_io()
+        return values
+
+    def save(self, table, df):
+        # gspread prefiere listas de listas
+        values = [list(df.columns)] + df.astype(str).values.tolist()
+        if self.write_behind: self.queue().replace(self.urls[table], values)
+        else: self._save_now(self.urls[table], values)
+
+    def append(self, table, rows):
+        """Agrega filas al final de la hoja (append_rows), sin leer ni reescribir el resto."""
+        if not rows: return
+        url = self.urls[table]
+        if self.write_behind:
+            self.queue().append(url, [{k: str(v) for k, v in r.items()} for r in rows], TABLES[table]["cols"])
+        else:
+            self._append_now(url, rows, TABLES[table]["cols"])
+
+    def _key(self, url):
+        return next((TABLES[t]["key"] for t, u in self.urls.items() if u and u == url), None)
+
+    def _save_now(self, url, values):
+        """Envía sólo las celdas/filas que cambiaron respecto de la última foto de la hoja."""
+        import sheet_sync
+        sh = self._sheet(url)
+        old = self.pool["snapshots"].get(url)
+        if old is not None and not self._snapshot_current(sh, url, old):
+            old = None
+        if old is None:
+            old = sh.get(pad_values=True); _count_io()
+        try:
+            res = sheet_sync.apply(sh, old, values, self._key(url))
+        except Exception:
+            with self.pool["lock"]: self.pool["snapshots"].pop(url, None)   # estado incierto: releer la próxima vez
+            raise
+        finally:
+            self._forget_revision(url)
+        _count_io(res["calls"])
+        self._remember(url, res["result"])
+        with self.pool["lock"]: self.pool["synced_cells"] += res["cells"]
+
+    def _snapshot_current(self, sh, url, old):
+        """¿La hoja sigue teniendo las filas de la foto (mismas claves, mismo orden)? Otra instancia o alguien
+        editando la hoja a mano pudo borrar u ordenar filas, y el diff escribe por posición. Lee sólo las
+        columnas clave; sin clave responde que no (se relee la hoja)."""
+        import sheet_sync
+        key = self._key(url)
+        rng = sheet_sync.key_range(old, key)
+        if rng is None: return False
+        fresh = sh.get(rng); _count_io()
+        return sheet_sync.keys_match(old, fresh, key)
+
+    def _append_now(self, url, rows, cols):
+        sh = self._sheet(url)
+        pool = self.pool
+        header = pool["headers"].get(url)
+        if header is None:
+            first = sh.row_values(1); _count_io()
+            header = [h for h in first if h] or list(cols)
+            if not first:
+                sh.append_row(header, value_input_option="RAW"); _count_io()
+            with pool["lock"]:
+                pool["headers"][url] = header
+        out = [[str(r.get(c, "")) for c in header] for r in rows]
+        try:
+            sh.append_rows(out, value_input_option="RAW")
+        finally:
+            self._forget_revision(url)
+        _count_io()
+        snap = pool["snapshots"].get(url)
+        if snap:
+            w = len(snap[0])
+            self._remember(url, snap + [(v + [""] * w)[:w] for v in out])
+
+    def stats(self):
+        pool = self.pool
+        out = {"handshakes": pool["handshakes"], "refreshes": pool["refreshes"], "sheets": len(pool["sheets"]),
+               "synced_cells": pool["synced_cells"], "rev_checks": pool["rev_checks"],
+               "revision_ttl": self.revision_ttl}
+        if self.write_behind: out["queue"] = self.queue().stats()
+        return out
+
+
+def _fake_sheets_backend():
+    """Sheets simulado en memoria (fake_sheets.py), sembrado con los CSV: STORAGE_BACKEND=fake_sheets."""
+    from fake_sheets import backend
+    return backend()
+
+BACKENDS = {"csv": CsvBackend, "sqlite": SqliteBackend, "sheets": SheetsBackend, "fake_sheets": _fake_sheets_backend}
+
+def register_backend(name: str, cls) -> None:
+    """Agrega un backend (subclase de Backend) elegible con STORAGE_BACKEND."""
+    BACKENDS[name] = cls
+
+def backend_name() -> str:
+    forced = os.getenv("STORAGE_BACKEND") or _str_secret("STORAGE_BACKEND")
+    if forced and not DEV_MODE: return forced
+    return "sheets" if USE_SHEETS else "sqlite" if USE_SQLITE else "csv"
+
+
+# ===================== FACHADA =====================
+class Storage:
+    """Enruta cada tabla a su backend (o al de respaldo si el principal no la maneja), aplica la
+    política de caché y mide cada operación."""
+
+    def __init__(self, primary: Backend, fallback: Backend = None, policy=None):
+        self.primary = primary
+        self.fallback = fallback or primary
+        self.policy = {t: dict(p) for t, p in (policy or CACHE_POLICY).items()}
+        self._cache = {}                 # tabla -> (versión, df, instante)
+        self._hits, self._misses = {}, {}
+        self._ops = {}                   # (backend, tabla, op) -> métricas
+        self._lock = threading.Lock()
+
+    def backend_for(self, table) -> Backend:
+        return self.primary if self.primary.handles(table) else self.fallback
+
+    def row_level(self, table) -> bool:
+        return self.backend_for(table).row_level
+
+    # ---- métricas ----
+    @contextmanager
+    def _timed(self, backend, table, op, rows=0):
+        info = {"rows": rows}
+        t = time.perf_counter(); ok = False
+        try:
+            yield info
+            ok = True
+        finally:
+            ms = (time.perf_counter() - t) * 1000
+            with self._lock:
+                m = self._ops.setdefault((backend.name, table, op),
+                                         {"calls": 0, "errors": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0})
+                m["calls"] += 1; m["errors"] += not ok; m["rows"] += info["rows"]
+                m["total_ms"] += ms; m["max_ms"] = max(m["max_ms"], ms)
+
+    def metrics(self) -> list:
+        with self._lock:
+            return [{"backend": b, "tabla": t, "op": op, "llamadas": m["calls"], "errores": m["errors"],
+                     "filas": m["rows"], "prom_ms": round(m["total_ms"] / m["calls"], 2) if m["calls"] else 0.0,
+                     "max_ms": round(m["max_ms"], 2)}
+                    for (b, t, op), m in sorted(self._ops.items())]
+
+    def cache_stats(self) -> list:
+        with self._lock:
+            return [{"tabla": t, "ttl": "versión" if p["ttl"] is None else f"{p['ttl']:g} s", "al_escribir": p["on_write"],
+                     "aciertos": self._hits.get(t, 0), "fallos": self._misses.get(t, 0)}
+                    for t, p in self.policy.items()]
+
+    # ---- caché ----
+    def _fresh(self, hit, ver, ttl, now):
+        hver, _, t = hit
+        if ttl is not None and now - t >= ttl: return False
+        if ver is None: return ttl is not None       # sin versión: sólo el plazo
+        return hver == ver
+
+    def invalidate(self, table=None):
+        with self._lock:
+            if table is None: self._cache.clear()
+            else: self._cache.pop(table, None)
+
+    def _after_write(self, table, df=None):
+        if self.policy[table]["on_write"] == "store" and df is not None and self.policy[table]["ttl"] != 0:
+            ver = self.version(table)
+            with self._lock: self._cache[table] = (ver, df, time.monotonic())
+        else:
+            self.invalidate(table)
+
+    # ---- operaciones ----
+    def version(self, table):
+        b = self.backend_for(table)
+        with self._timed(b, table, "version"):
+            return b.version(table)
+
+    def read(self, table) -> pd.DataFrame:
+        b, ttl = self.backend_for(table), self.policy[table]["ttl"]
+        if ttl == 0:
+            with self._lock: self._misses[table] = self._misses.get(table, 0) + 1
+            return self._read(b, table)
+        ver, now = self.version(table), time.monotonic()
+        with self._lock:
+            hit = self._cache.get(table)
+            fresh = hit is not None and self._fresh(hit, ver, ttl, now)
+            if fresh: self._hits[table] = self._hits.get(table, 0) + 1
+            else: self._misses[table] = self._misses.get(table, 0) + 1
+        if fresh:
+            return hit[1].copy()
+        df = self._read(b, table)
+        if ver is not None or ttl:
+            with self._lock: self._cache[table] = (ver, df, now)
+        return df.copy()
+
+    def _read(self, b, table):
+        with self._timed(b, table, "read") as info:
+            df = b.read(table); info["rows"] = len(df)
+        clean = CLEAN.get(table)
+        return clean(df) if clean else df
+
+    def save(self, table, df: pd.DataFrame) -> None:
+        b = self.backend_for(table)
+        clean = CLEAN.get(table)
+        df = clean(df.copy()) if clean else df
+        with self._timed(b, table, "save", len(df)):
+            b.save(table, df)
+        self._after_write(table, df.copy())
+
+    def append(self, table, rows) -> None:
+        if not rows: return
+        b = self.backend_for(table)
+        with self._timed(b, table, "append", len(rows)):
+            b.append(table, rows)
+        self._after_write(table)
+
+    def save_rows(self, table, rows, delete_keys=()) -> None:
+        b = self.backend_for(table)
+        with self._timed(b, table, "save_rows", len(rows) + len(delete_keys)):
+            b.save_rows(table, rows, delete_keys)
+        self._after_write(table)
+
+    def delete(self, table, match: dict) -> int:
+        b = self.backend_for(table)
+        with self._timed(b, table, "delete"):
+            n = b.delete(table, match)
+        self._after_write(table)
+        return n
+
+
+def _policy_from_secrets():
+    """CACHE_TTL en secrets, p. ej. CACHE_TTL = { students = 30, logs = 0 } (segundos)."""
+    policy = {t: dict(p) for t, p in CACHE_POLICY.items()}
+    try: overrides = dict(st.secrets.get("CACHE_TTL", {}))
+    except Exception: overrides = {}
+    for t, ttl in overrides.items():
+        if t in policy: policy[t]["ttl"] = None if ttl in (None, "", "version") else float(ttl)
+    return policy
+
+@st.cache_resource
+def storage() -> Storage:
+    """Una instancia por proceso (compartida entre sesiones)."""
+    name = backend_name()
+    primary = BACKENDS[name]()
+    return Storage(primary, CsvBackend() if name != "csv" else None, _policy_from_secrets())
+
+
+# ===================== API SIMPLE =====================
 def load_students() -> pd.DataFrame:
-    if DEV_MODE:
-        _ensure_csv(CSV_STUDENTS,
-                    ["id","name","grupo","xp","colegio_id","phone","teacher",
-                     "xp_delta","xp_reason","avatar","trinket","trinket_desc"])
-        df = pd.read_csv(CSV_STUDENTS)
-        return df
-    ws = _open_sheet().worksheet("students")
-    return pd.DataFrame(ws.get_all_records())
+    return storage().read("students")
 
-@st.cache_data(ttl=60, show_spinner=False)
 def load_logs() -> pd.DataFrame:
-    if DEV_MODE:
-        _ensure_csv(CSV_LOGS, ["timestamp","id","name","delta_xp","reason"])
-        return pd.read_csv(CSV_LOGS)
-    ws = _open_sheet().worksheet("logs")
-    return pd.DataFrame(ws.get_all_records())
+    return storage().read("logs")
 
-@st.cache_data(ttl=60, show_spinner=False)
 def load_attendance() -> pd.DataFrame:
-    if DEV_MODE:
-        _ensure_csv(CSV_ATT, ["id","date","status"])
-        return pd.read_csv(CSV_ATT)
-    ws = _open_sheet().worksheet("attendance")
-    return pd.DataFrame(ws.get_all_records())
+    return storage().read("attendance")
 
-# ===================== ESCRITURAS =====================
 def save_students(df: pd.DataFrame) -> None:
-    """Sobrescribe estudiantes (CSV en dev, Sheet en prod)."""
-    if DEV_MODE:
-        df.to_csv(CSV_STUDENTS, index=False, encoding="utf-8")
-        load_students.clear()
-        return
-    # Producción: reemplazo total de la hoja "students"
-    sh = _open_sheet()
-    ws = sh.worksheet("students")
-    # Limpia y sube con encabezados
-    ws.clear()
-    if df.empty:
-        return
-    ws.update([df.columns.tolist()] + df.astype(str).values.tolist())
-    load_students.clear()
+    """Guarda estudiantes (sólo lo que cambió, en Sheets)."""
+    storage().save("students", df)
 
 def append_log(student_id: int, name: str, delta: int, reason: str) -> None:
     """Agrega UNA fila al log."""
     from datetime import datetime
-    row = {
+    storage().append("logs", [{
         "timestamp": datetime.now().isoformat(timespec="seconds"),
         "id": int(student_id),
         "name": str(name),
         "delta_xp": int(delta),
         "reason": (reason or "")
-    }
-    if DEV_MODE:
-        _ensure_csv(CSV_LOGS, ["timestamp","id","name","delta_xp","reason"])
-        header_needed = False
-        try:
-            header_needed = (pd.read_csv(CSV_LOGS).shape[0] == 0)
-        except Exception:
-            header_needed = True
-        pd.DataFrame([row]).to_csv(
-            CSV_LOGS, mode="a", header=header_needed, index=False, encoding="utf-8"
-        )
-        load_logs.clear()
-        return
-    # Producción: append a la hoja "logs"
-    sh = _open_sheet()
-    ws = sh.worksheet("logs")
-    ws.append_row([row["timestamp"], str(row["id"]), row["name"],
-                   str(row["delta_xp"]), row["reason"]], value_input_option="USER_ENTERED")
-    load_logs.clear()
+    }])
 
 def save_attendance(df: pd.DataFrame) -> None:
-    if DEV_MODE:
-        df.to_csv(CSV_ATT, index=False, encoding="utf-8")
-        load_attendance.clear()
-        return
-    sh = _open_sheet()
-    ws = sh.worksheet("attendance")
-    ws.clear()
-    if df.empty:
-        return
-    ws.update([df.columns.tolist()] + df.astype(str).values.tolist())
-    load_attendance.clear()
\ No newline at end of file
+    storage().save("attendance", df)
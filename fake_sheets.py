@@ -0,0 +1,481 @@
+# fake_sheets.py
+"""Google Sheets simulado en memoria, para correr el modo Sheets sin red.
+
+Imita la parte de gspread que usa la app (cliente, Spreadsheet, Worksheet) con:
+    - latencia por llamada (`latency` ± `jitter`, en segundos),
+    - cuota por minuto como la de Google (lecturas y escrituras por separado): al pasarla, APIError 429,
+    - 429 al azar con `fail_rate` (semilla fija),
+    - un registro (Ledger) de cada llamada: operación, tipo, hoja, celdas, ms, código, y un `scope`
+      opcional para contar por vista o por caso de benchmark.
+
+Los valores se guardan como texto, igual que los devuelve la API. Las llamadas a Drive
+(get_lastUpdateTime) tienen latencia pero no consumen la cuota de Sheets.
+
+Uso en la app: STORAGE_BACKEND=fake_sheets (los datos iniciales salen de los CSV; ajustes en
+FAKE_SHEETS_LATENCY_MS, FAKE_SHEETS_JITTER_MS, FAKE_SHEETS_QUOTA, FAKE_SHEETS_FAIL_RATE).
+    python fake_sheets.py views [--latency-ms 80] [--quota 60]     # llamadas a la API por vista
+"""
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, numericise_all, to_records
+
+# operación -> tipo de cuota
+READ, WRITE, DRIVE = "read", "write", "drive"
+
+
+class _Response:
+    """Lo mínimo de requests.Response que necesita APIError."""
+    def __init__(self, code, status, message):
+        self.status_code = code
+        self._body = {"error": {"code": code, "message": message, "status": status}}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+def quota_error(kind):
+    metric = "Read requests" if kind == READ else "Write requests"
+    return APIError(_Response(429, "RESOURCE_EXHAUSTED",
+                              f"Quota exceeded for quota metric '{metric}' and limit '{metric} per minute per user' "
+                              f"of service 'sheets.googleapis.com' (simulado)."))
+
+
+# ===== Registro de llamadas =====
+class Ledger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scope = None
+        self.entries = []
+
+    @contextmanager
+    def scope(self, label):
+        """Etiqueta las llamadas hechas dentro del bloque, de cualquier hilo (AppTest corre el script en otro)."""
+        prev, self._scope = self._scope, label
+        try: yield self
+        finally: self._scope = prev
+
+    def record(self, op, kind, sheet, cells, ms, code):
+        with self._lock:
+            self.entries.append({"seq": len(self.entries) + 1, "t": round(time.time(), 3), "op": op, "kind": kind,
+                                 "sheet": sheet, "cells": cells, "ms": round(ms, 2), "code": code,
+                                 "scope": self._scope})
+
+    def __len__(self):
+        return len(self.entries)
+
+    def since(self, n=0):
+        with self._lock:
+            return list(self.entries[n:])
+
+    def counts(self, by="op", entries=None):
+        out = {}
+        for e in self.since() if entries is None else entries:
+            out[e[by]] = out.get(e[by], 0) + 1
+        return out
+
+    def summary(self, entries=None):
+        """Filas por (scope, op): llamadas, 429, celdas, ms totales."""
+        rows = {}
+        for e in self.since() if entries is None else entries:
+            r = rows.setdefault((e["scope"] or "", e["op"]), {"scope": e["scope"] or "", "op": e["op"], "kind": e["kind"],
+                                                              "calls": 0, "errors_429": 0, "cells": 0, "ms": 0.0})
+            r["calls"] += 1; r["errors_429"] += e["code"] == 429; r["cells"] += e["cells"]; r["ms"] += e["ms"]
+        return [dict(r, ms=round(r["ms"], 1)) for _, r in sorted(rows.items())]
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for e in self.since(): f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+    def reset(self):
+        with self._lock: self.entries = []
+
+
+# ===== "Servidor" =====
+class FakeSheetsAPI:
+    def __init__(self, latency=0.0, jitter=0.0, quota_per_min=None, window=60.0, fail_rate=0.0, seed=0, ledger=None):
+        """quota_per_min None = sin cuota; `window` permite acortar el minuto en pruebas."""
+        self.latency, self.jitter = float(latency), float(jitter)
+        self.quota_per_min, self.window = quota_per_min, float(window)
+        self.fail_rate = float(fail_rate)
+        self.ledger = ledger or Ledger()
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = {READ: deque(), WRITE: deque()}   # instantes de las llamadas aceptadas en la ventana
+        self._files = {}                       # id -> FakeSpreadsheet
+        self._ids = itertools.count(1)
+
+    @contextmanager
+    def call(self, op, kind, sheet=""):
+        """Cuota + latencia + registro alrededor de una operación. `info["cells"]` lo completa quien llama."""
+        info = {"cells": 0}
+        t = time.perf_counter()
+        with self._lock:
+            now = time.monotonic()
+            rejected = False
+            if kind in self._recent:
+                recent = self._recent[kind]
+                while recent and now - recent[0] >= self.window: recent.popleft()
+                rejected = (self.quota_per_min is not None and len(recent) >= self.quota_per_min) \
+                    or (self.fail_rate > 0 and self._rnd.random() < self.fail_rate)
+                if not rejected: recent.append(now)
+            delay = max(0.0, self.latency + (self._rnd.uniform(-self.jitter, self.jitter) if self.jitter else 0.0))
+        if delay: time.sleep(delay)
+        if rejected:
+            self.ledger.record(op, kind, sheet, 0, (time.perf_counter() - t) * 1000, 429)
+            raise quota_error(kind)
+        try:
+            yield info
+        except Exception as e:
+            code = 404 if isinstance(e, (SpreadsheetNotFound, WorksheetNotFound)) else 400
+            self.ledger.record(op, kind, sheet, info["cells"], (time.perf_counter() - t) * 1000, code)
+            raise
+        self.ledger.record(op, kind, sheet, info["cells"], (time.perf_counter() - t) * 1000, 200)
+
+    def create(self, title, values=None):
+        """Crea un archivo con una hoja "Sheet1" (sin contar como llamada: es preparación)."""
+        sh = FakeSpreadsheet(self, f"fake{next(self._ids):04d}", title)
+        if values: sh._sheets[0]._write(0, 0, values)
+        self._files[sh.id] = sh
+        return sh
+
+    def client(self):
+        return FakeClient(self)
+
+    def _open(self, key):
+        sh = self._files.get(key)
+        if sh is None: raise SpreadsheetNotFound(key)
+        return sh
+
+
+class FakeClient:
+    """Lo que devuelve gspread.authorize()."""
+    def __init__(self, api):
+        self.api = api
+
+    def open_by_key(self, key):
+        with self.api.call("open", READ, key):
+            return self.api._open(key)
+
+    def open_by_url(self, url):
+        key = url.split("/d/", 1)[-1].split("/", 1)[0]
+        with self.api.call("open", READ, key):
+            return self.api._open(key)
+
+    def open(self, title):
+        with self.api.call("open", DRIVE, title):
+            for sh in self.api._files.values():
+                if sh.title == title: return sh
+            raise SpreadsheetNotFound(title)
+
+    def openall(self):
+        with self.api.call("list", DRIVE):
+            return list(self.api._files.values())
+
+    def create(self, title):
+        with self.api.call("create", DRIVE, title):
+            return self.api.create(title)
+
+
+class FakeSpreadsheet:
+    def __init__(self, api, key, title):
+        self.api, self.id, self.title = api, key, title
+        self.url = f"https://docs.google.com/spreadsheets/d/{key}/edit"
+        self._sheets = [FakeWorksheet(self, 0, "Sheet1")]
+        self._mtime = datetime.now(timezone.utc)
+
+    def _touch(self):
+        # modifiedTime estrictamente creciente (dos escrituras seguidas no comparten versión)
+        self._mtime = max(datetime.now(timezone.utc), self._mtime + timedelta(milliseconds=1))
+
+    @property
+    def sheet1(self):
+        with self.api.call("metadata", READ, self.title):
+            return self._sheets[0]
+
+    def worksheets(self):
+        with self.api.call("metadata", READ, self.title):
+            return list(self._sheets)
+
+    def get_worksheet(self, index):
+        with self.api.call("metadata", READ, self.title):
+            return self._sheets[index] if 0 <= index < len(self._sheets) else None
+
+    def worksheet(self, title):
+        with self.api.call("metadata", READ, self.title):
+            for ws in self._sheets:
+                if ws.title == title: return ws
+            raise WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        with self.api.call("add_worksheet", WRITE, self.title):
+            ws = FakeWorksheet(self, max(w.id for w in self._sheets) + 1, title)
+            self._sheets.insert(len(self._sheets) if index is None else index, ws)
+            self._touch()
+            return ws
+
+    def get_lastUpdateTime(self):
+        with self.api.call("drive_modified_time", DRIVE, self.title):
+            return self._mtime.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+    def batch_update(self, body):
+        """Sólo deleteDimension (lo único que envía sheet_sync)."""
+        with self.api.call("spreadsheet_batch_update", WRITE, self.title):
+            for req in body.get("requests", []):
+                if "deleteDimension" not in req:
+                    raise NotImplementedError(f"fake_sheets: petición no soportada {list(req)}")
+                rng = req["deleteDimension"]["range"]
+                ws = next(w for w in self._sheets if w.id == rng["sheetId"])
+                a, b = rng["startIndex"], rng["endIndex"]
+                if rng["dimension"] == "ROWS": del ws._grid[a:b]
+                else: ws._grid = [r[:a] + r[b:] for r in ws._grid]
+            self._touch()
+            return {"replies": [{} for _ in body.get("requests", [])]}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id, title):
+        self.spreadsheet, self.id, self.title = spreadsheet, sheet_id, title
+        self._grid = []                    # filas de texto, sin relleno garantizado
+
+    def __repr__(self):
+        return f"<FakeWorksheet {self.title!r} id:{self.id}>"
+
+    @property
+    def _call(self):
+        return self.spreadsheet.api.call
+
+    @property
+    def row_count(self):
+        return max(1000, len(self._grid))
+
+    @property
+    def col_count(self):
+        return max([26] + [len(r) for r in self._grid])
+
+    # ---- grilla ----
+    def _used(self):
+        """Filas sin los vacíos del final (de cada fila y de la hoja), como responde la API."""
+        rows = [list(r) for r in self._grid]
+        for r in rows:
+            while r and r[-1] == "": r.pop()
+        while rows and not rows[-1]: rows.pop()
+        return rows
+
+    def _last_row(self):
+        n = len(self._grid)
+        while n and not any(self._grid[n - 1]): n -= 1
+        return n
+
+    def _write(self, r0, c0, values):
+        cells = 0
+        for i, row in enumerate(values):
+            r = r0 + i
+            while len(self._grid) <= r: self._grid.append([])
+            line = self._grid[r]
+            for j, v in enumerate(row):
+                c = c0 + j
+                if len(line) <= c: line.extend([""] * (c + 1 - len(line)))
+                line[c] = "" if v is None else str(v); cells += 1
+        return cells
+
+    def _bounds(self, range_name):
+        g = a1_range_to_grid_range(range_name.split("!")[-1]) if range_name else {}
+        return (g.get("startRowIndex", 0), g.get("endRowIndex"), g.get("startColumnIndex", 0), g.get("endColumnIndex"))
+
+    def _clear_range(self, range_name):
+        r0, r1, c0, c1 = self._bounds(range_name)
+        for line in self._grid[r0:r1]:
+            for c in range(c0, min(len(line), c1 if c1 is not None else len(line))): line[c] = ""
+
+    # ---- lecturas ----
+    def get(self, range_name=None, pad_values=False, **_):
+        with self._call("values_get", READ, self.spreadsheet.title) as info:
+            r0, r1, c0, c1 = self._bounds(range_name)
+            rows = [r[c0:c1] for r in self._used()[r0:r1]]
+            if range_name is not None:
+                for r in rows:
+                    while r and r[-1] == "": r.pop()
+                while rows and not rows[-1]: rows.pop()
+            if pad_values:
+                w = max((len(r) for r in rows), default=0)
+                rows = [r + [""] * (w - len(r)) for r in rows] or [[]]
+            info["cells"] = sum(len(r) for r in rows)
+            return rows
+
+    def get_all_values(self, **kw):
+        return self.get(pad_values=True)
+
+    def get_values(self, range_name=None, **kw):
+        return self.get(range_name, pad_values=True)
+
+    def get_all_records(self, head=1, expected_headers=None, default_blank="", empty2zero=False,
+                        numericise_ignore=(), allow_underscores_in_numeric_literals=False, **_):
+        values = self.get(pad_values=True)
+        if values == [[]] or len(values) < head: return []
+        ignore = list(numericise_ignore)
+        rows = [numericise_all(r, empty2zero=empty2zero, default_blank=default_blank,
+                               allow_underscores_in_numeric_literals=allow_underscores_in_numeric_literals,
+                               ignore=ignore) for r in values[head:]]
+        return to_records(values[head - 1], rows)
+
+    def row_values(self, row, **_):
+        with self._call("values_get", READ, self.spreadsheet.title) as info:
+            used = self._used()
+            out = list(used[row - 1]) if row - 1 < len(used) else []
+            info["cells"] = len(out)
+            return out
+
+    def col_values(self, col, **_):
+        with self._call("values_get", READ, self.spreadsheet.title) as info:
+            out = [r[col - 1] if len(r) >= col else "" for r in self._used()]
+            while out and out[-1] == "": out.pop()
+            info["cells"] = len(out)
+            return out
+
+    # ---- escrituras ----
+    def update(self, values=None, range_name=None, **_):
+        if isinstance(values, str):       # firma vieja update(rango, valores)
+            values, range_name = range_name, values
+        with self._call("values_update", WRITE, self.spreadsheet.title) as info:
+            r0, _, c0, _ = self._bounds(range_name)
+            info["cells"] = self._write(r0, c0, values)
+            self.spreadsheet._touch()
+            return {"updatedCells": info["cells"]}
+
+    def batch_update(self, data, **_):
+        with self._call("values_batch_update", WRITE, self.spreadsheet.title) as info:
+            for d in data:
+                r0, _, c0, _ = self._bounds(d["range"])
+                info["cells"] += self._write(r0, c0, d["values"])
+            self.spreadsheet._touch()
+            return {"totalUpdatedCells": info["cells"]}
+
+    def batch_clear(self, ranges):
+        with self._call("values_batch_clear", WRITE, self.spreadsheet.title):
+            for rng in ranges: self._clear_range(rng)
+            self.spreadsheet._touch()
+            return {"clearedRanges": list(ranges)}
+
+    def clear(self):
+        with self._call("values_clear", WRITE, self.spreadsheet.title):
+            self._grid = []
+            self.spreadsheet._touch()
+            return {}
+
+    def append_rows(self, values, value_input_option=None, **_):
+        with self._call("values_append", WRITE, self.spreadsheet.title) as info:
+            info["cells"] = self._write(self._last_row(), 0, values)
+            self.spreadsheet._touch()
+            return {"updates": {"updatedRows": len(values), "updatedCells": info["cells"]}}
+
+    def append_row(self, values, value_input_option=None, **kw):
+        return self.append_rows([values], value_input_option, **kw)
+
+
+# ===== Backend de la app =====
+def _setting(name):
+    """Variable de entorno o secreto (en ese orden); None si no está."""
+    raw = os.getenv(name)
+    if raw is None:
+        from data_layer import _str_secret
+        raw = _str_secret(name, "")
+    return raw or None
+
+
+def api_from_settings():
+    ms = lambda name: float(_setting(name) or 0) / 1000
+    quota = _setting("FAKE_SHEETS_QUOTA")
+    return FakeSheetsAPI(latency=ms("FAKE_SHEETS_LATENCY_MS"), jitter=ms("FAKE_SHEETS_JITTER_MS"),
+                         quota_per_min=int(quota) if quota else None,
+                         fail_rate=float(_setting("FAKE_SHEETS_FAIL_RATE") or 0))
+
+
+_shared = {"api": None, "lock": threading.Lock()}
+
+def shared_api():
+    """Un servidor simulado por proceso (lo comparten todas las sesiones, como la hoja real)."""
+    with _shared["lock"]:
+        if _shared["api"] is None: _shared["api"] = api_from_settings()
+        return _shared["api"]
+
+
+def seed_tables(api, csv_dir=".", tables=None):
+    """Un archivo por tabla con el contenido de su CSV. Devuelve {tabla: url}."""
+    import pandas as pd
+    from data_layer import TABLES
+    urls = {}
+    for t in tables or TABLES:
+        spec = TABLES[t]
+        path = os.path.join(csv_dir, spec["csv"])
+        df = pd.read_csv(path, dtype=str, keep_default_na=False) if os.path.exists(path) else \
+            pd.DataFrame(spec.get("seed") or [], columns=None if spec.get("seed") else spec["cols"]).astype(str)
+        urls[t] = api.create(t, [list(df.columns)] + df.values.tolist()).url
+    return urls
+
+
+def backend(api=None, csv_dir="."):
+    """SheetsBackend contra el simulador, con todas las tablas sembradas desde `csv_dir`."""
+    from data_layer import SheetsBackend
+    api = api or shared_api()
+    b = SheetsBackend(client=api.client(), urls=seed_tables(api, csv_dir))
+    b.name = "fake_sheets"
+    b.api = api
+    return b
+
+
+def view_calls(views=("Mapa", "Colegio", "Ranking", "Asistencia", "Ficha", "Control", "Config"), sid=2, colegio=1, runs=2):
+    """Llamadas a la API de cada vista (AppTest), primera carga y recargas. Devuelve el resumen del ledger."""
+    from streamlit.testing.v1 import AppTest
+    from data_layer import storage
+    os.environ["STORAGE_BACKEND"] = "fake_sheets"
+    storage.clear()
+    api = shared_api()
+    out = []
+    for v in views:
+        for n in range(runs):
+            at = AppTest.from_file("app.py", default_timeout=120)
+            at.query_params["view"] = v
+            if v == "Ficha": at.query_params["sid"] = str(sid)
+            at.session_state["selected_colegio"] = colegio
+            start = len(api.ledger)
+            with api.ledger.scope(f"{v}#{n + 1}"):
+                at.run()
+            entries = api.ledger.since(start)
+            out.append({"view": v, "run": n + 1, "calls": len(entries), "reads": sum(e["kind"] == READ for e in entries),
+                        "writes": sum(e["kind"] == WRITE for e in entries), "drive": sum(e["kind"] == DRIVE for e in entries),
+                        "errors_429": sum(e["code"] == 429 for e in entries),
+                        "ms": round(sum(e["ms"] for e in entries), 1), "exception": bool(at.exception)})
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Llamadas a la API de Sheets (simulada) por vista")
+    ap.add_argument("cmd", choices=["views"])
+    ap.add_argument("--latency-ms", type=float)
+    ap.add_argument("--quota", type=int)
+    ap.add_argument("--ledger", help="guardar cada llamada en este JSONL")
+    a = ap.parse_args()
+    import logging; logging.disable(logging.WARNING)
+    from fake_sheets import view_calls, shared_api   # la misma instancia que importa data_layer, no __main__
+    if a.latency_ms is not None: os.environ["FAKE_SHEETS_LATENCY_MS"] = str(a.latency_ms)
+    if a.quota is not None: os.environ["FAKE_SHEETS_QUOTA"] = str(a.quota)
+    rows = view_calls()
+    print(f"{'vista':<10}{'carga':>6}{'llamadas':>10}{'lect.':>7}{'escr.':>7}{'drive':>7}{'429':>5}{'ms':>10}")
+    for r in rows:
+        print(f"{r['view']:<10}{r['run']:>6}{r['calls']:>10}{r['reads']:>7}{r['writes']:>7}{r['drive']:>7}"
+              f"{r['errors_429']:>5}{r['ms']:>10.1f}{'  (excepción en la vista)' if r['exception'] else ''}")
+    if a.ledger:
+        shared_api().ledger.dump(a.ledger); print(f"[OK] ledger -> {a.ledger}")
+    sys.exit(0)
@@ -0,0 +1,92 @@
+# history_index.py
+from bisect import bisect_right
+
+import pandas as pd
+
+
+class HistoryIndex:
+    """Índice id → filas ordenadas por timestamp sobre una tabla de historial (logs u observaciones).
+
+    Se construye una vez por versión de datos y se actualiza en memoria al agregar o borrar,
+    así que leer el historial de un estudiante cuesta O(filas del estudiante), no O(tabla).
+    `ordered` dice si la tabla completa (frame) está en orden de timestamp, como queda al agregar en orden.
+    """
+
+    TAIL_MAX = 2000   # filas agregadas que se acumulan antes de compactar en el frame principal
+
+    def __init__(self, df: pd.DataFrame, version=None):
+        self.version = version
+        self._main = df.reset_index(drop=True)
+        self._tail = []                    # filas (dict) agregadas después de construir
+        self._tail_start = len(self._main) # etiqueta de la primera fila de _tail
+        self._by_id = {}                   # id -> (timestamps asc, etiquetas)
+        ids = pd.to_numeric(self._main["id"], errors="coerce") if "id" in self._main else pd.Series(dtype=float)
+        ts = self._main["timestamp"].astype(str) if "timestamp" in self._main else pd.Series(dtype=str)
+        self.ordered = ts.is_monotonic_increasing
+        self._last_ts = ts.iloc[-1] if len(ts) else ""
+        order = pd.DataFrame({"id": ids, "ts": ts}).dropna(subset=["id"]).sort_values("ts", kind="stable")
+        ts_arr = order["ts"].to_numpy()
+        lab_arr = order.index.to_numpy()
+        for sid, pos in order.groupby(order["id"].astype(int)).indices.items():
+            self._by_id[int(sid)] = (ts_arr[pos].tolist(), lab_arr[pos].tolist())
+
+    def __len__(self):
+        return len(self._main) + len(self._tail)
+
+    def _rows(self, labels):
+        main = [l for l in labels if l < self._tail_start]
+        if len(main) == len(labels):
+            return self._main.loc[labels]
+        tail_labels = [l for l in labels if l >= self._tail_start]
+        tail = pd.DataFrame([self._tail[l - self._tail_start] for l in tail_labels], index=tail_labels)
+        out = pd.concat([self._main.loc[main], tail]) if main else tail
+        return out.loc[labels]
+
+    def rows_for(self, student_id, limit=None) -> pd.DataFrame:
+        """Filas del estudiante, de la más reciente a la más antigua."""
+        _, labels = self._by_id.get(int(student_id), ([], []))
+        labels = labels[::-1] if limit is None else labels[:-limit - 1:-1]
+        if not labels:
+            return self._main.iloc[0:0].copy()
+        return self._rows(labels).copy()
+
+    def append(self, rows):
+        for r in rows:
+            try: sid = int(r["id"])
+            except (KeyError, TypeError, ValueError): continue
+            label = self._tail_start + len(self._tail)
+            self._tail.append(dict(r))
+            ts_list, labels = self._by_id.setdefault(sid, ([], []))
+            ts = str(r.get("timestamp", ""))
+            if ts < self._last_ts: self.ordered = False
+            else: self._last_ts = ts
+            pos = bisect_right(ts_list, ts)
+            ts_list.insert(pos, ts); labels.insert(pos, label)
+        if len(self._tail) > self.TAIL_MAX:
+            self._compact()
+
+    def _compact(self):
+        if not self._tail: return
+        start = self._tail_start
+        tail = pd.DataFrame(self._tail, index=range(start, start + len(self._tail)))
+        self._main = pd.concat([self._main, tail]) if len(self._main) else tail
+        self._tail_start = start + len(self._tail)
+        self._tail = []
+
+    def frame(self) -> pd.DataFrame:
+        """Tabla completa (incluye lo agregado en memoria), en el orden original."""
+        self._compact()
+        return self._main
+
+    def delete(self, student_id, timestamps) -> int:
+        """Quita las filas del estudiante con esos timestamps. Devuelve cuántas se quitaron."""
+        sid = int(student_id); timestamps = {str(t) for t in timestamps}
+        ts_list, labels = self._by_id.get(sid, ([], []))
+        keep = [(t, l) for t, l in zip(ts_list, labels) if t not in timestamps]
+        drop = [l for t, l in zip(ts_list, labels) if t in timestamps]
+        if not drop:
+            return 0
+        self._compact()
+        self._main = self._main.drop(index=drop)   # las etiquetas quedan estables (con huecos)
+        self._by_id[sid] = ([t for t, _ in keep], [l for _, l in keep])
+        return len(drop)
@@ -0,0 +1,171 @@
+# leaderboard.py
+from bisect import bisect_left, insort
+
+import numpy as np
+import pandas as pd
+
+class _Ranking:
+    """Lista ordenada de (-puntaje, id): insertar o mover un estudiante cuesta una búsqueda binaria."""
+
+    def __init__(self, keys=()):
+        self._keys = list(keys)            # ya ordenadas
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, sid, score):
+        insort(self._keys, (-int(score), int(sid)))
+
+    def remove(self, sid, score):
+        k = (-int(score), int(sid))
+        pos = bisect_left(self._keys, k)
+        if pos < len(self._keys) and self._keys[pos] == k:
+            del self._keys[pos]
+
+    def top(self, k):
+        return [(i, -s) for s, i in self._keys[:k]]
+
+    def rank(self, sid, score):
+        """Puesto (1 = primero) de un estudiante con ese puntaje; empates por id."""
+        return bisect_left(self._keys, (-int(score), int(sid))) + 1
+
+
+class Leaderboard:
+    """Ranking de XP total y XP de la semana: global, por colegio, por grupo y por colegio + grupo.
+
+    Se arma una vez desde las tablas de estudiantes y logs; después cada cambio de XP, colegio o grupo
+    mueve sólo a los estudiantes tocados (`update_students`) y cada log nuevo o borrado suma o resta en la
+    semana (`add_logs`), sin volver a ordenar todo. `week_start` es el lunes ('YYYY-MM-DD') de la semana.
+    """
+
+    def __init__(self, students_df: pd.DataFrame, logs_df: pd.DataFrame | None = None, week_start: str = ""):
+        self.week_start = week_start
+        self.versions = {}                 # tabla -> versión de los datos con que está al día
+        self._info = {}                    # id -> (colegio_id, grupo, xp)
+        self._week = {}                    # id -> XP ganado en la semana
+        self._rank = {"xp": {}, "week": {}}
+        df = self._frame = self._normalize(students_df)
+        self._names = dict(zip(df.index, df["name"]))
+        self._info = {int(i): (int(c), g, int(x)) for i, c, g, x in
+                      zip(df.index, df["colegio_id"], df["grupo"], df["xp"])}
+        if logs_df is not None and len(logs_df) and {"id", "timestamp", "delta_xp"} <= set(logs_df.columns):
+            ts = logs_df["timestamp"].astype(str)
+            recent = logs_df[ts >= week_start]
+            ids = pd.to_numeric(recent["id"], errors="coerce")
+            delta = pd.to_numeric(recent["delta_xp"], errors="coerce").fillna(0)
+            week = delta[ids.notna()].groupby(ids[ids.notna()].astype(int)).sum()
+            self._week = {int(i): int(v) for i, v in week.items() if int(i) in self._info and v}
+        # un solo ordenamiento por métrica; cada alcance toma sus posiciones, que ya vienen en orden
+        ids = df.index.to_numpy()
+        for metric in ("xp", "week"):
+            score = df["xp"] if metric == "xp" else pd.Series(self._week, dtype="int64").reindex(df.index).fillna(0)
+            neg = -score.astype("int64").to_numpy()
+            order = np.lexsort((ids, neg))
+            keys = list(zip(neg[order].tolist(), ids[order].tolist()))
+            frame = df.iloc[order]
+            self._rank[metric][("global",)] = _Ranking(keys)
+            for cols, scope in ((["colegio_id"], "colegio"), (["grupo"], "grupo"), (["colegio_id", "grupo"], "colegio_grupo")):
+                for key, pos in frame.groupby(cols, sort=False).indices.items():
+                    key = key if isinstance(key, tuple) else (key,)
+                    key = tuple(int(k) if c == "colegio_id" else k for c, k in zip(cols, key))
+                    self._rank[metric][(scope, *key)] = _Ranking([keys[p] for p in pos])
+
+    @staticmethod
+    def _normalize(df):
+        df = df.copy()
+        df["id"] = pd.to_numeric(df["id"], errors="coerce")
+        df = df[df["id"].notna()].drop_duplicates("id", keep="first")
+        text = lambda c: df[c].fillna("").astype(str).to_numpy() if c in df else ""
+        num = lambda c: pd.to_numeric(df[c], errors="coerce").fillna(0).astype(int).to_numpy() if c in df else 0
+        return pd.DataFrame({"name": text("name"), "grupo": text("grupo"), "colegio_id": num("colegio_id"), "xp": num("xp")},
+                            index=df["id"].astype(int).to_numpy())
+
+    def __len__(self):
+        return len(self._info)
+
+    @staticmethod
+    def _scopes(colegio_id, grupo):
+        return [("global",), ("colegio", colegio_id), ("grupo", grupo), ("colegio_grupo", colegio_id, grupo)]
+
+    def _place(self, metric, sid, colegio_id, grupo, score, add=True):
+        for key in self._scopes(colegio_id, grupo):
+            r = self._rank[metric].get(key)
+            if add:
+                if r is None: r = self._rank[metric][key] = _Ranking()
+                r.add(sid, score)
+            elif r is not None:
+                r.remove(sid, score)
+
+    # ---- mutaciones ----
+    def update_students(self, students_df: pd.DataFrame) -> int:
+        """Sincroniza con la tabla de estudiantes guardada; mueve sólo las filas que cambiaron. Devuelve cuántas."""
+        df = self._normalize(students_df)
+        old = self._frame.reindex(df.index)
+        moved = (old["xp"].isna() | (df["xp"] != old["xp"]) | (df["colegio_id"] != old["colegio_id"])
+                 | (df["grupo"] != old["grupo"])).to_numpy()
+        renamed = (df["name"] != old["name"]).to_numpy() & ~moved
+        gone = self._frame.index.difference(df.index)
+        for sid in gone:
+            self._drop(int(sid))
+        for sid, name, g, c, xp in df[moved].itertuples():
+            sid, c, xp = int(sid), int(c), int(xp)
+            if sid in self._info: self._drop(sid)
+            self._info[sid] = (c, g, xp); self._names[sid] = name
+            self._place("xp", sid, c, g, xp)
+            self._place("week", sid, c, g, self._week.get(sid, 0))
+        self._names.update(zip(df.index[renamed], df["name"][renamed]))
+        self._frame = df
+        return int(moved.sum()) + len(gone)
+
+    def _drop(self, sid):
+        colegio_id, grupo, xp = self._info.pop(sid)
+        self._names.pop(sid, None)
+        self._place("xp", sid, colegio_id, grupo, xp, add=False)
+        self._place("week", sid, colegio_id, grupo, self._week.get(sid, 0), add=False)
+
+    def add_logs(self, rows, sign=1):
+        """Suma (o resta, con sign=-1) al XP de la semana los logs de esta semana."""
+        for r in rows:
+            try: sid = int(r["id"]); delta = int(r.get("delta_xp", 0) or 0)
+            except (KeyError, TypeError, ValueError): continue
+            if not delta or str(r.get("timestamp", "")) < self.week_start: continue
+            before = self._week.get(sid, 0)
+            self._week[sid] = before + sign * delta
+            if sid in self._info:
+                colegio_id, grupo, _ = self._info[sid]
+                self._place("week", sid, colegio_id, grupo, before, add=False)
+                self._place("week", sid, colegio_id, grupo, self._week[sid])
+
+    # ---- consultas ----
+    def _key(self, colegio_id=None, grupo=None):
+        if colegio_id is not None and grupo: return ("colegio_grupo", int(colegio_id), str(grupo))
+        if colegio_id is not None: return ("colegio", int(colegio_id))
+        if grupo: return ("grupo", str(grupo))
+        return ("global",)
+
+    def top(self, k=10, by="xp", colegio_id=None, grupo=None) -> pd.DataFrame:
+        """Los k primeros del alcance pedido (por XP total o por XP de la semana)."""
+        r = self._rank[by].get(self._key(colegio_id, grupo))
+        rows = []
+        for pos, (sid, _) in enumerate(r.top(k) if r else [], start=1):
+            c, g, xp = self._info[sid]
+            rows.append({"rank": pos, "id": sid, "name": self._names.get(sid, ""), "colegio_id": c, "grupo": g,
+                         "xp": xp, "week_xp": self._week.get(sid, 0)})
+        return pd.DataFrame(rows, columns=["rank", "id", "name", "colegio_id", "grupo", "xp", "week_xp"])
+
+    def size(self, colegio_id=None, grupo=None) -> int:
+        r = self._rank["xp"].get(self._key(colegio_id, grupo))
+        return len(r) if r else 0
+
+    def rank_of(self, student_id, by="xp", colegio_id=None, grupo=None):
+        """Puesto del estudiante en el alcance (None si no está)."""
+        sid = int(student_id)
+        if sid not in self._info: return None
+        c, g, xp = self._info[sid]
+        if (colegio_id is not None and int(colegio_id) != c) or (grupo and str(grupo) != g): return None
+        score = xp if by == "xp" else self._week.get(sid, 0)
+        return self._rank[by][self._key(colegio_id, grupo)].rank(sid, score)
+
+    def grupos(self, colegio_id=None):
+        return sorted({k[-1] for k in self._rank["xp"] if k[0] == ("colegio_grupo" if colegio_id is not None else "grupo")
+                       and (colegio_id is None or k[1] == int(colegio_id)) and k[-1] and len(self._rank["xp"][k])})
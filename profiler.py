@@ -0,0 +1,141 @@
+# profiler.py
+"""Perfil de cada ejecución del script (?profile=1).
+
+Streamlit corre el script de cada sesión en su propio hilo, así que la corrida activa vive en un
+threading.local: sin `start(True)` los decoradores no hacen nada más que una consulta.
+    - `timed(cat)` mide una función (tiempo total y propio, filas/bytes de lo que devuelve),
+    - `phase(nombre)` marca el tramo del script (inicio, datos, vista: Mapa, ...),
+    - `cache(nombre, hit)` cuenta aciertos y fallos de las cachés de la app,
+    - `finish()` cierra la corrida, la agrega a PROFILE_TRACE (JSONL) si está configurado y la devuelve.
+"""
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_tls = threading.local()
+
+
+def _payload(out):
+    """(filas, bytes) aproximados de lo que devolvió una función medida."""
+    if isinstance(out, tuple) and out:
+        out = out[0]
+    try:
+        import pandas as pd
+        if isinstance(out, pd.DataFrame):
+            return len(out), int(out.memory_usage(index=True, deep=False).sum())
+    except ImportError:
+        pass
+    if hasattr(out, "size") and hasattr(out, "mode") and hasattr(out, "getbands"):   # PIL.Image
+        w, h = out.size
+        return None, w * h * len(out.getbands())
+    if isinstance(out, (bytes, bytearray)):
+        return None, len(out)
+    if isinstance(out, (list, dict)):
+        return len(out), None
+    return None, None
+
+
+class RunProfile:
+    def __init__(self, info=None):
+        self.info = dict(info or {})
+        self.t0 = time.perf_counter()
+        self.phases = []                   # [nombre, inicio]
+        self.funcs = {}                    # (cat, nombre) -> agregados
+        self.caches = {}                   # nombre -> [aciertos, fallos]
+        self._stack = []                   # tiempo de hijos de cada span abierto
+        self.total_ms = None
+
+    @contextmanager
+    def span(self, name, cat):
+        self._stack.append(0.0)
+        t = time.perf_counter()
+        info = {"rows": None, "bytes": None}
+        try:
+            yield info
+        finally:
+            ms = (time.perf_counter() - t) * 1000
+            child = self._stack.pop()
+            if self._stack: self._stack[-1] += ms
+            f = self.funcs.setdefault((cat, name), {"cat": cat, "name": name, "calls": 0, "ms": 0.0, "self_ms": 0.0,
+                                                     "max_ms": 0.0, "rows": 0, "bytes": 0})
+            f["calls"] += 1; f["ms"] += ms; f["self_ms"] += ms - child; f["max_ms"] = max(f["max_ms"], ms)
+            f["rows"] += info["rows"] or 0; f["bytes"] += info["bytes"] or 0
+
+    def phase(self, name):
+        self.phases.append([name, time.perf_counter()])
+
+    def cache(self, name, hit, n=1):
+        self.caches.setdefault(name, [0, 0])[0 if hit else 1] += n
+
+    def close(self):
+        if self.total_ms is None:
+            self.total_ms = (time.perf_counter() - self.t0) * 1000
+        return self
+
+    def to_dict(self):
+        end = self.t0 + (self.total_ms or 0) / 1000
+        marks = self.phases + [[None, end]]
+        phases = [{"phase": n, "ms": round((marks[i + 1][1] - t) * 1000, 2)} for i, (n, t) in enumerate(self.phases)]
+        funcs = sorted(self.funcs.values(), key=lambda f: -f["self_ms"])
+        by_cat = {}
+        for f in funcs: by_cat[f["cat"]] = by_cat.get(f["cat"], 0.0) + f["self_ms"]
+        measured = sum(by_cat.values())
+        by_cat["resto (widgets, script)"] = max(0.0, (self.total_ms or 0) - measured)
+        return {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), **self.info, "total_ms": round(self.total_ms or 0, 2),
+                "phases": phases, "by_cat": {k: round(v, 2) for k, v in by_cat.items()},
+                "funcs": [dict(f, ms=round(f["ms"], 2), self_ms=round(f["self_ms"], 2), max_ms=round(f["max_ms"], 2))
+                          for f in funcs],
+                "caches": {k: {"hits": h, "misses": m} for k, (h, m) in sorted(self.caches.items())}}
+
+
+def start(enabled, **info):
+    """Abre la corrida de este hilo (o la apaga si `enabled` es falso)."""
+    _tls.run = RunProfile(info) if enabled else None
+    return _tls.run
+
+
+def current():
+    return getattr(_tls, "run", None)
+
+
+def phase(name):
+    run = current()
+    if run is not None: run.phase(name)
+
+
+def cache(name, hit, n=1):
+    run = current()
+    if run is not None: run.cache(name, hit, n)
+
+
+def timed(cat, name=None):
+    """Decorador: mide la función sólo si hay una corrida activa en el hilo."""
+    def deco(fn):
+        label = name or fn.__name__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = current()
+            if run is None:
+                return fn(*args, **kwargs)
+            with run.span(label, cat) as info:
+                out = fn(*args, **kwargs)
+                info["rows"], info["bytes"] = _payload(out)
+                return out
+        return wrapper
+    return deco
+
+
+def finish(trace_path=None, **extra):
+    """Cierra la corrida del hilo; con `trace_path` agrega una línea JSON. Devuelve el dict o None."""
+    run = current()
+    if run is None:
+        return None
+    run.close()
+    run.info.update(extra)
+    data = run.to_dict()
+    if trace_path:
+        with open(trace_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+    return data
@@ -0,0 +1,160 @@
+# render.py
+import os
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+# ===== Mapa de colegios =====
+MAP_W, MAP_H = 900, 550
+CASTLE       = 64
+GRID_STEP    = 50
+GRID_COLOR   = (255, 255, 255, 40)
+
+
+@lru_cache(maxsize=4)
+def load_font(size=16):
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def measure_text(draw, text, font):
+    try:
+        bbox = draw.textbbox((0, 0), text, font=font); return bbox[2] - bbox[0], bbox[3] - bbox[1]
+    except Exception:
+        try: return font.getsize(text)
+        except Exception: return (len(text)*8, 16)
+
+
+def map_asset_paths(map_img, colegios_df):
+    """Archivos de los que depende el mapa compuesto (fondo, castillos, fuente)."""
+    icons = [str(r.get("icono", "assets/castle1.png")) for _, r in colegios_df.iterrows()]
+    return [map_img, FONT_PATH] + sorted(set(icons))
+
+
+def asset_mtimes(paths):
+    out = []
+    for p in paths:
+        try: out.append((p, os.stat(p).st_mtime_ns))
+        except OSError: out.append((p, None))
+    return tuple(out)
+
+
+def compose_map(map_img, colegios_df, W=MAP_W, H=MAP_H):
+    """Fondo + grilla + castillos + etiquetas. Devuelve (imagen, cajas de clic)."""
+    try:
+        base = Image.open(map_img).convert("RGBA").resize((W, H), Image.LANCZOS)
+    except Exception:
+        base = Image.new("RGBA", (W, H), (30, 60, 90, 255))
+
+    img = base.copy(); d = ImageDraw.Draw(img)
+    for x in range(0, W, GRID_STEP): d.line([x, 0, x, H], fill=GRID_COLOR)
+    for y in range(0, H, GRID_STEP): d.line([0, y, W, y], fill=GRID_COLOR)
+
+    fnt = load_font(16)
+    castles = {}
+    boxes = []
+    for _, row in colegios_df.iterrows():
+        icon_path = str(row.get("icono", "assets/castle1.png"))
+        castle = castles.get(icon_path)
+        if castle is None:
+            try: castle = Image.open(icon_path).resize((CASTLE, CASTLE), Image.NEAREST)
+            except Exception: castle = Image.new("RGBA", (CASTLE, CASTLE), (120,120,120,255))
+            castles[icon_path] = castle
+        x, y = int(row["x"]), int(row["y"])
+        img.paste(castle, (x, y), castle)
+
+        name = str(row["nombre"])
+        text_w, text_h = measure_text(d, name, fnt)
+        pad_x, pad_y = 8, 4
+        left = max(4, min(x, W - (text_w + pad_x*2) - 4))
+        top = y + CASTLE + 3
+        right, bottom = left + text_w + pad_x*2, top + text_h + pad_y*2
+        d.rectangle([left, top, right, bottom], fill=(20, 30, 40, 200))
+        d.text((left + pad_x, top + pad_y), name, font=fnt, fill=(255,255,255,255))
+        boxes.append((x, y, x + CASTLE, y + CASTLE, int(row["id"]), name))
+    return img, boxes
+
+
+# ===== Barra de XP pixelada =====
+def hex_to_rgba(h,a=255):
+    try: h=h.lstrip('#'); return (int(h[0:2],16),int(h[2:4],16),int(h[4:6],16),a)
+    except: return (70,160,255,a)
+
+
+def _pixel_overlay_bar_image_ref(pct,width=560,height=22,color_hex="#46A0FF"):
+    """Versión original con putpixel; se conserva sólo como referencia para el benchmark."""
+    pct=max(0.0,min(1.0,float(pct))); W,H=width,height
+    img=Image.new("RGBA",(W,H),(0,0,0,0)); d=ImageDraw.Draw(img)
+    d.rectangle([0,0,W-1,H-1], outline=(190,210,255,220), width=2)
+    d.rectangle([2,2,W-3,H-3], outline=(10,18,36,255), width=1)
+    d.rectangle([3,3,W-4,H-4], fill=(25,36,64,230))
+    r,g,b,_=hex_to_rgba(color_hex); fill_w=max(0,int((W-6)*pct))
+    for x in range(3,3+fill_w):
+        for y in range(3,H-3):
+            if ((x+y)&1)==0: rx=min(255,r+18); gx=min(255,g+18); bx=min(255,b+18)
+            else: rx=max(0,r-12); gx=max(0,g-12); bx=max(0,b-12)
+            img.putpixel((x,y),(rx,gx,bx,235))
+    d.line([3,4,3+fill_w,4], fill=(255,255,255,90), width=1)
+    d.line([3,H-5,3+fill_w,H-5], fill=(0,0,0,110), width=1)
+    return img
+
+
+@lru_cache(maxsize=512)
+def _bar_image(fill_w, W, H, color_hex):
+    img=Image.new("RGBA",(W,H),(0,0,0,0)); d=ImageDraw.Draw(img)
+    d.rectangle([0,0,W-1,H-1], outline=(190,210,255,220), width=2)
+    d.rectangle([2,2,W-3,H-3], outline=(10,18,36,255), width=1)
+    d.rectangle([3,3,W-4,H-4], fill=(25,36,64,230))
+    if fill_w>0 and H>6:
+        r,g,b,_=hex_to_rgba(color_hex)
+        light=np.array([min(255,r+18),min(255,g+18),min(255,b+18),235], dtype=np.uint8)
+        dark=np.array([max(0,r-12),max(0,g-12),max(0,b-12),235], dtype=np.uint8)
+        arr=np.array(img)
+        ys=np.arange(3,H-3)[:,None]; xs=np.arange(3,3+fill_w)[None,:]
+        arr[3:H-3,3:3+fill_w]=np.where((((xs+ys)&1)==0)[...,None], light, dark)   # tramado en damero
+        img=Image.fromarray(arr); d=ImageDraw.Draw(img)
+    d.line([3,4,3+fill_w,4], fill=(255,255,255,90), width=1)
+    d.line([3,H-5,3+fill_w,H-5], fill=(0,0,0,110), width=1)
+    return img
+
+
+def pixel_overlay_bar_image(pct,width=560,height=22,color_hex="#46A0FF"):
+    # pct se cuantiza al ancho relleno en píxeles: misma imagen, clave de caché exacta
+    pct=max(0.0,min(1.0,float(pct))); W,H=width,height
+    fill_w=max(0,int((W-6)*pct))
+    return _bar_image(fill_w, W, H, color_hex).copy()
+
+
+def _bench_bars(n=40, width=460, height=18):
+    """Microbenchmark antes/después: n barras como en un ranking de colegio."""
+    import random
+    rnd=random.Random(7)
+    colors=["#8B5A2B","#CD5C5C","#C0C0C0","#FFD700","#55A0FF","#9B30FF"]
+    bars=[(rnd.random(), rnd.choice(colors)) for _ in range(n)]
+    for pct,c in bars:
+        a=np.array(_pixel_overlay_bar_image_ref(pct,width,height,c)); b=np.array(pixel_overlay_bar_image(pct,width,height,c))
+        assert (a==b).all(), (pct,c)
+    def run(fn):
+        t=time.perf_counter()
+        for pct,c in bars: fn(pct,width=width,height=height,color_hex=c)
+        return time.perf_counter()-t
+    _bar_image.cache_clear()
+    res={"ref_putpixel": run(_pixel_overlay_bar_image_ref),
+         "numpy_cold": run(pixel_overlay_bar_image),
+         "numpy_cached": run(pixel_overlay_bar_image)}
+    return res
+
+
+if __name__ == "__main__":
+    n=int(sys.argv[1]) if len(sys.argv)>1 else 40
+    res=_bench_bars(n)
+    print(f"{n} barras (pixeles idénticos verificados)")
+    for k,v in res.items():
+        print(f"  {k:<14} {v*1000:9.2f} ms   x{res['ref_putpixel']/max(v,1e-9):7.1f}")
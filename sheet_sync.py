@@ -0,0 +1,121 @@
+# sheet_sync.py
+"""Sincronización por diferencias de una hoja de Google Sheets.
+
+Compara la tabla nueva (encabezado + filas, como las que recibe `update`) con la última foto conocida
+de la hoja y envía sólo lo que cambió, en a lo más tres llamadas:
+    1. filas eliminadas: un spreadsheet.batch_update con deleteDimension (de abajo hacia arriba),
+    2. celdas cambiadas: un values batch_update con un rango por tramo contiguo de columnas,
+    3. filas nuevas: un append_rows.
+Las filas se emparejan por `key` (p. ej. ["id"]); sin clave, por la fila completa. Claves repetidas se
+distinguen por número de aparición. Los borrados y cambios van a posiciones de la foto: antes de usarla hay
+que comprobar que la hoja no cambió de filas (`key_range` / `keys_match`) o releerla. Si no hay foto o cambió el encabezado, se reescribe en el lugar
+(update + borrar lo que sobra), sin dejar la hoja vacía entre medio.
+"""
+from gspread.utils import rowcol_to_a1
+
+
+def _norm(values):
+    if not values or not values[0]:
+        return [], []
+    header = [str(h) for h in values[0]]
+    w = len(header)
+    rows = [[("" if v is None else str(v)) for v in (list(r) + [""] * w)[:w]] for r in values[1:]]
+    while rows and not any(rows[-1]):
+        rows.pop()
+    return header, rows
+
+
+def _keys(header, rows, key):
+    idx = [header.index(k) for k in key] if key and all(k in header for k in key) else None
+    seen, out = {}, []
+    for r in rows:
+        k = tuple(r[i] for i in idx) if idx else tuple(r)
+        n = seen.get(k, 0); seen[k] = n + 1
+        out.append((k, n))
+    return out
+
+
+def _runs(idxs):
+    """[3,4,5,9] -> [(3,6), (9,10)]"""
+    out = []
+    for i in idxs:
+        if out and out[-1][1] == i: out[-1][1] = i + 1
+        else: out.append([i, i + 1])
+    return [tuple(r) for r in out]
+
+
+def plan(old, new, key=None) -> dict:
+    """Qué enviar para pasar de `old` a `new`. `result` es cómo queda la hoja (la nueva foto)."""
+    oh, orows = _norm(old)
+    nh, nrows = _norm(new)
+    if not oh or oh != nh:
+        return {"full": True, "old_rows": len(orows) + 1, "old_cols": len(oh), "result": [nh] + nrows}
+    okeys, nkeys = _keys(oh, orows, key), _keys(nh, nrows, key)
+    new_by_key = dict(zip(nkeys, nrows))
+    keep = [i for i, k in enumerate(okeys) if k in new_by_key]
+    deleted = [i for i, k in enumerate(okeys) if k not in new_by_key]
+    updates = []                                        # (fila de hoja, primera col, valores), 1-based
+    for pos, i in enumerate(keep):
+        o, n = orows[i], new_by_key[okeys[i]]
+        for a, b in _runs([c for c in range(len(o)) if o[c] != n[c]]):
+            updates.append((pos + 2, a + 1, n[a:b]))
+    have = set(okeys)
+    appends = [r for k, r in zip(nkeys, nrows) if k not in have]
+    result = [oh] + [new_by_key[okeys[i]] for i in keep] + appends
+    return {"full": False, "deleted": deleted, "updates": updates, "appends": appends, "result": result}
+
+
+def key_range(old, key):
+    """Rango A1 de las columnas clave de la foto (p. ej. 'A:B'), para comprobar que la hoja sigue igual; None
+    si no hay clave (sin clave la única comprobación es releer la hoja entera)."""
+    header, _ = _norm(old)
+    if not header or not key or not all(k in header for k in key):
+        return None
+    idx = [header.index(k) + 1 for k in key]
+    return f"{rowcol_to_a1(1, min(idx))[:-1]}:{rowcol_to_a1(1, max(idx))[:-1]}"
+
+
+def keys_match(old, fresh, key) -> bool:
+    """¿`fresh` (lo leído en key_range) tiene el mismo encabezado y las mismas claves, en el mismo orden, que la
+    foto? Si no, alguien borró, agregó u ordenó filas y las posiciones de la foto ya no sirven."""
+    header, rows = _norm(old)
+    idx = [header.index(k) for k in key]
+    lo, hi = min(idx), max(idx) + 1
+    fh, frows = _norm(fresh)
+    if fh != header[lo:hi] or len(frows) != len(rows):
+        return False
+    return all(f[i - lo] == r[i] for f, r in zip(frows, rows) for i in idx)
+
+
+def apply(ws, old, new, key=None) -> dict:
+    """Envía el plan a la hoja `ws`. Devuelve la nueva foto y cuánto se mandó (llamadas, celdas)."""
+    p = plan(old, new, key)
+    calls = cells = 0
+    if p["full"]:
+        res = p["result"]
+        ws.update(res, value_input_option="RAW"); calls += 1
+        cells = sum(len(r) for r in res)
+        extra, w = [], len(res[0])
+        if p["old_rows"] > len(res) and p["old_cols"]:      # filas que sobran abajo
+            extra.append(f"{rowcol_to_a1(len(res) + 1, 1)}:{rowcol_to_a1(p['old_rows'], max(p['old_cols'], w))}")
+        if p["old_cols"] > w:                                 # columnas que sobran a la derecha
+            extra.append(f"{rowcol_to_a1(1, w + 1)}:{rowcol_to_a1(p['old_rows'], p['old_cols'])}")
+        if extra:
+            ws.batch_clear(extra); calls += 1
+        return {"result": res, "calls": calls, "cells": cells, "full": True, "deleted": 0, "updated": 0,
+                "appended": len(res) - 1}
+    if p["deleted"]:
+        reqs = [{"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS",
+                                               "startIndex": a + 1, "endIndex": b + 1}}}
+                for a, b in reversed(_runs(p["deleted"]))]
+        ws.spreadsheet.batch_update({"requests": reqs}); calls += 1
+    if p["updates"]:
+        data = [{"range": f"{rowcol_to_a1(r, c)}:{rowcol_to_a1(r, c + len(v) - 1)}", "values": [v]}
+                for r, c, v in p["updates"]]
+        ws.batch_update(data, value_input_option="RAW"); calls += 1
+        cells += sum(len(v) for _, _, v in p["updates"])
+    if p["appends"]:
+        ws.append_rows(p["appends"], value_input_option="RAW"); calls += 1
+        cells += sum(len(r) for r in p["appends"])
+    return {"result": p["result"], "calls": calls, "cells": cells, "full": False, "deleted": len(p["deleted"]),
+            "updated": len(p["updates"]), "appended": len(p["appends"])}
@@ -0,0 +1,233 @@
+# sqlite_store.py
+"""Backend SQLite (WAL) para estudiantes, logs, observaciones, asistencia, colegios y fotos de XP.
+
+Migración única desde los CSV actuales:
+    python sqlite_store.py migrate maestros.db
+"""
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+# tabla -> clave (None = sólo agregar, se usa rowid), columnas base, columnas enteras, índices
+TABLES = {
+    "students": {
+        "key": ["id"],
+        "cols": ["id","name","grupo","xp","colegio_id","phone","teacher","xp_delta","xp_reason","avatar",
+                 "trinket","trinket_desc"],
+        "ints": ["id","xp","colegio_id","xp_delta"],
+        "indexes": [["colegio_id"]],
+    },
+    "logs": {
+        "key": None,
+        "cols": ["timestamp","id","name","delta_xp","reason"],
+        "ints": ["id","delta_xp"],
+        "indexes": [["id"], ["id","timestamp"]],
+    },
+    "observaciones": {
+        "key": None,
+        "cols": ["timestamp","id","name","observacion"],
+        "ints": ["id"],
+        "indexes": [["id"], ["id","timestamp"]],
+    },
+    "attendance": {
+        "key": ["id","date"],
+        "cols": ["id","date","status"],
+        "ints": ["id"],
+        "indexes": [["id"]],
+    },
+    "colegios": {
+        "key": ["id"],
+        "cols": ["id","nombre","icono","x","y"],
+        "ints": ["id","x","y"],
+        "indexes": [],
+    },
+    "xp_snapshots": {
+        "key": ["id"],
+        "cols": ["id","xp","watermark","rows"],
+        "ints": ["id","xp","rows"],
+        "indexes": [],
+    },
+}
+
+CSV_SOURCES = {
+    "students": "students.csv",
+    "logs": "logs.csv",
+    "observaciones": "observaciones.csv",
+    "attendance": "asistencia.csv",
+    "colegios": "colegios.csv",
+    "xp_snapshots": "xp_snapshots.csv",
+}
+
+
+def _q(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SqliteStore:
+    """Una conexión por hilo sobre el mismo archivo; WAL permite lectores concurrentes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._tx() as con:
+            con.execute('CREATE TABLE IF NOT EXISTS _versions (tbl TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            for name, spec in TABLES.items():
+                defs = [f'{_q(c)} {"INTEGER" if c in spec["ints"] else "TEXT"}' for c in spec["cols"]]
+                if spec["key"]:
+                    defs.append(f'PRIMARY KEY ({", ".join(_q(k) for k in spec["key"])})')
+                con.execute(f'CREATE TABLE IF NOT EXISTS {_q(name)} ({", ".join(defs)})')
+                for cols in spec["indexes"]:
+                    ix = f'ix_{name}_{"_".join(cols)}'
+                    con.execute(f'CREATE INDEX IF NOT EXISTS {_q(ix)} ON {_q(name)} ({", ".join(_q(c) for c in cols)})')
+                con.execute('INSERT OR IGNORE INTO _versions VALUES (?, 0)', (name,))
+
+    # ---- conexión / transacciones ----
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=30000")
+            self._local.con = con
+        return con
+
+    @contextmanager
+    def _tx(self):
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+
+    def _bump(self, con, table):
+        con.execute("UPDATE _versions SET version = version + 1 WHERE tbl = ?", (table,))
+
+    def _ensure_columns(self, con, table, cols):
+        """Columnas nuevas del DataFrame (p. ej. extras del CSV) se agregan como TEXT."""
+        have = [r[1] for r in con.execute(f"PRAGMA table_info({_q(table)})")]
+        for c in cols:
+            if c not in have:
+                con.execute(f"ALTER TABLE {_q(table)} ADD COLUMN {_q(c)} TEXT")
+                have.append(c)
+
+    @staticmethod
+    def _records(df: pd.DataFrame, cols):
+        out = df.reindex(columns=cols).astype(object).where(df.reindex(columns=cols).notna(), None)
+        return [tuple(r) for r in out.itertuples(index=False, name=None)]
+
+    # ---- lectura ----
+    def table_version(self, table: str) -> int:
+        row = self._con().execute("SELECT version FROM _versions WHERE tbl = ?", (table,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def read(self, table: str, where: str = "", params=()) -> pd.DataFrame:
+        order = " ORDER BY rowid" if TABLES[table]["key"] is None else ""
+        return pd.read_sql_query(f"SELECT * FROM {_q(table)} {where}{order}", self._con(), params=params)
+
+    def iter_read(self, table: str, chunksize: int):
+        """La tabla en trozos de `chunksize` filas (en orden de rowid), sin cargarla entera."""
+        return pd.read_sql_query(f"SELECT * FROM {_q(table)} ORDER BY rowid", self._con(), chunksize=chunksize)
+
+    # ---- escritura ----
+    def save(self, table: str, df: pd.DataFrame) -> None:
+        """Guardado completo con semántica de fila: UPSERT por clave y DELETE de las claves ausentes."""
+        key = TABLES[table]["key"]
+        with self._tx() as con:
+            self._ensure_columns(con, table, list(df.columns))
+            if key is None:
+                con.execute(f"DELETE FROM {_q(table)}")
+                self._insert(con, table, df)
+            else:
+                df = df.dropna(subset=key).drop_duplicates(key, keep="last")
+                cols = list(df.columns)
+                upd = [c for c in cols if c not in key]
+                sql = (f'INSERT INTO {_q(table)} ({", ".join(map(_q, cols))}) VALUES ({", ".join("?" * len(cols))}) '
+                       f'ON CONFLICT ({", ".join(map(_q, key))}) DO '
+                       + (f'UPDATE SET {", ".join(f"{_q(c)}=excluded.{_q(c)}" for c in upd)}' if upd else "NOTHING"))
+                con.executemany(sql, self._records(df, cols))
+                keys = ", ".join(map(_q, key))
+                con.execute(f"CREATE TEMP TABLE _keep AS SELECT {keys} FROM {_q(table)} WHERE 0")
+                try:
+                    con.executemany(f'INSERT INTO _keep VALUES ({", ".join("?" * len(key))})', self._records(df, key))
+                    con.execute(f"DELETE FROM {_q(table)} WHERE ({keys}) NOT IN (SELECT {keys} FROM _keep)")
+                finally:
+                    con.execute("DROP TABLE _keep")
+            self._bump(con, table)
+
+    def _insert(self, con, table, df):
+        cols = list(df.columns)
+        con.executemany(f'INSERT INTO {_q(table)} ({", ".join(map(_q, cols))}) VALUES ({", ".join("?" * len(cols))})',
+                        self._records(df, cols))
+
+    def append(self, table: str, rows) -> None:
+        if not rows: return
+        df = pd.DataFrame(rows)
+        with self._tx() as con:
+            self._ensure_columns(con, table, list(df.columns))
+            self._insert(con, table, df)
+            self._bump(con, table)
+
+    def save_rows(self, table: str, rows, delete_keys=()) -> None:
+        """UPSERT de filas sueltas (sin tocar las demás) y DELETE de `delete_keys`, en una transacción."""
+        if not rows and not delete_keys: return
+        key = TABLES[table]["key"]
+        with self._tx() as con:
+            if rows:
+                df = pd.DataFrame(rows)
+                cols = list(df.columns)
+                upd = [c for c in cols if c not in key]
+                self._ensure_columns(con, table, cols)
+                con.executemany(
+                    f'INSERT INTO {_q(table)} ({", ".join(map(_q, cols))}) VALUES ({", ".join("?" * len(cols))}) '
+                    f'ON CONFLICT ({", ".join(map(_q, key))}) DO UPDATE SET '
+                    + ", ".join(f"{_q(c)}=excluded.{_q(c)}" for c in upd),
+                    self._records(df, cols))
+            if delete_keys:
+                con.executemany(f'DELETE FROM {_q(table)} WHERE {" AND ".join(f"{_q(k)} = ?" for k in key)}',
+                                [tuple(k) for k in delete_keys])
+            self._bump(con, table)
+
+    def delete(self, table: str, where: str, params=()) -> int:
+        with self._tx() as con:
+            n = con.execute(f"DELETE FROM {_q(table)} WHERE {where}", params).rowcount
+            if n: self._bump(con, table)
+        return n
+
+    # ---- migración ----
+    def migrate_from_csv(self, base_dir: str = ".", force: bool = False) -> dict:
+        """Copia los CSV actuales a la base. Sin `force` sólo llena tablas vacías."""
+        done = {}
+        for table, fname in CSV_SOURCES.items():
+            path = os.path.join(base_dir, fname)
+            if not os.path.exists(path):
+                continue
+            n = self._con().execute(f"SELECT COUNT(*) FROM {_q(table)}").fetchone()[0]
+            if n and not force:
+                done[table] = "omitida (ya tiene datos)"
+                continue
+            df = pd.read_csv(path)
+            for c in TABLES[table]["ints"]:
+                if c in df.columns:
+                    df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+            if table == "attendance":
+                df = df.dropna(subset=["id", "date"])
+            self.save(table, df)
+            done[table] = len(df)
+        return done
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "migrate":
+        print("Uso: python sqlite_store.py migrate RUTA.db [--force]")
+        sys.exit(1)
+    res = SqliteStore(sys.argv[2]).migrate_from_csv(force="--force" in sys.argv)
+    for t, n in res.items():
+        print(f"[OK] {t}: {n}")
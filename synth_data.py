@@ -0,0 +1,166 @@
+# synth_data.py
+"""Datos sintéticos realistas para medir la app a escala (ver bench.py).
+
+Escribe en una carpeta los mismos CSV que usa el backend CSV (students, colegios, logs, observaciones,
+asistencia) con las columnas de data_layer.TABLES. Todo sale de una semilla: misma semilla, mismos datos.
+    - el XP de cada estudiante es la suma de sus filas de log,
+    - los logs y observaciones están repartidos en los años pedidos, con pocos estudiantes muy activos,
+    - la asistencia cubre los días hábiles de febrero a noviembre de cada año (se escribe por año).
+
+    python synth_data.py CARPETA [--preset mediano] [--students N] [--colegios N] [--logs N] [--years N] [--seed N]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.disable(logging.WARNING)   # streamlit fuera de `streamlit run` avisa en cada acceso a secrets/caché
+from data_layer import TABLES, STUDENT_COLS, LOG_COLS, OBS_COLS, COLEGIO_COLS
+from render import MAP_W, MAP_H, CASTLE
+
+PRESETS = {
+    "chico":   {"students": 1_000,  "colegios": 20,  "logs": 50_000,    "obs": 2_000,  "years": 1},
+    "mediano": {"students": 5_000,  "colegios": 100, "logs": 250_000,   "obs": 10_000, "years": 2},
+    "grande":  {"students": 10_000, "colegios": 200, "logs": 1_000_000, "obs": 40_000, "years": 3},
+}
+
+NOMBRES   = ["Sara","Linda","Daniel","María","José","Ana","Luis","Camila","Andrés","Valentina","Juan","Laura",
+             "Santiago","Paula","Felipe","Natalia","Mateo","Sofía","Diego","Isabella","Carlos","Lucía"]
+APELLIDOS = ["Salazar","Rubio","Casas","Perdomo","Ramírez","López","Rincón","Lozada","Gómez","Martínez",
+             "Rodríguez","Díaz","Torres","Vargas","Moreno","Jiménez","Castro","Herrera","Rojas","Ortiz"]
+GRUPOS    = ["Transición","Primero","Segundo","Tercero","Cuarto","Quinto"]
+MAESTROS  = ["Solomeo Paredes","Mónica Galindo","Rosa Cárdenas","Hernán Quintero","Gloria Pinzón"]
+MOTIVOS   = ["Participación","Tarea completa","Trabajo en equipo","Llegó tarde","Ayudó a un compañero",
+             "Reto superado","Material olvidado",""]
+DELTAS    = np.array([-20, -10, -5, 5, 10, 10, 15, 20, 25, 50])
+FRASES    = ["Muestra iniciativa en clase.", "Se recomienda reforzar la lectura en casa.",
+             "Buen manejo del grupo durante la actividad.", "Trajo material distinto al esperado y lo resolvió.",
+             "Necesita concretar mejor los cierres.", "Avances claros en el uso de recursos."]
+ATT_P     = {"P": 0.86, "T": 0.08, "A": 0.06}
+
+
+def _choice(rng, items, n):
+    return np.asarray(items, dtype=object)[rng.integers(0, len(items), n)]
+
+
+def _ids_skewed(rng, n_students, n):
+    """Ids 1..n_students con cola larga: unos pocos concentran buena parte del historial."""
+    w = rng.pareto(1.5, n_students) + 1
+    return rng.choice(np.arange(1, n_students + 1), size=n, p=w / w.sum())
+
+
+def _timestamps(rng, years, n):
+    """n timestamps ISO (segundos) ordenados, en los `years` años que terminan en el actual."""
+    end = pd.Timestamp.now().normalize()
+    start = end - pd.DateOffset(years=years)
+    secs = np.sort(rng.integers(0, int((end - start).total_seconds()), n))
+    return np.datetime_as_string(np.datetime64(start, "s") + secs.astype("timedelta64[s]"), unit="s")
+
+
+def _colegios(rng, n):
+    icons = [f"assets/castle{k}.png" for k in range(1, 8)]
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "nombre": [f"COLEGIO {k:03d}" for k in range(1, n + 1)],
+        "icono": _choice(rng, icons, n),
+        "x": rng.integers(0, MAP_W - CASTLE, n),
+        "y": rng.integers(0, MAP_H - CASTLE - 30, n),
+    })[COLEGIO_COLS]
+
+
+def _school_days(years):
+    """Días hábiles de febrero a noviembre de cada año, como 'YYYY-MM-DD', agrupados por año."""
+    last = pd.Timestamp.now().year
+    out = {}
+    for y in range(last - years + 1, last + 1):
+        days = pd.bdate_range(f"{y}-02-01", f"{y}-11-30")
+        out[y] = days.strftime("%Y-%m-%d").to_numpy()
+    return out
+
+
+def generate(out_dir, students=5_000, colegios=100, logs=250_000, obs=10_000, years=2, seed=7, log=print):
+    """Escribe el conjunto en `out_dir`. Devuelve {tabla: filas}."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    path = lambda t: os.path.join(out_dir, TABLES[t]["csv"])
+    sizes = {}
+
+    cdf = _colegios(rng, colegios)
+    cdf.to_csv(path("colegios"), index=False); sizes["colegios"] = len(cdf)
+
+    names = np.char.add(np.char.add(_choice(rng, NOMBRES, students).astype(str), " "),
+                        np.char.add(np.char.add(_choice(rng, APELLIDOS, students).astype(str), " "),
+                                    _choice(rng, APELLIDOS, students).astype(str))).astype(object)
+
+    # logs primero: el XP de cada estudiante sale de ellos
+    t = time.perf_counter()
+    lid = _ids_skewed(rng, students, logs)
+    delta = DELTAS[rng.integers(0, len(DELTAS), logs)]
+    ldf = pd.DataFrame({"timestamp": _timestamps(rng, years, logs), "id": lid, "name": names[lid - 1],
+                        "delta_xp": delta, "reason": _choice(rng, MOTIVOS, logs)})[LOG_COLS]
+    ldf.to_csv(path("logs"), index=False); sizes["logs"] = len(ldf)
+    xp = np.bincount(lid, weights=delta, minlength=students + 1)[1:].astype(int)
+    log(f"  logs: {len(ldf):,} filas en {time.perf_counter() - t:.1f}s")
+    del ldf
+
+    avatars = [f"avatar{k}.png" for k in range(1, 36)]
+    tdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "trinkets")
+    trinkets = sorted(os.listdir(tdir)) if os.path.isdir(tdir) else [""]
+    sdf = pd.DataFrame({
+        "id": np.arange(1, students + 1), "name": names, "grupo": _choice(rng, GRUPOS, students), "xp": xp,
+        "colegio_id": rng.integers(1, colegios + 1, students),
+        "phone": rng.integers(3_000_000_000, 3_299_999_999, students).astype(str),
+        "teacher": _choice(rng, MAESTROS, students), "xp_delta": 0, "xp_reason": "",
+        "avatar": _choice(rng, avatars, students), "trinket": _choice(rng, trinkets, students), "trinket_desc": "",
+    })[STUDENT_COLS]
+    sdf.to_csv(path("students"), index=False); sizes["students"] = len(sdf)
+
+    oid = _ids_skewed(rng, students, obs)
+    odf = pd.DataFrame({"timestamp": _timestamps(rng, years, obs), "id": oid, "name": names[oid - 1],
+                        "observacion": [" ".join(rng.choice(FRASES, 3, replace=False)) for _ in range(obs)]})[OBS_COLS]
+    odf.to_csv(path("observaciones"), index=False); sizes["observaciones"] = len(odf)
+
+    # asistencia: un año por vez para no tener todo en memoria
+    t = time.perf_counter()
+    sizes["attendance"] = 0
+    states, probs = list(ATT_P), np.array(list(ATT_P.values()))
+    ids = np.arange(1, students + 1)
+    first = True
+    for y, days in _school_days(years).items():
+        n = students * len(days)
+        adf = pd.DataFrame({"id": np.repeat(ids, len(days)),
+                            "date": pd.Categorical.from_codes(np.tile(np.arange(len(days)), students), days),
+                            "status": pd.Categorical.from_codes(rng.choice(3, n, p=probs), states)})
+        adf.to_csv(path("attendance"), index=False, mode="w" if first else "a", header=first)
+        sizes["attendance"] += n; first = False
+    log(f"  asistencia: {sizes['attendance']:,} filas en {time.perf_counter() - t:.1f}s")
+
+    meta = {"seed": seed, "years": years, "sizes": sizes, "created": pd.Timestamp.now().isoformat(timespec="seconds")}
+    with open(os.path.join(out_dir, "synth.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return sizes
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera datos sintéticos para bench.py")
+    ap.add_argument("out_dir")
+    ap.add_argument("--preset", choices=sorted(PRESETS), default="mediano")
+    for k in ("students", "colegios", "logs", "obs", "years"):
+        ap.add_argument(f"--{k}", type=int)
+    ap.add_argument("--seed", type=int, default=7)
+    a = ap.parse_args(argv)
+    params = dict(PRESETS[a.preset])
+    params.update({k: getattr(a, k) for k in params if getattr(a, k) is not None})
+    t = time.perf_counter()
+    print(f"Generando {a.preset} en {a.out_dir}: {params}")
+    sizes = generate(a.out_dir, seed=a.seed, **params)
+    print(f"[OK] {sizes} en {time.perf_counter() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# test_fake_sheets.py
+"""Modo Sheets sin red, contra fake_sheets: guardado por diferencias (sheet_sync), cuota y 429, registro de
+llamadas y escritura diferida (write_behind).
+
+    python -m pytest -q test_fake_sheets.py
+"""
+import os
+import random
+import threading
+import time
+
+import pytest
+from gspread.exceptions import APIError
+
+import sheet_sync
+from data_layer import SheetsBackend
+from fake_sheets import FakeSheetsAPI, seed_tables
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+HEADER = ["id", "name", "xp"]
+NAMES = ["Ana", "Beto", "Caro", "Dani", ""]
+
+
+def _rows(values):
+    return sheet_sync._norm(values)[1]
+
+
+def _random_table(rnd, ids, header=HEADER):
+    return [list(header)] + [[str(i)] + [rnd.choice(NAMES) if c == "name" else str(rnd.randrange(50))
+                                         for c in header[1:]] for i in ids]
+
+
+def _mutate(rnd, old, keyed):
+    header, rows = list(old[0]), [list(r) for r in old[1:]]
+    rows = [r for r in rows if rnd.random() > 0.2]                       # borrados
+    for r in rows:                                                        # cambios
+        if rnd.random() < 0.3: r[rnd.randrange(1, len(r))] = str(rnd.randrange(50))
+    top = max([int(r[0]) for r in old[1:]] + [0])
+    rows += _random_table(rnd, range(top + 1, top + 1 + rnd.randrange(4)), header)[1:]   # nuevas
+    if not keyed and rows and rnd.random() < 0.3:
+        rows.append(list(rnd.choice(rows)))                               # filas repetidas
+    rnd.shuffle(rows)
+    if rnd.random() < 0.1:                                                # cambio de encabezado: reescritura
+        if rnd.random() < 0.5: header, rows = header + ["extra"], [r + ["x"] for r in rows]
+        else: header, rows = header[:-1], [r[:-1] for r in rows]
+    return [header] + rows
+
+
+# ===== sheet_sync contra la hoja simulada =====
+@pytest.mark.parametrize("keyed", [True, False])
+def test_apply_random_diffs(keyed):
+    rnd = random.Random(18 + keyed)
+    api = FakeSheetsAPI()
+    for _ in range(250):
+        old = _random_table(rnd, rnd.sample(range(1, 40), rnd.randrange(0, 12)))
+        new = _mutate(rnd, old, keyed)
+        ws = api.create("t", old)._sheets[0]
+        start = len(api.ledger)
+        res = sheet_sync.apply(ws, old, new, ["id"] if keyed else None)
+        sent = len(api.ledger.since(start))
+        got = ws.get(pad_values=True)
+        assert sheet_sync._norm(got) == sheet_sync._norm(res["result"])           # la foto es la hoja
+        assert got[0] == new[0]
+        assert sorted(_rows(got)) == sorted(_rows(new))                          # mismas filas que `new`
+        assert sent == res["calls"] <= (2 if res["full"] else 3)
+
+
+def test_apply_sends_only_changes():
+    api = FakeSheetsAPI()
+    old = [HEADER] + [[str(i), "Ana", "1"] for i in range(1, 6)]
+    ws = api.create("t", old)._sheets[0]
+    new = [HEADER] + [[str(i), "Ana", "9" if i == 3 else "1"] for i in range(1, 6) if i != 5] + [["6", "Beto", "2"]]
+    res = sheet_sync.apply(ws, old, new, ["id"])
+    assert api.ledger.counts() == {"spreadsheet_batch_update": 1, "values_batch_update": 1, "values_append": 1}
+    assert res["cells"] == 1 + 3 and not res["full"]
+    assert ws.get(pad_values=True) == new
+
+
+# ===== cuota, 429 y registro =====
+def test_quota_429_and_ledger():
+    api = FakeSheetsAPI(quota_per_min=3, window=0.3)
+    sh = api.create("t", [["a"], ["1"]])
+    ws = sh._sheets[0]
+    for _ in range(3): ws.get()
+    with pytest.raises(APIError) as e:
+        ws.get()
+    assert e.value.code == 429
+    ws.update([["2"]], "A2")              # las escrituras tienen su propia cuota
+    sh.get_lastUpdateTime()               # Drive no consume la de Sheets
+    assert api.ledger.counts() == {"values_get": 4, "values_update": 1, "drive_modified_time": 1}
+    assert api.ledger.counts(by="code") == {200: 5, 429: 1}
+    time.sleep(0.35)                      # pasó la ventana
+    assert ws.get() == [["a"], ["2"]]
+
+
+def test_fail_rate_and_scope():
+    api = FakeSheetsAPI(fail_rate=1.0)
+    ws = api.create("t", [["a"]])._sheets[0]
+    with api.ledger.scope("caso"):
+        for _ in range(3):
+            with pytest.raises(APIError): ws.get()
+    assert api.ledger.summary() == [{"scope": "caso", "op": "values_get", "kind": "read", "calls": 3,
+                                     "errors_429": 3, "cells": 0, "ms": api.ledger.summary()[0]["ms"]}]
+
+
+def test_bulk_throttle_retries_429():
+    from bulk import _Stats, _Throttle
+    api = FakeSheetsAPI(quota_per_min=1, window=0.05)
+    ws = api.create("t", [["a"]])._sheets[0]
+    stats = _Stats("prueba")
+    api_call = _Throttle(stats, retries=5, backoff=0.02).call
+    assert [api_call(ws.get) for _ in range(3)] == [[["a"]]] * 3
+    assert stats.retries == api.ledger.counts(by="code").get(429, 0) > 0
+
+
+# ===== backend de la app =====
+def _backend(api, tables, **kw):
+    b = SheetsBackend(client=api.client(), urls=seed_tables(api, REPO, tables))
+    b.revision_ttl = 0
+    for k, v in kw.items(): setattr(b, k, v)
+    return b
+
+
+def test_save_sends_one_cell_change():
+    api = FakeSheetsAPI()
+    b = _backend(api, ["students"])
+    df = b.read("students"); b.save("students", df)          # encabezado del esquema
+    sid = int(df["id"].iloc[2])
+    df.loc[df["id"] == sid, "xp"] = 4321
+    start = len(api.ledger)
+    b.save("students", df)
+    # comprobar las claves de la foto + el cambio
+    assert api.ledger.counts(entries=api.ledger.since(start)) == {"values_get": 1, "values_batch_update": 1}
+    assert sum(e["cells"] for e in api.ledger.since(start) if e["op"] == "values_batch_update") == 1
+    assert int(b.read("students").set_index("id").loc[sid, "xp"]) == 4321
+
+
+def test_save_with_stale_snapshot_hits_the_right_row():
+    api = FakeSheetsAPI()
+    urls = seed_tables(api, REPO, ["students"])
+    a, b = (SheetsBackend(client=api.client(), urls=urls) for _ in range(2))
+    df = a.read("students"); a.save("students", df)
+    mine = b.read("students")                                 # foto de b
+    first, second = int(df["id"].iloc[0]), int(df["id"].iloc[1])
+    a.save("students", df[df["id"] != first])                 # otra instancia borra una fila
+    mine = mine[mine["id"] != first].copy()
+    mine.loc[mine["id"] == second, "xp"] = 999
+    b.save("students", mine)
+    now = a.read("students").set_index("id")
+    assert first not in now.index
+    assert int(now.loc[second, "xp"]) == 999
+    assert now.drop(columns="xp").equals(df[df["id"] != first].set_index("id").drop(columns="xp"))
+
+
+def test_write_behind_reads_own_writes_without_duplicates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)                                # diario de la cola en tmp
+    api = FakeSheetsAPI()
+    b = _backend(api, ["logs"], write_behind=True)
+    q = b.queue()
+    try:
+        n0 = len(b.read("logs"))
+        rows = [{"timestamp": "2030-01-01T00:00:00", "id": 1, "name": "x", "delta_xp": 5, "reason": "prueba"}]
+        b.append("logs", rows)
+        assert len(b.read("logs")) == n0 + 1 and api.ledger.counts().get("values_append") is None
+        api.latency = 0.05                                     # el envío tarda: lecturas a mitad de camino
+        flusher = threading.Thread(target=q.flush); flusher.start()
+        seen = []
+        while flusher.is_alive():
+            seen.append(len(b.read("logs")))
+        flusher.join()
+        assert set(seen + [len(b.read("logs"))]) == {n0 + 1}
+        assert api.ledger.counts()["values_append"] == 1 and q.pending(b.urls["logs"]) == []
+    finally:
+        api.latency = 0
+        q.stop()
@@ -0,0 +1,59 @@
+# test_write_behind.py
+"""Cola write-behind: lecturas con lo pendiente aplicado, también mientras se envía.
+
+    python -m pytest -q test_write_behind.py
+"""
+import threading
+
+from write_behind import WriteBehindQueue
+
+
+def _queue(tmp_path, sheet, append_fn=None):
+    def append(url, rows, cols): sheet.extend(rows)
+    return WriteBehindQueue(str(tmp_path / "q.jsonl"), lambda url, values: None, append_fn or append)
+
+
+def test_read_overlay_applies_pending_append(tmp_path):
+    sheet = [{"id": "1"}]
+    q = _queue(tmp_path, sheet)
+    q.append("u", [{"id": "2"}], ["id"])
+    assert q.read_overlay("u", lambda: list(sheet)) == [{"id": "1"}, {"id": "2"}]
+    assert q.flush() == 1
+    assert q.read_overlay("u", lambda: list(sheet)) == [{"id": "1"}, {"id": "2"}]
+    assert q.pending("u") == []
+
+
+def test_read_during_flush_does_not_duplicate_append(tmp_path):
+    sheet = [{"id": "1"}]
+    landed, release = threading.Event(), threading.Event()
+
+    def slow_append(url, rows, cols):        # el append ya llegó a la hoja pero flush() aún no vuelve
+        sheet.extend(rows); landed.set(); release.wait(5)
+
+    q = _queue(tmp_path, sheet, slow_append)
+    q.append("u", [{"id": "2"}], ["id"])
+    flusher = threading.Thread(target=q.flush); flusher.start()
+    assert landed.wait(5)
+    out = []
+    reader = threading.Thread(target=lambda: out.append(q.read_overlay("u", lambda: list(sheet))))
+    reader.start(); reader.join(0.2)
+    assert reader.is_alive()                 # la lectura espera a que termine el envío
+    release.set(); flusher.join(5); reader.join(5)
+    assert out == [[{"id": "1"}, {"id": "2"}]]
+
+
+def test_read_other_url_not_blocked_by_flush(tmp_path):
+    sheet, other = [], [{"id": "9"}]
+    landed, release = threading.Event(), threading.Event()
+
+    def slow_append(url, rows, cols):
+        sheet.extend(rows); landed.set(); release.wait(5)
+
+    q = _queue(tmp_path, sheet, slow_append)
+    q.append("u", [{"id": "2"}], ["id"])
+    flusher = threading.Thread(target=q.flush); flusher.start()
+    assert landed.wait(5)
+    try:
+        assert q.read_overlay("v", lambda: list(other)) == [{"id": "9"}]
+    finally:
+        release.set(); flusher.join(5)
@@ -0,0 +1,96 @@
+# thumbs.py
+"""Miniaturas de avatars y trinkets a los tamaños que usan las vistas.
+
+Se generan en un pool de procesos (al arrancar la app o a mano) y se cachean por mtime:
+    python thumbs.py            # genera las que falten o estén viejas
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+ASSETS_DIR   = "assets"
+THUMBS_DIR   = os.path.join(ASSETS_DIR, ".thumbs")
+IMAGE_EXTS   = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")
+THUMB_EXT    = ".webp" if features.check("webp") else ".png"
+
+# carpeta -> anchos (px) en que se muestran: Colegio 110, Ficha 120, trinket 64
+SIZES = {
+    os.path.join(ASSETS_DIR, "avatars"):  (110, 120),
+    os.path.join(ASSETS_DIR, "trinkets"): (64,),
+}
+
+
+def thumb_path(src: str, size: int) -> str:
+    """Nombre con la extensión de origen (foo.png@110.webp): foo.png y foo.jpg no comparten miniatura."""
+    folder = os.path.basename(os.path.dirname(src))
+    return os.path.join(THUMBS_DIR, folder, f"{os.path.basename(src)}@{size}{THUMB_EXT}")
+
+
+def is_fresh(src: str, dst: str) -> bool:
+    try:
+        return os.stat(dst).st_mtime_ns >= os.stat(src).st_mtime_ns
+    except OSError:
+        return False
+
+
+def render_thumb(src: str, size: int) -> str:
+    """Genera (si hace falta) la miniatura de `src` con ancho `size` y devuelve su ruta."""
+    dst = thumb_path(src, size)
+    if is_fresh(src, dst):
+        return dst
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with Image.open(src) as im:
+        im = im.convert("RGBA")
+        if im.width > size:
+            im = im.resize((size, max(1, round(im.height * size / im.width))), Image.LANCZOS)
+        tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if THUMB_EXT == ".webp":
+            im.save(tmp, "WEBP", quality=90, method=4)
+        else:
+            im.save(tmp, "PNG", optimize=True)
+    os.replace(tmp, dst)
+    return dst
+
+
+def _render_job(job):
+    src, size = job
+    try:
+        return render_thumb(src, size)
+    except Exception:
+        return None
+
+
+def pending_jobs(sizes=None):
+    jobs = []
+    for folder, widths in (sizes or SIZES).items():
+        if not os.path.isdir(folder):
+            continue
+        for f in sorted(os.listdir(folder)):
+            src = os.path.join(folder, f)
+            if os.path.isfile(src) and os.path.splitext(f.lower())[1] in IMAGE_EXTS:
+                jobs += [(src, w) for w in widths if not is_fresh(src, thumb_path(src, w))]
+    return jobs
+
+
+def build_all(workers=None, sizes=None) -> int:
+    """Genera en paralelo todas las miniaturas que falten. Devuelve cuántas se generaron."""
+    jobs = pending_jobs(sizes)
+    if not jobs:
+        return 0
+    if len(jobs) < 8:
+        return sum(_render_job(j) is not None for j in jobs)
+    # spawn y no fork: la app lo llama desde un hilo del servidor (un fork copiaría el proceso entero y
+    # podría heredar locks tomados por otros hilos)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return sum(r is not None for r in pool.map(_render_job, jobs, chunksize=4))
+
+
+if __name__ == "__main__":
+    t = time.perf_counter()
+    n = build_all(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    print(f"[OK] {n} miniatura(s) generadas en {time.perf_counter() - t:.2f}s -> {THUMBS_DIR}")
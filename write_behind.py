@@ -0,0 +1,202 @@
+# write_behind.py
+"""Cola de escritura diferida (write-behind) para Google Sheets.
+
+Cada mutación se anota en un diario JSONL local (durable) y vuelve de inmediato; un hilo de fondo
+agrupa lo pendiente por hoja y lo envía cada `interval` segundos o al cerrar:
+    - un reemplazo completo ("replace") deja sin efecto lo anterior de esa hoja,
+    - agregados ("append") seguidos se envían en un solo append_rows,
+    - reemplazo + agregados = un solo reemplazo con las filas incluidas.
+Las lecturas pasan por `read_overlay`, que aplica lo pendiente sobre lo leído (lee sus propias escrituras).
+Si el proceso muere, lo que quedó en el diario se recupera al crear la cola y se envía en el próximo ciclo.
+"""
+import json
+import os
+import threading
+import time
+
+
+class WriteBehindQueue:
+    def __init__(self, path, replace_fn, append_fn, interval=5.0, parse=None):
+        """replace_fn(url, values) reescribe la hoja (values[0] = encabezado); append_fn(url, rows, cols) agrega."""
+        self.path = path
+        self.replace_fn = replace_fn
+        self.append_fn = append_fn
+        self.interval = float(interval)
+        self.parse = parse or (lambda v: v)
+        self._ops = {}                     # url -> [op], en orden
+        self._inflight = {}                # url -> seq máximo que se está enviando
+        self._last_seq = {}                # url -> seq de la última mutación (versión vista por las cachés)
+        self._seq = 0
+        self._lock = threading.Lock()      # estado en memoria + diario
+        self._flush_lock = threading.Lock()
+        self._url_locks = {}               # url -> Lock: envío de esa hoja vs. lecturas con load()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.metrics = {"enqueued": 0, "coalesced": 0, "flushes": 0, "flushed_ops": 0, "flush_errors": 0,
+                        "recovered": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0,
+                        "last_error": ""}
+        self._recover()
+
+    # ---- diario ----
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try: op = json.loads(line)
+                except ValueError: continue        # última línea a medio escribir
+                self._add(op)
+                self._seq = max(self._seq, op["seq"])
+                self.metrics["recovered"] += 1
+
+    def _journal(self, op):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush(); os.fsync(f.fileno())
+
+    def _rewrite_journal(self):
+        """Compacta el diario a lo que sigue pendiente (tmp + replace atómico)."""
+        pending = sorted((op for ops in self._ops.values() for op in ops), key=lambda o: o["seq"])
+        if not pending:
+            try: os.remove(self.path)
+            except FileNotFoundError: pass
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for op in pending: f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    # ---- encolar ----
+    def _add(self, op):
+        self._last_seq[op["url"]] = op["seq"]
+        ops = self._ops.setdefault(op["url"], [])
+        if op["op"] == "replace":
+            # lo que aún no salió queda tapado por el reemplazo
+            sent = self._inflight.get(op["url"], 0)
+            keep = [o for o in ops if o["seq"] <= sent]
+            self.metrics["coalesced"] += len(ops) - len(keep)
+            ops[:] = keep
+        ops.append(op)
+
+    def _enqueue(self, op):
+        with self._lock:
+            self._seq += 1
+            op = dict(op, seq=self._seq, t=time.time())
+            self._journal(op)
+            self._add(op)
+            self.metrics["enqueued"] += 1
+
+    def replace(self, url, values):
+        self._enqueue({"url": url, "op": "replace", "values": values})
+
+    def append(self, url, rows, cols):
+        if rows:
+            self._enqueue({"url": url, "op": "append", "rows": rows, "cols": list(cols)})
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    # ---- lecturas ----
+    def version(self, url):
+        """Cambia con cada mutación encolada para `url` (para invalidar cachés de lectura)."""
+        return self._last_seq.get(url, 0)
+
+    def pending(self, url):
+        with self._lock:
+            return list(self._ops.get(url, ()))
+
+    def read_overlay(self, url, load):
+        """Registros de la hoja con lo pendiente aplicado; `load()` sólo se llama si hace falta la base.
+        Si la hoja se está enviando espera a que termine: a mitad de envío lo pendiente ya puede estar en
+        la hoja y se leería dos veces."""
+        with self._url_lock(url):
+            ops = self.pending(url)
+            last = max((i for i, o in enumerate(ops) if o["op"] == "replace"), default=-1)
+            if last >= 0:
+                header, vals = ops[last]["values"][0], ops[last]["values"][1:]
+                records = [dict(zip(header, map(self.parse, v))) for v in vals]
+            else:
+                records = list(load())
+        for o in ops[last + 1:]:
+            records += [{k: self.parse(str(v)) for k, v in r.items()} for r in o["rows"]]
+        return records
+
+    # ---- envío ----
+    @staticmethod
+    def _net(ops):
+        """Una sola operación equivalente a la lista (ver docstring del módulo)."""
+        last = max((i for i, o in enumerate(ops) if o["op"] == "replace"), default=-1)
+        if last >= 0:
+            header = list(ops[last]["values"][0])
+            values = [header] + [list(v) for v in ops[last]["values"][1:]]
+            for o in ops[last + 1:]:
+                values += [[str(r.get(c, "")) for c in header] for r in o["rows"]]
+            return "replace", values, None
+        cols = list(ops[0]["cols"])
+        for o in ops[1:]: cols += [c for c in o["cols"] if c not in cols]
+        return "append", [r for o in ops for r in o["rows"]], cols
+
+    def flush(self):
+        """Envía todo lo pendiente. Devuelve cuántas operaciones salieron; los errores quedan en metrics."""
+        sent = 0
+        with self._flush_lock:
+            with self._lock:
+                batch = {url: list(ops) for url, ops in self._ops.items() if ops}
+                for url, ops in batch.items(): self._inflight[url] = ops[-1]["seq"]
+            for url, ops in batch.items():
+                t = time.perf_counter()
+                with self._url_lock(url):        # sin lecturas de esta hoja hasta sacar lo enviado de la cola
+                    try:
+                        kind, payload, cols = self._net(ops)
+                        if kind == "replace": self.replace_fn(url, payload)
+                        else: self.append_fn(url, payload, cols)
+                    except Exception as e:
+                        self.metrics["flush_errors"] += 1
+                        self.metrics["last_error"] = f"{type(e).__name__}: {e}"
+                        with self._lock: self._inflight.pop(url, None)
+                        continue
+                    ms = (time.perf_counter() - t) * 1000
+                    with self._lock:
+                        top = self._inflight.pop(url)
+                        self._ops[url] = [o for o in self._ops.get(url, []) if o["seq"] > top]
+                        self._rewrite_journal()
+                        m = self.metrics
+                        m["flushes"] += 1; m["flushed_ops"] += len(ops)
+                        m["last_flush_ms"] = ms; m["max_flush_ms"] = max(m["max_flush_ms"], ms); m["total_flush_ms"] += ms
+                sent += len(ops)
+        return sent
+
+    # ---- hilo de fondo ----
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval); self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="sheets-write-behind")
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=30.0):
+        """Detiene el hilo y hace un último envío (al cerrar la app)."""
+        self._stop.set(); self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout); self._thread = None
+        self.flush()
+
+    def kick(self):
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            ops = [o for v in self._ops.values() for o in v]
+            m = dict(self.metrics)
+        m["depth"] = len(ops)
+        m["pending_rows"] = sum(len(o.get("rows") or o.get("values", [[]])[1:]) for o in ops)
+        m["oldest_age_s"] = round(time.time() - min(o["t"] for o in ops), 1) if ops else 0.0
+        m["avg_flush_ms"] = m["total_flush_ms"] / m["flushes"] if m["flushes"] else 0.0
+        return m
@@ -0,0 +1,205 @@
+# xp_events.py
+"""XP derivado del historial: el log es la fuente y `students.xp` queda como copia materializada.
+
+Una foto (tabla xp_snapshots: id, xp, watermark, rows) guarda por estudiante la suma de sus logs con
+timestamp < watermark; el XP actual es la foto más los logs desde el watermark, sumados con un groupby.
+La foto sólo incluye segundos ya cerrados, así que un log escrito en el mismo segundo nunca queda
+fuera de las dos partes. Con XP_SOURCE = "logs" (entorno o secrets) la app calcula el XP así.
+
+    python xp_events.py check                       # diferencias entre students.xp y el historial
+    python xp_events.py snapshot                    # nueva foto de todo el historial
+    python xp_events.py reconcile --trust logs      # students.xp := historial
+    python xp_events.py reconcile --trust students  # agrega logs de ajuste para que el historial cuadre
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_COLS = ["id", "xp", "watermark", "rows"]
+RECONCILE_REASON = "Conciliación de XP"
+
+
+def _usable(logs_df):
+    return logs_df is not None and len(logs_df) and {"id", "delta_xp", "timestamp"} <= set(logs_df.columns)
+
+
+def _compare(logs_df, fn):
+    """fn(timestamps) sobre el arreglo tal cual; sólo si hay valores que no son texto (vacíos) se limpia."""
+    try:
+        return fn(logs_df["timestamp"].to_numpy(dtype=object))
+    except TypeError:
+        return fn(logs_df["timestamp"].fillna("").astype(str).to_numpy(dtype=object))
+
+
+def _sum_by_id(logs_df, ids, keep):
+    delta = pd.to_numeric(logs_df["delta_xp"][keep], errors="coerce").fillna(0).astype("int64")
+    return delta.groupby(ids[keep].astype("int64"))
+
+
+def _snapshots(snap_df):
+    if snap_df is None or snap_df.empty:
+        return pd.DataFrame(columns=SNAPSHOT_COLS).set_index("id")
+    df = snap_df
+    if df["id"].dtype != "int64" or not df["id"].is_unique:     # leída como texto (Sheets) o con repetidos
+        df = df.assign(id=pd.to_numeric(df["id"], errors="coerce"))
+        df = df[df["id"].notna()].drop_duplicates("id", keep="last").astype({"id": "int64"})
+    if df["xp"].dtype != "int64":
+        df = df.assign(xp=pd.to_numeric(df["xp"], errors="coerce").fillna(0).astype("int64"))
+    if df["watermark"].dtype != object or df["watermark"].hasnans:
+        df = df.assign(watermark=df["watermark"].fillna("").astype(str))
+    return df.set_index("id")
+
+
+def replay(logs_df, snap_df=None, ordered=False):
+    """XP por id = foto + logs desde su watermark. Devuelve (Serie id -> xp, filas reproducidas).
+
+    Con `ordered` (logs en orden de timestamp, como se agregan) lo anterior al watermark más viejo ya está
+    en la foto y se salta con una búsqueda binaria, sin mirarlo. Si no, se descarta con una sola comparación.
+    El watermark de cada estudiante sólo se mira en lo que queda (y sólo si las fotos no son todas del mismo corte).
+    """
+    snap = _snapshots(snap_df)
+    if not _usable(logs_df):
+        return snap["xp"].astype("int64"), 0
+    marks = snap["watermark"]
+    if len(snap) and ordered:
+        start = int(_compare(logs_df, lambda ts: np.searchsorted(ts, marks.min(), side="left")))
+        logs_df = logs_df.iloc[start:]
+    ids = pd.to_numeric(logs_df["id"], errors="coerce")
+    keep = ids.notna().to_numpy()
+    if len(snap) and not (ordered and marks.min() == marks.max()):   # con un solo corte ya no queda nada que mirar
+        def after(ts):
+            k = keep & ((ts >= marks.min()) | ~ids.isin(marks.index).to_numpy())
+            if marks.nunique() > 1:
+                sub = np.flatnonzero(k)
+                k[sub] = ts[sub] >= ids.iloc[sub].map(marks).fillna("").to_numpy(dtype=object)
+            return k
+        keep = _compare(logs_df, after)
+    # foto + deltas en una sola suma por id (bincount: sin alinear índices de pandas)
+    delta = pd.to_numeric(logs_df["delta_xp"], errors="coerce").fillna(0).to_numpy()[keep].astype("int64")
+    inv, u = pd.factorize(np.concatenate([snap.index.to_numpy(dtype="int64"), ids.to_numpy()[keep].astype("int64")]))
+    xp = np.bincount(inv, weights=np.concatenate([snap["xp"].to_numpy(dtype="int64"), delta]), minlength=len(u))
+    return pd.Series(xp.astype("int64"), index=pd.Index(u, name="id")), int(keep.sum())
+
+
+def take_snapshot(logs_df, cut=None, base=None) -> pd.DataFrame:
+    """Foto de los logs con timestamp < `cut` (por defecto, el segundo actual).
+
+    Con `base` (foto anterior) se avanza: cada estudiante queda con watermark = max(el suyo, cut) y se le
+    suman sólo los logs entre ambos, así que lo que ya no está en `logs_df` (archivado) no se pierde.
+    """
+    cut = cut or datetime.now().isoformat(timespec="seconds")
+    snap = _snapshots(base)
+    if not _usable(logs_df):
+        return snap.reset_index()[SNAPSHOT_COLS] if len(snap) else pd.DataFrame(columns=SNAPSHOT_COLS)
+    ids = pd.to_numeric(logs_df["id"], errors="coerce")
+    old = ids.map(snap["watermark"]).fillna("").to_numpy(dtype=object) if len(snap) else ""
+    new = np.where(old > cut, old, cut) if len(snap) else cut
+    g = _sum_by_id(logs_df, ids, ids.notna().to_numpy() & _compare(logs_df, lambda ts: (ts >= old) & (ts < new)))
+    xp, rows = g.sum(), g.size()
+    if len(snap):
+        xp = snap["xp"].add(xp, fill_value=0)
+        rows = pd.to_numeric(snap["rows"], errors="coerce").fillna(0).add(rows, fill_value=0)
+    out = pd.DataFrame({"xp": xp.astype("int64"), "rows": rows.reindex(xp.index).fillna(0).astype("int64")})
+    marks = snap["watermark"].where(snap["watermark"] > cut, cut) if len(snap) else pd.Series(dtype=object)
+    out["watermark"] = marks.reindex(out.index).fillna(cut)
+    return out.rename_axis("id").reset_index()[SNAPSHOT_COLS]
+
+
+def needs_advance(snap_df, cut, ids) -> bool:
+    """¿Hay estudiantes entre `ids` sin foto o con watermark anterior a `cut`?"""
+    snap = _snapshots(snap_df)
+    marks = pd.to_numeric(pd.Series(ids), errors="coerce").dropna().astype("int64").map(snap["watermark"])
+    return bool((marks.isna() | (marks.fillna("") < cut)).any())
+
+
+def absorb(snap_df, logs_df, sign=1):
+    """Suma a la foto (o resta, con sign=-1) los logs anteriores al watermark de su estudiante: los que
+    llegan con fecha vieja (importación) o se borran. Devuelve la tabla nueva o None si ninguno cae en la foto."""
+    snap = _snapshots(snap_df)
+    if not len(snap) or not _usable(logs_df): return None
+    ids = pd.to_numeric(logs_df["id"], errors="coerce")
+    marks = ids.map(snap["watermark"])
+    inside = (marks.notna() & (logs_df["timestamp"].fillna("").astype(str) < marks.fillna(""))).to_numpy()
+    if not inside.any(): return None
+    g = _sum_by_id(logs_df, ids, inside)
+    snap["xp"] = snap["xp"].add(sign * g.sum(), fill_value=0).astype("int64")
+    snap["rows"] = pd.to_numeric(snap["rows"], errors="coerce").fillna(0).add(sign * g.size(), fill_value=0).astype("int64")
+    return snap.reset_index()[SNAPSHOT_COLS]
+
+
+def unsnap(snap_df, removed_rows):
+    """Quita de la foto los logs borrados que ya estaban en ella. Devuelve la tabla nueva o None si no cambia."""
+    return absorb(snap_df, pd.DataFrame(list(removed_rows)), sign=-1)
+
+
+def drift(students_df, xp) -> pd.DataFrame:
+    """Estudiantes cuyo students.xp no coincide con el historial: id, name, xp, derived, diff (= xp - derived)."""
+    df = students_df[["id", "name", "xp"]].copy()
+    df["id"] = pd.to_numeric(df["id"], errors="coerce").fillna(0).astype("int64")
+    df["xp"] = pd.to_numeric(df["xp"], errors="coerce").fillna(0).astype("int64")
+    df["derived"] = df["id"].map(xp).fillna(0).astype("int64")
+    df["diff"] = df["xp"] - df["derived"]
+    return df[df["diff"] != 0].reset_index(drop=True)
+
+
+def repair(students_df, d, trust="logs", ts=None):
+    """Arregla las diferencias `d` (ver drift) de una vez.
+
+    trust="logs": devuelve (estudiantes con xp = historial, []).
+    trust="students": devuelve (estudiantes sin cambios, filas de log de ajuste con delta = diff).
+    """
+    if trust == "logs":
+        out = students_df.copy()
+        fix = d.set_index("id")["derived"]
+        ids = pd.to_numeric(out["id"], errors="coerce")
+        hit = ids.isin(fix.index)
+        out.loc[hit, "xp"] = ids[hit].map(fix).astype("int64").values
+        return out, []
+    ts = ts or datetime.now().isoformat(timespec="seconds")
+    return students_df, [{"timestamp": ts, "id": int(r.id), "name": r.name, "delta_xp": int(r.diff),
+                          "reason": RECONCILE_REASON} for r in d.itertuples()]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="XP derivado del historial: revisar, fotografiar y conciliar")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("check", help="informa las diferencias entre students.xp y el historial")
+    sub.add_parser("snapshot", help="guarda una foto nueva del historial")
+    rc = sub.add_parser("reconcile", help="arregla todas las diferencias en una pasada")
+    rc.add_argument("--trust", choices=["logs", "students"], required=True,
+                    help="logs: students.xp := historial; students: agrega logs de ajuste")
+    a = ap.parse_args(argv)
+
+    logging.disable(logging.WARNING)   # streamlit fuera de `streamlit run` avisa en cada acceso a secrets/caché
+    from data_layer import storage
+    stg = storage()
+    logs, snaps = stg.read("logs"), stg.read("xp_snapshots")
+    if a.cmd == "snapshot":
+        snap = take_snapshot(logs, base=snaps)
+        stg.save("xp_snapshots", snap)
+        print(f"[OK] foto de {len(snap)} estudiante(s), {int(snap['rows'].sum())} log(s) antes de {snap['watermark'].iloc[0] if len(snap) else '—'}")
+        return 0
+    students = stg.read("students")
+    xp, replayed = replay(logs, snaps)
+    d = drift(students, xp)
+    print(f"{len(students)} estudiante(s), {len(logs)} log(s) ({replayed} reproducidos desde la foto): "
+          f"{len(d)} con diferencia, {int(d['diff'].abs().sum())} XP en total")
+    if len(d):
+        print(d.head(20).to_string(index=False))
+    if a.cmd == "check":
+        return 1 if len(d) else 0
+    if not len(d):
+        print("[OK] nada que conciliar"); return 0
+    new_students, rows = repair(students, d, a.trust)
+    if rows: stg.append("logs", rows)
+    else: stg.save("students", new_students)
+    print(f"[OK] {len(d)} estudiante(s) conciliado(s) " + ("con logs de ajuste" if rows else "desde el historial"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())